@@ -1,8 +1,9 @@
-from op_brains.chat.utils import process_question
+from op_brains.chat.utils import process_question, process_questions
 from op_brains.config import CHAT_MODEL
 
 import json
 import time
+import asyncio
 import pandas as pd
 
 time_related_dataset = pd.read_csv("datasets/time_related.csv")
@@ -26,7 +27,7 @@ expected = {
 models2test = [CHAT_MODEL]
 
 
-def batch_test():
+async def answer_tests():
     answers = {}
     for m in models2test:
         chat_model = (
@@ -42,14 +43,17 @@ def batch_test():
         answers[m] = {}
         for test_type, test_queries in tests.items():
             answers[m][test_type] = {}
-            for query in test_queries:
-                start = time.time()
-                out = process_question(query, [], verbose=True)
-                print("----------")
-                end = time.time()
-                out["time_taken"] = end - start
+            outs = await process_questions(test_queries, verbose=True)
+            for query, out in zip(test_queries, outs):
+                out["time_taken"] = out.pop("latency")
                 answers[m][test_type][query] = out
+    return answers
+
 
+def batch_test():
+    # one event loop for every dataset, so the clients, caches and database
+    # connections opened while answering the first one are reused
+    answers = asyncio.run(answer_tests())
     json.dump(answers, open("test_results/answers.json", "w"), indent=4)
     json2csv(answers)
 
@@ -0,0 +1,103 @@
+"""
+Recall@k versus latency of the managed-index types against the flat index.
+
+The embeddings are synthetic: unit vectors drawn around random centers, so
+neighbors are clustered like the generated questions of a thread. Queries are
+perturbed copies of indexed vectors, and one query is searched at a time on a
+single thread, as `find_similar` does.
+
+Usage:
+    python bench_ann_indexes.py --n 200000 --dim 1536 --queries 500 --k 5
+"""
+
+import time
+import argparse
+
+import faiss
+import numpy as np
+
+from op_brains.retriever.ann import build_ann_index, configure_search
+
+CONFIGS = [
+    ("hnsw", {"ef_search": 32}),
+    ("hnsw", {"ef_search": 64}),
+    ("hnsw", {"ef_search": 128}),
+    ("ivf_flat", {"nprobe": 8}),
+    ("ivf_flat", {"nprobe": 32}),
+    ("ivf_pq", {"nprobe": 16}),
+    ("ivf_pq", {"nprobe": 64}),
+]
+
+
+def normalize(x: np.ndarray) -> np.ndarray:
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def synthetic_embeddings(n: int, dim: int, n_queries: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    centers = normalize(rng.standard_normal((max(1, n // 50), dim)))
+    assignments = rng.integers(0, len(centers), n)
+    embeds = normalize(
+        centers[assignments] + 0.3 * rng.standard_normal((n, dim)) / np.sqrt(dim)
+    )
+    picked = rng.choice(n, n_queries, replace=False)
+    queries = normalize(
+        embeds[picked] + 0.2 * rng.standard_normal((n_queries, dim)) / np.sqrt(dim)
+    )
+    return embeds.astype(np.float32), queries.astype(np.float32)
+
+
+def search_each(index, queries: np.ndarray, k: int):
+    indices = np.empty((len(queries), k), dtype=np.int64)
+    start = time.perf_counter()
+    for i, query in enumerate(queries):
+        _, indices[i] = index.search(query[None], k)
+    return indices, (time.perf_counter() - start) / len(queries)
+
+
+def recall(found: np.ndarray, expected: np.ndarray) -> float:
+    hits = sum(len(set(f) & set(e)) for f, e in zip(found, expected))
+    return hits / expected.size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    faiss.omp_set_num_threads(1)
+    embeds, queries = synthetic_embeddings(args.n, args.dim, args.queries)
+
+    flat = build_ann_index(embeds, "flat")
+    expected, flat_latency = search_each(flat, queries, args.k)
+    print(f"{'index':<24}{'build s':>9}{'MB':>9}{'ms/query':>10}{'recall@k':>10}")
+    print(
+        f"{'flat':<24}{0:>9.1f}{embeds.nbytes / 2**20:>9.0f}"
+        f"{flat_latency * 1e3:>10.3f}{1:>10.3f}"
+    )
+
+    built = {}
+    for index_type, search_params in CONFIGS:
+        if index_type not in built:
+            start = time.perf_counter()
+            built[index_type] = (
+                build_ann_index(embeds, index_type),
+                time.perf_counter() - start,
+            )
+        index, build_time = built[index_type]
+        configure_search(index, **search_params)
+        size = len(faiss.serialize_index(index)) / 2**20
+
+        found, latency = search_each(index, queries, args.k)
+        name = f"{index_type} {search_params}"
+        print(
+            f"{name:<24}{build_time:>9.1f}{size:>9.0f}"
+            f"{latency * 1e3:>10.3f}{recall(found, expected):>10.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
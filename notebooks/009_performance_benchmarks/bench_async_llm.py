@@ -0,0 +1,110 @@
+"""
+Concurrency benchmark for the LLM steps of RAGSystem.predict.
+
+The LLM calls are replaced by fakes with a fixed latency, so the numbers only
+reflect how many questions a single event loop can keep in flight:
+
+- "blocking": the preprocessor/responder sleep synchronously, like the old
+  `llm.invoke(...)` path did inside the event loop.
+- "async": the preprocessor/responder await, like `Prompt.apreprocessor` and
+  `Prompt.aresponder` do with `ainvoke`.
+
+Usage:
+    python bench_async_llm.py --requests 50 --latency 0.5
+"""
+
+import os
+import time
+import asyncio
+import argparse
+
+import pandas as pd
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+from op_brains.chat.system_structure import RAGSystem
+
+PREPROCESSED = {
+    "needs_info": True,
+    "answer": None,
+    "expansion": {
+        "user_knowledge": "",
+        "type_search": "factual",
+        "keywords": ["retro funding"],
+        "questions": ["What is retro funding?"],
+    },
+}
+
+RESPONDED = {
+    "knowledge_summary": [],
+    "answer": {"answer": "An answer.", "url_supporting": []},
+}
+
+
+def build_system(latency: float, blocking: bool) -> RAGSystem:
+    if blocking:
+
+        async def preprocessor(llm, **kwargs):
+            time.sleep(latency)
+            return PREPROCESSED
+
+        async def responder(llm, final=False, **kwargs):
+            time.sleep(latency)
+            return RESPONDED
+
+    else:
+
+        async def preprocessor(llm, **kwargs):
+            await asyncio.sleep(latency)
+            return PREPROCESSED
+
+        async def responder(llm, final=False, **kwargs):
+            await asyncio.sleep(latency)
+            return RESPONDED
+
+    async def retriever(query, reasoning_level, **kwargs):
+        return []
+
+    async def context_filter(*args, **kwargs):
+        return "", []
+
+    model = ("gpt-4o-mini", {})
+    return RAGSystem(
+        models_to_use=[model, model],
+        retriever=retriever,
+        context_filter=context_filter,
+        system_prompt_preprocessor=preprocessor,
+        system_prompt_responder=responder,
+    )
+
+
+async def run(n_requests: int, latency: float, blocking: bool) -> float:
+    rag = build_system(latency, blocking)
+    contexts_df = pd.DataFrame()
+
+    start = time.perf_counter()
+    await asyncio.gather(
+        *[
+            rag.predict(f"question {i}", contexts_df, memory=[])
+            for i in range(n_requests)
+        ]
+    )
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.5)
+    args = parser.parse_args()
+
+    for mode, blocking in [("blocking", True), ("async", False)]:
+        elapsed = asyncio.run(run(args.requests, args.latency, blocking))
+        print(
+            f"{mode:>8}: {args.requests} requests in {elapsed:.2f}s "
+            f"({args.requests / elapsed:.1f} req/s)"
+        )
+
+
+if __name__ == "__main__":
+    main()
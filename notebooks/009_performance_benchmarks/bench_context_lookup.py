@@ -0,0 +1,71 @@
+"""
+Per-query cost of resolving retrieved urls to contexts in `find_similar`.
+
+Compares the previous dataframe scans (an `isin` filter, then one equality
+filter per url) with the `ContextLookup` hash index built once per dataframe.
+The dataframe is synthetic, with the columns of `DataExporter.get_dataframe`.
+
+Usage:
+    python bench_context_lookup.py --rows 20000 --urls 30 --queries 200
+"""
+
+import time
+import random
+import argparse
+
+import pandas as pd
+
+from op_brains.documents import ContextLookup
+
+TYPES = ["forum_thread", "forum_thread_summary"]
+
+
+def build_dataframe(n_rows: int) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "url": [f"https://gov.optimism.io/t/{i // 2}" for i in range(n_rows)],
+            "last_date": range(n_rows),
+            "content": [f"context {i}" for i in range(n_rows)],
+            "type_db_info": [TYPES[i % 2] for i in range(n_rows)],
+        }
+    )
+
+
+def dataframe_scan(contexts_df, urls, type_db_info):
+    contexts = contexts_df[contexts_df["type_db_info"].isin(type_db_info)]
+    contexts = contexts[contexts["url"].isin(urls)]
+    return [contexts[contexts["url"] == u].content.tolist()[0] for u in urls]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--urls", type=int, default=30)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    contexts_df = build_dataframe(args.rows)
+    all_urls = contexts_df["url"].unique().tolist()
+    queries = [random.sample(all_urls, args.urls) for _ in range(args.queries)]
+    type_db_info = ["forum_thread_summary"]
+
+    start = time.perf_counter()
+    expected = [dataframe_scan(contexts_df, urls, type_db_info) for urls in queries]
+    scan = (time.perf_counter() - start) / args.queries
+
+    start = time.perf_counter()
+    lookup = ContextLookup(contexts_df)
+    build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    found = [lookup.get(urls, type_db_info) for urls in queries]
+    hashed = (time.perf_counter() - start) / args.queries
+
+    assert found == expected
+    print(f"dataframe scan: {scan * 1e3:.3f} ms/query")
+    print(f"url lookup:     {hashed * 1e3:.3f} ms/query (built once in {build:.3f}s)")
+    print(f"speedup:        {scan / hashed:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Memory held by one API worker for the forum summary contexts, before and
+after slimming them.
+
+- "documents": as before, every summary `Document` carries its rendered
+  thread in `metadata["whole_thread"]`, once in the contexts dataframe and
+  once in the FAISS docstore (deserialized separately).
+- "records": the dataframe holds `ContextRecord`s with only the metadata
+  needed to retrieve and format contexts, and the docstore documents come
+  without the whole thread, which is loaded on demand.
+
+Each variant runs in a fresh subprocess, which reports the RSS it gained by
+building the contexts. Sizes are synthetic but match the forum: a few KB of
+summary and a few tens of KB of thread per topic.
+
+Usage:
+    python bench_context_records.py --topics 3000 --thread-kb 30
+"""
+
+import sys
+import json
+import pickle
+import argparse
+import subprocess
+
+import pandas as pd
+
+VARIANTS = ["documents", "records"]
+
+
+def memory_mb(field: str) -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(f"{field}:"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+def build(variant: str, n_topics: int, thread_kb: int):
+    from langchain_core.documents import Document
+    from op_brains.documents.records import ContextRecord, drop_lazy_metadata
+
+    baseline = memory_mb("VmRSS")
+
+    documents = []
+    for i in range(n_topics):
+        url = f"https://gov.optimism.io/t/topic-{i}/{10000 + i}"
+        metadata = {
+            "thread_id": 10000 + i,
+            "thread_title": f"Season {i % 7} proposal {i}",
+            "created_at": "2024-01-01T00:00:00.000Z",
+            "last_posted_at": "2024-06-01T00:00:00.000Z",
+            "tags": ["grants", "season-6"],
+            "pinned": False,
+            "visible": True,
+            "closed": False,
+            "archived": False,
+            "category_name": "Grants Council",
+            "url": url,
+            "num_posts": 25,
+            "users": [f"user{j}" for j in range(12)],
+            "length_str_thread": thread_kb * 1024,
+            "type_db_info": "forum_thread_summary",
+            "classification": "",
+        }
+        if variant == "documents":
+            metadata["whole_thread"] = f"post {i} " * (thread_kb * 128)
+        summary = f"<tldr>summary of topic {i}</tldr> " * 80
+        documents.append(Document(page_content=summary, metadata=metadata, id=url))
+
+    # the FAISS docstore is deserialized from its own copy; `read_faiss_artifact`
+    # now drops the whole thread
+    slim = drop_lazy_metadata if variant == "records" else dict
+    docstore = pickle.loads(
+        pickle.dumps([(d.id, d.page_content, slim(d.metadata)) for d in documents])
+    )
+    docstore = {
+        id: Document(page_content=c, metadata=m, id=id) for id, c, m in docstore
+    }
+
+    if variant == "records":
+        documents = [ContextRecord.from_document(d) for d in documents]
+    contexts_df = pd.DataFrame(
+        {
+            "url": [d.metadata["url"] for d in documents],
+            "last_date": [d.metadata["last_posted_at"] for d in documents],
+            "content": documents,
+            "type_db_info": "forum_thread_summary",
+        }
+    )
+
+    print(
+        json.dumps(
+            {
+                "rss_mb": memory_mb("VmRSS") - baseline,
+                "contexts": len(contexts_df),
+                "docstore": len(docstore),
+            }
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--topics", type=int, default=3_000)
+    parser.add_argument("--thread-kb", type=int, default=30)
+    parser.add_argument("--variant", choices=VARIANTS, default=None)
+    args = parser.parse_args()
+
+    if args.variant is not None:
+        build(args.variant, args.topics, args.thread_kb)
+        return
+
+    print(f"{'variant':<11}{'RSS MB':>8}")
+    for variant in VARIANTS:
+        out = subprocess.run(
+            [sys.executable, __file__, "--variant", variant]
+            + ["--topics", str(args.topics), "--thread-kb", str(args.thread_kb)],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        print(f"{variant:<11}{result['rss_mb']:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Cold-start time and peak RSS of loading the FAISS stores, by artifact format.
+
+- "legacy": the former zlib'd JSON of latin-1 serialized stores, decoded with
+  `IncrementalIndexerService.deserialize_legacy_faiss_indexes`.
+- "binary": native faiss index files plus compact docstores, opened with
+  `read_faiss_artifact(..., mmap=False)`.
+- "binary-mmap": the same files memory-mapped read-only, as the API does.
+
+Synthetic stores are written to a temporary directory once. Each load then
+runs in a fresh subprocess, which reports its load time, its peak RSS, and
+its RSS and private (anonymous) RSS after a search. Memory-mapped pages are
+page cache shared between processes, so they do not count as private.
+
+Usage:
+    python bench_faiss_artifact.py --docs 20000 --dim 1536 --shards 4
+"""
+
+import os
+import sys
+import json
+import time
+import zlib
+import argparse
+import tempfile
+import subprocess
+
+import numpy as np
+
+FORMATS = ["legacy", "binary", "binary-mmap"]
+
+
+def memory_mb(field: str) -> float:
+    """Reads VmHWM (peak RSS), VmRSS or RssAnon (private RSS) of this process."""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(f"{field}:"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+def reset_peak_rss():
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+
+
+def write_stores(directory: str, n_docs: int, dim: int, n_shards: int):
+    from langchain_community.embeddings import FakeEmbeddings
+    from langchain_community.vectorstores import FAISS
+    from op_brains.retriever.faiss_artifact import write_faiss_artifact
+
+    rng = np.random.default_rng(0)
+    embeddings = FakeEmbeddings(size=dim)
+    stores = {}
+    for shard in range(n_shards):
+        n = n_docs // n_shards
+        texts = [f"context {shard}-{i} " + "lorem ipsum " * 150 for i in range(n)]
+        vectors = rng.standard_normal((n, dim)).astype(np.float32)
+        metadatas = [{"url": f"https://example.com/{shard}/{i}"} for i in range(n)]
+        stores[f"shard_{shard}"] = FAISS.from_embeddings(
+            zip(texts, vectors.tolist()),
+            embeddings,
+            metadatas=metadatas,
+            ids=[m["url"] for m in metadatas],
+        )
+
+    folder_content = {
+        name: store.serialize_to_bytes().decode("latin-1")
+        for name, store in stores.items()
+    }
+    with open(os.path.join(directory, "legacy.zlib"), "wb") as f:
+        f.write(zlib.compress(json.dumps(folder_content).encode("utf-8")))
+
+    write_faiss_artifact(stores, os.path.join(directory, "binary"))
+
+
+def merge_faiss_stores(stores):
+    """
+    Merges stores into one searchable store without copying their vectors:
+    the indexes are wrapped as the shards of a `faiss.IndexShards`, which
+    keeps memory-mapped indexes shared.
+    """
+    import faiss
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+
+    if len(stores) == 1:
+        return stores[0]
+
+    shards = faiss.IndexShards(stores[0].index.d, False, True)
+    docstore, index_to_docstore_id, offset = {}, {}, 0
+    for store in stores:
+        shards.add_shard(store.index)
+        for i in range(store.index.ntotal):
+            id = store.index_to_docstore_id[i]
+            index_to_docstore_id[offset + i] = id
+            docstore[id] = store.docstore.search(id)
+        offset += store.index.ntotal
+
+    return FAISS(
+        stores[0].embedding_function,
+        shards,
+        InMemoryDocstore(docstore),
+        index_to_docstore_id,
+    )
+
+
+def load(directory: str, fmt: str, dim: int):
+    from langchain_community.embeddings import FakeEmbeddings
+    from op_brains.retriever.faiss_artifact import read_faiss_artifact
+    from op_data.sources.incremental_indexer import IncrementalIndexerService
+
+    embeddings = FakeEmbeddings(size=dim)
+    reset_peak_rss()
+    baseline, baseline_anon = memory_mb("VmRSS"), memory_mb("RssAnon")
+
+    start = time.perf_counter()
+    if fmt == "legacy":
+        with open(os.path.join(directory, "legacy.zlib"), "rb") as f:
+            stores = IncrementalIndexerService.deserialize_legacy_faiss_indexes(
+                f.read(), embeddings
+            )
+    else:
+        stores = read_faiss_artifact(
+            os.path.join(directory, "binary"), embeddings, mmap=fmt == "binary-mmap"
+        )
+    db = merge_faiss_stores(list(stores.values()))
+    elapsed = time.perf_counter() - start
+
+    peak = memory_mb("VmHWM")
+    db.similarity_search_by_vector(np.ones(dim).tolist(), k=5)
+    print(
+        json.dumps(
+            {
+                "seconds": elapsed,
+                "peak_mb": peak - baseline,
+                "rss_mb": memory_mb("VmRSS") - baseline,
+                "private_mb": memory_mb("RssAnon") - baseline_anon,
+            }
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=20_000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--shards", type=int, default=4)
+    parser.add_argument("--load", choices=FORMATS, default=None)
+    parser.add_argument("--dir", default=None)
+    args = parser.parse_args()
+
+    if args.load is not None:
+        load(args.dir, args.load, args.dim)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        write_stores(directory, args.docs, args.dim, args.shards)
+        legacy_size = os.path.getsize(os.path.join(directory, "legacy.zlib"))
+        binary_size = sum(
+            os.path.getsize(os.path.join(directory, "binary", f))
+            for f in os.listdir(os.path.join(directory, "binary"))
+        )
+        print(
+            f"stored: legacy {legacy_size / 2**20:.0f} MB, binary {binary_size / 2**20:.0f} MB"
+        )
+
+        print(
+            f"{'format':<13}{'load s':>8}{'peak MB':>9}{'RSS MB':>8}{'private MB':>12}"
+        )
+        for fmt in FORMATS:
+            out = subprocess.run(
+                [sys.executable, __file__, "--load", fmt, "--dir", directory]
+                + ["--dim", str(args.dim)],
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            result = json.loads(out.stdout.strip().splitlines()[-1])
+            print(
+                f"{fmt:<13}{result['seconds']:>8.2f}{result['peak_mb']:>9.0f}"
+                f"{result['rss_mb']:>8.0f}{result['private_mb']:>12.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
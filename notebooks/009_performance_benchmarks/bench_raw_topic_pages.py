@@ -0,0 +1,185 @@
+"""
+Peak memory of one pass over the forum threads, reading the raw topics all
+at once or in keyset-paginated pages.
+
+- "all": as `retrieve` did, every `rawData` in one query, then every thread
+  rendered into a list.
+- "paged": as `ForumPostsProcessingStrategy.iter_threads`, `--page-size` raw
+  topics per query (`WHERE id > last_id ORDER BY id LIMIT n`), each page
+  reduced to the rendered fields and its threads yielded one by one.
+
+The consumer keeps only each thread's metadata, as the summary join and the
+summarizer's url listing do. The raw topics of the `data/002-governance-forum-*`
+dump, repeated `--copies` times, are stored in a sqlite file standing in for
+the `RawTopic` table. Each variant runs in a fresh subprocess, which reports
+its peak RSS (VmHWM) over the baseline.
+
+Usage:
+    python bench_raw_topic_pages.py --copies 20 --page-size 100
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+from bench_thread_assembly import DATA_DIR, load_corpus
+
+VARIANTS = ["all", "paged"]
+
+
+def memory_mb(field: str) -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(f"{field}:"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+def write_db(path: str, data_dir: Path, copies: int):
+    boards, threads, posts_by_topic = load_corpus(data_dir)
+    offset = max(threads) + 1
+    post_offset = max(p["id"] for ps in posts_by_topic.values() for p in ps) + 1
+    db = sqlite3.connect(path)
+    db.execute(
+        'CREATE TABLE "RawTopic" (id INTEGER PRIMARY KEY, "externalId" TEXT, '
+        'url TEXT, "rawData" TEXT)'
+    )
+    id = 0
+    for copy in range(copies):
+        for topic_id, thread in threads.items():
+            raw = {k: v for k, v in thread.items() if k != "url"}
+            raw["post_stream"] = {
+                "posts": [
+                    {**post, "id": post["id"] + copy * post_offset}
+                    for post in posts_by_topic.get(topic_id, [])
+                ]
+            }
+            id += 1
+            db.execute(
+                'INSERT INTO "RawTopic" VALUES (?, ?, ?, ?)',
+                (
+                    id,
+                    str(topic_id + copy * offset),
+                    f"{thread['url']}-{copy}",
+                    json.dumps(raw),
+                ),
+            )
+    db.commit()
+    db.close()
+    return boards
+
+
+def rows(cursor):
+    return [
+        {"id": id, "externalId": external_id, "url": url, "rawData": json.loads(raw)}
+        for id, external_id, url, raw in cursor
+    ]
+
+
+def iter_all(db, category_names):
+    from op_brains.documents.optimism import ForumPostsProcessingStrategy as Forum
+
+    lines = rows(db.execute('SELECT id, "externalId", url, "rawData" FROM "RawTopic"'))
+    posts, threads = {}, {}
+    for line in lines:
+        id = int(line["externalId"])
+        for post in line["rawData"]["post_stream"]["posts"]:
+            posts[post["id"]] = post
+            posts[post["id"]]["url"] = f"{line['url']}/{post['id']}"
+            posts[post["id"]]["thread_id"] = id
+        threads[id] = line["rawData"]
+        threads[id]["url"] = line["url"]
+    return iter(Forum.render_threads(posts, threads, category_names))
+
+
+def iter_paged(db, category_names, page_size: int):
+    from op_brains.documents.optimism import ForumPostsProcessingStrategy as Forum
+
+    last_id = 0
+    while True:
+        lines = rows(
+            db.execute(
+                'SELECT id, "externalId", url, "rawData" FROM "RawTopic" '
+                "WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, page_size),
+            )
+        )
+        if not lines:
+            return
+        last_id = lines[-1]["id"]
+        posts, threads = Forum.parse_raw_topics(lines)
+        yield from Forum.render_threads(posts, threads, category_names)
+        if len(lines) < page_size:
+            return
+
+
+def run(variant: str, path: str, category_names: dict, page_size: int):
+    import op_brains.documents.optimism  # noqa: F401
+
+    baseline = memory_mb("VmRSS")
+    db = sqlite3.connect(path)
+    start = time.perf_counter()
+    threads = (
+        iter_all(db, category_names)
+        if variant == "all"
+        else iter_paged(db, category_names, page_size)
+    )
+    metadata = [thread[1] for thread in threads]
+    elapsed = time.perf_counter() - start
+    print(
+        json.dumps(
+            {
+                "peak_mb": memory_mb("VmHWM") - baseline,
+                "threads": len(metadata),
+                "seconds": elapsed,
+            }
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data-dir", type=Path, default=DATA_DIR)
+    parser.add_argument("--copies", type=int, default=20)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--variant", choices=VARIANTS, default=None)
+    parser.add_argument("--db", default=None)
+    parser.add_argument("--categories", default=None)
+    args = parser.parse_args()
+
+    if args.variant is not None:
+        category_names = {int(k): v for k, v in json.loads(args.categories).items()}
+        run(args.variant, args.db, category_names, args.page_size)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "raw_topics.sqlite")
+        boards = write_db(path, args.data_dir, args.copies)
+        size = os.path.getsize(path) / 2**20
+        print(f"raw topics: {size:.0f} MB, page size {args.page_size}")
+
+        print(f"{'variant':<9}{'threads':>8}{'peak MB':>9}{'seconds':>9}")
+        for variant in VARIANTS:
+            out = subprocess.run(
+                [sys.executable, __file__, "--variant", variant, "--db", path]
+                + ["--page-size", str(args.page_size)]
+                + ["--categories", json.dumps(boards)],
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            result = json.loads(out.stdout.strip().splitlines()[-1])
+            print(
+                f"{variant:<9}{result['threads']:>8}{result['peak_mb']:>9.0f}"
+                f"{result['seconds']:>9.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
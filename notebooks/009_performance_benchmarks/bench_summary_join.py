@@ -0,0 +1,66 @@
+"""
+Cost of joining the forum summaries with their threads in
+`SummaryProcessingStrategy.retrieve`, as the number of threads grows.
+
+- "scan": the previous `next(t for t in threads if t[1]["url"] == url)` per
+  summary, O(summaries x threads).
+- "map": the url-keyed map built once, O(summaries + threads).
+
+Threads are synthetic (url, metadata) pairs as returned by
+`ForumPostsProcessingStrategy.return_threads`, with one summary per thread.
+
+Usage:
+    python bench_summary_join.py --sizes 1000 2500 5000 10000
+"""
+
+import time
+import argparse
+
+
+def synthetic(n: int):
+    threads = [
+        ("", {"url": f"https://gov.optimism.io/t/topic-{i}/{i}"}) for i in range(n)
+    ]
+    summaries = [{"url": t[1]["url"]} for t in reversed(threads)]
+    return threads, summaries
+
+
+def scan_join(threads, summaries):
+    return [
+        next((t for t in threads if t[1]["url"] == entry["url"]), None)
+        for entry in summaries
+    ]
+
+
+def map_join(threads, summaries):
+    threads_by_url = {}
+    for thread in threads:
+        threads_by_url.setdefault(thread[1]["url"], thread)
+    return [threads_by_url.get(entry["url"]) for entry in summaries]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[1_000, 2_500, 5_000, 10_000]
+    )
+    args = parser.parse_args()
+
+    print(f"{'threads':>8}{'scan s':>10}{'map ms':>9}{'map us/thread':>15}")
+    for n in args.sizes:
+        threads, summaries = synthetic(n)
+
+        start = time.perf_counter()
+        expected = scan_join(threads, summaries)
+        scan = time.perf_counter() - start
+
+        start = time.perf_counter()
+        joined = map_join(threads, summaries)
+        mapped = time.perf_counter() - start
+
+        assert joined == expected
+        print(f"{n:>8}{scan:>10.2f}{mapped * 1e3:>9.2f}{mapped / n * 1e6:>15.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Time to render the forum threads in `ForumPostsProcessingStrategy.return_threads`,
+on the governance forum dump in `data/002-governance-forum-*`.
+
+- "dataframe": the previous assembly, a boolean mask and `sort_values` over a
+  posts dataframe per thread, then `iterrows()` with string concatenation.
+- "grouped": `render_threads`, posts grouped by thread in one pass and each
+  thread joined from its rendered parts.
+
+Posts and threads are loaded into the shapes returned by
+`ForumPostsProcessingStrategy.retrieve`. The corpus can be repeated with
+`--copies` (as distinct threads) to approach the size of the live forum.
+
+Usage:
+    python bench_thread_assembly.py --copies 1 5 20
+"""
+
+import glob
+import json
+import time
+import argparse
+from pathlib import Path
+
+import pandas as pd
+
+from op_brains.documents.optimism import ForumPostsProcessingStrategy
+
+DATA_DIR = (
+    Path(__file__).resolve().parents[2]
+    / "data"
+    / "002-governance-forum-202406014"
+    / "dataset"
+)
+
+
+def load_corpus(data_dir: Path):
+    boards, threads, posts_by_topic = {}, {}, {}
+    for path in sorted(glob.glob(str(data_dir / "*.jsonl"))):
+        with open(path) as f:
+            for line in f:
+                entry = json.loads(line)
+                item = entry["item"]
+                data = item["data"]
+                if entry["type"] == "board" and "id" in data:
+                    boards[int(data["id"])] = data["name"]
+                elif entry["type"] == "thread":
+                    threads[int(data["id"])] = {**data, "url": item["url"]}
+                elif entry["type"] == "post":
+                    posts_by_topic.setdefault(int(data["topic_id"]), []).append(data)
+    return boards, threads, posts_by_topic
+
+
+def retrieve_shapes(threads, posts_by_topic, copies: int):
+    """The `posts` and `threads_info` dicts of `retrieve`, with each thread
+    repeated `copies` times under new ids."""
+    offset = max(threads) + 1
+    post_offset = max(p["id"] for ps in posts_by_topic.values() for p in ps) + 1
+    posts, threads_info = {}, {}
+    for copy in range(copies):
+        for topic_id, thread in threads.items():
+            if topic_id not in posts_by_topic:
+                continue
+            id = topic_id + copy * offset
+            url = f"{thread['url']}-{copy}" if copy else thread["url"]
+            threads_info[id] = {**thread, "url": url}
+            for post in posts_by_topic[topic_id]:
+                post_id = post["id"] + copy * post_offset
+                posts[post_id] = {
+                    **post,
+                    "url": f"{url}/{post_id}",
+                    "thread_id": id,
+                    "thread_title": thread["title"],
+                    "category_id": thread["category_id"],
+                }
+    return posts, threads_info
+
+
+def dataframe_threads(posts, threads_info, category_names):
+    df_posts = pd.DataFrame(posts).T
+    threads = []
+    for t in df_posts["thread_id"].unique():
+        posts_thread = df_posts[df_posts["thread_id"] == t].sort_values(by="created_at")
+        url = posts_thread["url"].iloc[0]
+        url = url.split("/")[:-1]
+        url = "/".join(url)
+        t_i = threads_info[int(t)]
+        category_name = category_names[t_i["category_id"]]
+
+        str_thread = ForumPostsProcessingStrategy.template_thread.format(
+            CATEGORY_NAME=category_name,
+            THREAD_TITLE=t_i["title"],
+            TAGS=t_i["tags"],
+            CREATED_AT=t_i["created_at"],
+            LAST_POSTED_AT=t_i["last_posted_at"],
+            PINNED=t_i["pinned"],
+            VISIBLE=t_i["visible"],
+            CLOSED=t_i["closed"],
+            ARCHIVED=t_i["archived"],
+        )
+
+        for i, post in posts_thread.iterrows():
+            str_thread += ForumPostsProcessingStrategy.template_post.format(
+                POST_NUMBER=post["post_number"],
+                USERNAME=post["username"],
+                CREATED_AT=post["created_at"],
+                TRUST_LEVEL=post["trust_level"],
+                IS_REPLY=f"(reply to post #{post['reply_to_post_number']})\n"
+                if post["reply_to_post_number"] is not None
+                else "",
+                CONTENT=post["cooked"]
+                .replace("<\\content_user_input>", "")
+                .replace("<content_user_input>", ""),
+                MODERATOR=post["moderator"],
+                ADMIN=post["admin"],
+                STAFF=post["staff"],
+            )
+
+        metadata = {
+            "thread_id": t,
+            "thread_title": t_i["title"],
+            "created_at": t_i["created_at"],
+            "last_posted_at": t_i["last_posted_at"],
+            "tags": t_i["tags"],
+            "pinned": t_i["pinned"],
+            "visible": t_i["visible"],
+            "closed": t_i["closed"],
+            "archived": t_i["archived"],
+            "category_name": category_name,
+            "url": url,
+            "num_posts": len(posts_thread),
+            "users": list(posts_thread["username"].unique()),
+            "length_str_thread": len(str_thread),
+            "type_db_info": "forum_thread",
+        }
+        threads.append([str_thread, metadata])
+    return threads
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data-dir", type=Path, default=DATA_DIR)
+    parser.add_argument("--copies", type=int, nargs="+", default=[1, 5, 20])
+    args = parser.parse_args()
+
+    boards, threads, posts_by_topic = load_corpus(args.data_dir)
+
+    print(
+        f"{'threads':>8}{'posts':>8}{'dataframe ms':>14}{'grouped ms':>12}{'speedup':>9}"
+    )
+    for copies in args.copies:
+        posts, threads_info = retrieve_shapes(threads, posts_by_topic, copies)
+
+        start = time.perf_counter()
+        expected = dataframe_threads(posts, threads_info, boards)
+        before = time.perf_counter() - start
+
+        start = time.perf_counter()
+        rendered = ForumPostsProcessingStrategy.render_threads(
+            posts, threads_info, boards
+        )
+        after = time.perf_counter() - start
+
+        assert rendered == expected
+        print(
+            f"{len(threads_info):>8}{len(posts):>8}{before * 1e3:>14.0f}"
+            f"{after * 1e3:>12.1f}{before / after:>9.0f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
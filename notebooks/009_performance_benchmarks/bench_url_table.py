@@ -0,0 +1,103 @@
+"""
+Load time, memory and lookup time of a managed index's key -> urls mapping,
+stored as a `{key: [url, ...]}` JSON ("dict") or as a `ManagedIndexTable`
+("table": keys and distinct urls in JSON, CSR arrays in the npz).
+
+Memory is the Python heap held by the loaded object (tracemalloc). The
+lookup resolves the urls of `--k` random rows, as `find_similar` does.
+
+Usage:
+    python bench_url_table.py --keys 60000 --urls 8000 --per-key 12
+"""
+
+import io
+import json
+import time
+import argparse
+import tracemalloc
+
+import numpy as np
+
+from op_brains.retriever.managed_index import ManagedIndexTable
+
+
+def synthetic_index(n_keys: int, n_urls: int, per_key: int) -> dict:
+    rng = np.random.default_rng(0)
+    urls = [
+        f"https://gov.optimism.io/t/season-{i % 7}-grants-council-proposal-{i}/{7000 + i}"
+        for i in range(n_urls)
+    ]
+    counts = rng.integers(1, 2 * per_key, n_keys)
+    return {
+        f"What is the status of proposal {i} in season {i % 7}?": [
+            urls[j] for j in rng.choice(n_urls, count, replace=False)
+        ]
+        for i, count in enumerate(counts)
+    }
+
+
+def measure(load):
+    tracemalloc.start()
+    start = time.perf_counter()
+    loaded = load()
+    elapsed = time.perf_counter() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return loaded, elapsed, size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--keys", type=int, default=60_000)
+    parser.add_argument("--urls", type=int, default=8_000)
+    parser.add_argument("--per-key", type=int, default=12)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=2_000)
+    args = parser.parse_args()
+
+    index = synthetic_index(args.keys, args.urls, args.per_key)
+    table = ManagedIndexTable.from_dict(index)
+
+    dict_json = json.dumps(index)
+    table_json, arrays = table.to_bytes()
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **arrays)
+    npz = buffer.getvalue()
+
+    rng = np.random.default_rng(1)
+    queries = rng.integers(0, args.keys, (args.queries, args.k)).tolist()
+
+    print(
+        f"{'format':<8}{'stored MB':>11}{'load ms':>9}{'heap MB':>9}{'lookup us':>11}"
+    )
+    for fmt in ("dict", "table"):
+        if fmt == "dict":
+            stored = len(dict_json)
+            loaded, elapsed, size = measure(lambda: json.loads(dict_json))
+            keys = list(loaded)
+
+            def lookup(rows):
+                return [u for r in rows for u in loaded[keys[r]]]
+
+        else:
+            stored = len(table_json) + len(npz)
+            loaded, elapsed, size = measure(
+                lambda: ManagedIndexTable.from_bytes(
+                    table_json, np.load(io.BytesIO(npz))
+                )
+            )
+            lookup = loaded.urls_of
+
+        start = time.perf_counter()
+        for rows in queries:
+            lookup(rows)
+        per_query = (time.perf_counter() - start) / len(queries)
+
+        print(
+            f"{fmt:<8}{stored / 2**20:>11.1f}{elapsed * 1e3:>9.0f}"
+            f"{size / 2**20:>9.1f}{per_query * 1e6:>11.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
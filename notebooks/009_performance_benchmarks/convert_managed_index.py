@@ -0,0 +1,125 @@
+"""
+Converts the latest managed index to a compact storage and reports its cost.
+
+For each storage mode (float32, float16, pq) it reports the size of the
+stored object, the download time (extrapolated from the time to download the
+current object), the memory of the loaded search index and its recall@k
+against exact search over the float32 embeddings. With `--save`, the index is
+re-encoded with the chosen storage and saved as the latest managed index of
+its type, which the API loads on its next index refresh. Indexes whose urls
+are still stored as a `{key: [url, ...]}` JSON are saved as a
+`ManagedIndexTable` (url table + CSR arrays).
+
+Needs the database and R2 credentials used by the app.
+
+Usage:
+    python convert_managed_index.py --index-type questions
+    python convert_managed_index.py --index-type keywords --save float16
+"""
+
+import io
+import time
+import asyncio
+import argparse
+
+import faiss
+import numpy as np
+
+from op_brains.retriever.ann import STORAGE_TYPES, deserialize_index
+from op_brains.retriever.managed_index import ManagedIndexTable
+from op_data.cli import init_db, close_db
+from op_data.db.models import ManagedIndex
+from op_data.sources.incremental_indexer import IncrementalIndexerService
+
+
+def recall_at_k(index, embeds: np.ndarray, queries: np.ndarray, k: int) -> float:
+    exact = faiss.IndexFlatIP(embeds.shape[1])
+    exact.add(embeds)
+    _, expected = exact.search(queries, k)
+    _, found = index.search(queries, k)
+    hits = sum(len(set(f) & set(e)) for f, e in zip(found, expected))
+    return hits / expected.size
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--index-type", default="questions")
+    parser.add_argument("--save", choices=STORAGE_TYPES, default=None)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    await init_db()
+    try:
+        latest = (
+            await ManagedIndex.filter(indexType=args.index_type)
+            .order_by("-createdAt")
+            .first()
+        )
+        if latest is None:
+            print(f"No {args.index_type} managed index found")
+            return
+
+        start = time.perf_counter()
+        data = IncrementalIndexerService.retrieve_object_from_s3(
+            latest.compressedObjectKey
+        )
+        download_rate = len(data) / (time.perf_counter() - start)
+
+        loaded = np.load(io.BytesIO(data))
+        if "index_embed" not in loaded:
+            print("The latest index only stores PQ codes and cannot be converted")
+            return
+        embeds = np.asarray(loaded["index_embed"], dtype=np.float32)
+        json_data = IncrementalIndexerService.retrieve_object_from_s3(
+            latest.jsonObjectKey
+        )
+        table = ManagedIndexTable.from_bytes(json_data, loaded)
+        json_data, url_arrays = table.to_bytes()
+        print(
+            f"{args.index_type}: {embeds.shape[0]} embeddings of {embeds.shape[1]} "
+            f"dims, stored as {loaded['index_embed'].dtype} in {len(data) / 2**20:.1f} MB"
+        )
+
+        rng = np.random.default_rng(0)
+        queries = embeds[rng.choice(len(embeds), min(args.queries, len(embeds)))]
+
+        encoded = {}
+        print(
+            f"{'storage':<10}{'stored MB':>11}{'download s':>12}{'index MB':>10}{'recall@k':>10}"
+        )
+        for storage in STORAGE_TYPES:
+            encoded[storage] = IncrementalIndexerService.encode_managed_index(
+                embeds, storage, url_arrays=url_arrays
+            )
+            index = deserialize_index(
+                np.load(io.BytesIO(encoded[storage]))["faiss_index"]
+            )
+            size = len(encoded[storage])
+            print(
+                f"{storage:<10}{size / 2**20:>11.1f}{size / download_rate:>12.2f}"
+                f"{len(faiss.serialize_index(index)) / 2**20:>10.1f}"
+                f"{recall_at_k(index, embeds, queries, args.k):>10.3f}"
+            )
+
+        if args.save is not None:
+            suffix = f"{args.save}_{int(time.time())}"
+            jsonObjectKey = f"managed_index_reranked_{suffix}.json"
+            compressedObjectKey = f"compressed_managed_index_{suffix}.zlib"
+
+            IncrementalIndexerService.upload_to_s3(key=jsonObjectKey, data=json_data)
+            IncrementalIndexerService.upload_to_s3(
+                key=compressedObjectKey, data=encoded[args.save]
+            )
+            await ManagedIndex.create(
+                jsonObjectKey=jsonObjectKey,
+                compressedObjectKey=compressedObjectKey,
+                indexType=args.index_type,
+            )
+            print(f"Saved the {args.save} {args.index_type} index")
+    finally:
+        await close_db()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
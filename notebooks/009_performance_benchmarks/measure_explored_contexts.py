@@ -0,0 +1,154 @@
+"""
+Prompt-token savings of excluding already-explored contexts.
+
+Runs the questions of the model-improvement test datasets through the RAG
+engine twice: once re-sending every retrieved context at each reasoning level
+(the previous behavior) and once excluding the contexts explored at earlier
+levels. For each run it reports the context tokens sent to the responder,
+overall and per reasoning level.
+
+Needs the indexes and API keys used by the app. With `--offline`, the
+reasoning levels are replayed without them: the contexts are the threads of
+the `data/002-governance-forum-*` dump (cut to `--summary-tokens`, standing in
+for their summaries), retrieved with BM25, and each level after the first
+searches the question plus the titles of the contexts sent at the previous
+level, standing in for the follow-up expansions of the LLM.
+
+Usage:
+    python measure_explored_contexts.py --limit 20
+    python measure_explored_contexts.py --offline --levels 4
+"""
+
+import asyncio
+import argparse
+from functools import partial
+from collections import defaultdict
+
+import pandas as pd
+
+from op_brains.chat.utils import rag_engine
+from op_brains.chat.model_utils import ContextHandling
+from op_brains.chat.tokenizer import count_tokens
+from op_brains.documents import DataExporter
+
+DATASETS = {
+    "time_related": "time_related.csv",
+    "from_fragments": "fragmented_easy.csv",
+}
+
+
+async def run(questions: list, exclude_explored: bool) -> dict:
+    await rag_engine.startup()
+    rag_engine.rag_model.context_filter = partial(
+        ContextHandling.filter, exclude_explored=exclude_explored
+    )
+    contexts_df = await DataExporter.get_dataframe(only_not_embedded=False)
+
+    tokens_per_level = defaultdict(list)
+    for question in questions:
+        result = await rag_engine.predict(question, contexts_df, memory=[])
+        for level, step in result.get("reasoning", {}).items():
+            tokens_per_level[level].append(count_tokens(step["context"]))
+    return tokens_per_level
+
+
+def offline_contexts(summary_tokens: int) -> list:
+    from bench_thread_assembly import DATA_DIR, load_corpus, retrieve_shapes
+    from op_brains.chat.tokenizer import truncate_tokens
+    from op_brains.documents.optimism import ForumPostsProcessingStrategy
+    from op_brains.documents.records import ContextRecord
+
+    boards, threads, posts_by_topic = load_corpus(DATA_DIR)
+    posts, threads_info = retrieve_shapes(threads, posts_by_topic, 1)
+    contexts = []
+    for str_thread, metadata in ForumPostsProcessingStrategy.render_threads(
+        posts, threads_info, boards
+    ):
+        contexts.append(
+            ContextRecord(
+                truncate_tokens(str_thread, summary_tokens),
+                {
+                    **{key: metadata[key] for key in ("url", "created_at")},
+                    "thread_title": metadata["thread_title"],
+                    "last_posted_at": metadata["last_posted_at"],
+                    "type_db_info": "forum_thread_summary",
+                },
+            )
+        )
+    return contexts
+
+
+async def run_offline(
+    questions: list, exclude_explored: bool, contexts: list, levels: int, k: int
+) -> dict:
+    from op_brains.retriever.lexical import BM25Index
+
+    by_url = {c.metadata["url"]: c for c in contexts}
+    index = BM25Index.build(
+        (url, f"{c.metadata['thread_title']}\n{c.page_content}")
+        for url, c in by_url.items()
+    )
+
+    tokens_per_level = defaultdict(list)
+    for question in questions:
+        explored, query = [], question
+        for level in range(levels):
+            found = [by_url[url] for url, _ in index.search(query, k=k)]
+            context, urls = await ContextHandling.filter(
+                {query: found},
+                explored,
+                None,
+                reasoning_level=level,
+                exclude_explored=exclude_explored,
+            )
+            tokens_per_level[level].append(count_tokens(context))
+            explored.extend(urls)
+            titles = [by_url[url].metadata["thread_title"] for url in urls[:3]]
+            query = " ".join([question, *titles])
+    return tokens_per_level
+
+
+def report(name: str, tokens_per_level: dict, n_questions: int):
+    total = sum(sum(t) for t in tokens_per_level.values())
+    print(f"{name}: {total} context tokens ({total / n_questions:.0f}/question)")
+    for level in sorted(tokens_per_level):
+        tokens = tokens_per_level[level]
+        print(
+            f"    level {level}: {len(tokens)} calls, {sum(tokens)} tokens "
+            f"({sum(tokens) / len(tokens):.0f}/call)"
+        )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--datasets-dir", default="../008_model_improvements/datasets")
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--offline", action="store_true")
+    parser.add_argument("--levels", type=int, default=4)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--summary-tokens", type=int, default=500)
+    args = parser.parse_args()
+
+    questions = []
+    for file in DATASETS.values():
+        questions += pd.read_csv(f"{args.datasets_dir}/{file}").question.tolist()
+    questions = questions[: args.limit]
+
+    if args.offline:
+        contexts = offline_contexts(args.summary_tokens)
+        for name, exclude_explored in [("re-sent", False), ("excluded", True)]:
+            tokens_per_level = await run_offline(
+                questions, exclude_explored, contexts, args.levels, args.k
+            )
+            report(name, tokens_per_level, len(questions))
+        return
+
+    try:
+        for name, exclude_explored in [("re-sent", False), ("excluded", True)]:
+            report(name, await run(questions, exclude_explored), len(questions))
+    finally:
+        await rag_engine.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,12 +1,20 @@
-from quart import Quart, request, jsonify
+from quart import Quart, request, jsonify, make_response
 from quart_cors import cors
 from quart_rate_limiter import RateLimiter, rate_limit
 from op_brains.exceptions import UnsupportedVectorstoreError
-from op_brains.config import POSTHOG_API_KEY
-from op_brains.chat.utils import process_question
+from op_brains.config import POSTHOG_API_KEY, BATCH_MAX_QUESTIONS
+from op_brains.chat.utils import (
+    process_question,
+    process_questions,
+    stream_question,
+    rag_engine,
+)
+from op_brains.chat.metrics import registry
+from op_brains.retriever.connect_faiss import reload_faiss_shard
 from posthog import Posthog
 from datetime import timedelta
 from functools import wraps
+import json
 import os
 from op_core.config import Config
 from tortoise.contrib.quart import register_tortoise
@@ -47,6 +55,16 @@ register_tortoise(
 )
 
 
+@app.before_serving
+async def startup_rag_engine():
+    await rag_engine.startup()
+
+
+@app.after_serving
+async def shutdown_rag_engine():
+    await rag_engine.shutdown()
+
+
 def handle_question(func):
     @wraps(func)
     async def wrapper(*args, **kwargs):
@@ -74,7 +92,7 @@ def handle_exception(e):
     return jsonify({"error": "An unexpected error occurred during prediction"}), 500
 
 
-async def capture_predict_event(question, result, user_token):
+async def capture_predict_event(question, result, user_token, endpoint="predict"):
     answer = result["data"].get("answer", "") if result["data"] else ""
     classifications = await classify_question(result)
 
@@ -88,7 +106,7 @@ async def capture_predict_event(question, result, user_token):
         user_token,
         posthog_event,
         {
-            "endpoint": "predict",
+            "endpoint": endpoint,
             "question": question,
             "classifications": classifications,
             "answer": answer,
@@ -102,7 +120,8 @@ async def capture_predict_event(question, result, user_token):
 @handle_question
 async def predict(question, memory):
     user_token = request.headers.get("x-user-id")
-    result = await process_question(question, memory)
+    include_timings = request.args.get("timings", "").lower() == "true"
+    result = await process_question(question, memory, include_timings=include_timings)
 
     # enqueue background task to capture predict event
     app.add_background_task(capture_predict_event, question, result, user_token)
@@ -110,6 +129,99 @@ async def predict(question, memory):
     return jsonify(result)
 
 
+def is_memory(memory) -> bool:
+    """Whether `memory` is a list of {"name": ..., "message": ...} entries."""
+    return isinstance(memory, list) and all(
+        isinstance(entry, dict)
+        and (
+            "message" not in entry
+            or isinstance(entry.get("name"), str)
+            and isinstance(entry["message"], str)
+        )
+        for entry in memory
+    )
+
+
+# at most 100 questions a minute per client, as /predict
+@app.route("/predict/batch", methods=["POST"])
+@rate_limit(max(1, 100 // BATCH_MAX_QUESTIONS), timedelta(minutes=1))
+async def predict_batch():
+    user_token = request.headers.get("x-user-id")
+    data = await request.get_json()
+    items = data.get("questions") if isinstance(data, dict) else None
+
+    if not items or not isinstance(items, list):
+        return jsonify({"error": "No questions provided"}), 400
+    if len(items) > BATCH_MAX_QUESTIONS:
+        return jsonify(
+            {"error": f"At most {BATCH_MAX_QUESTIONS} questions per batch"}
+        ), 400
+
+    # each item is either a question or a {"question": ..., "memory": [...]} dict
+    items = [item if isinstance(item, dict) else {"question": item} for item in items]
+    questions = [item.get("question") for item in items]
+    memories = [item.get("memory", []) for item in items]
+
+    if not all(isinstance(question, str) and question for question in questions):
+        return jsonify({"error": "Every question must be a non-empty string"}), 400
+    if not all(is_memory(memory) for memory in memories):
+        return jsonify(
+            {"error": "Every memory must be a list of name and message entries"}
+        ), 400
+
+    results = await process_questions(questions, memories)
+
+    for question, result in zip(questions, results):
+        app.add_background_task(
+            capture_predict_event, question, result, user_token, "predict/batch"
+        )
+
+    return jsonify({"data": results})
+
+
+def format_sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.route("/predict/stream", methods=["POST"])
+@rate_limit(100, timedelta(minutes=1))
+@handle_question
+async def predict_stream(question, memory):
+    user_token = request.headers.get("x-user-id")
+
+    async def events():
+        async for event, data in stream_question(question, memory):
+            if event == "answer":
+                app.add_background_task(
+                    capture_predict_event,
+                    question,
+                    data,
+                    user_token,
+                    "predict/stream",
+                )
+            yield format_sse(event, data)
+
+    response = await make_response(
+        events(),
+        {
+            "Content-Type": "text/event-stream",
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        },
+    )
+    response.timeout = None
+    return response
+
+
+@app.route("/metrics", methods=["GET"])
+async def metrics():
+    return (
+        registry.render(),
+        200,
+        {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+    )
+
+
 @app.after_request
 def after_request(response):
     posthog.flush()
@@ -129,7 +241,10 @@ async def sync_all():
 @tasks.cron("0 0 1 * *")
 async def sync_indexes():
     indexer = IncrementalIndexerService()
-    await indexer.acquire_and_save()
+    updated_stores = await indexer.acquire_and_save()
+    # swap the new stores into the running retriever, shard by shard
+    for name in updated_stores:
+        await reload_faiss_shard(name)
 
 
 if __name__ == "__main__":
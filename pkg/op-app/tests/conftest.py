@@ -0,0 +1,6 @@
+import os
+
+# the API clients and the R2 config are created at import time
+for name in ("OPENAI_API_KEY", "ANTHROPIC_API_KEY", "VOYAGE_API_KEY"):
+    os.environ.setdefault(name, "test")
+os.environ.setdefault("R2_ENDPOINT_URL", "http://localhost:9000")
@@ -0,0 +1,61 @@
+import pytest
+
+from op_app import api
+
+RESULT = {"data": {"answer": "It started."}, "error": None, "latency": 1.0}
+
+
+@pytest.fixture
+def captured(monkeypatch):
+    events = []
+
+    async def process_questions(questions, memories):
+        return [RESULT for _ in questions]
+
+    async def capture_predict_event(*args):
+        events.append(args)
+
+    monkeypatch.setattr(api, "process_questions", process_questions)
+    monkeypatch.setattr(api, "capture_predict_event", capture_predict_event)
+    # a few batches a minute are allowed, fewer than these tests send
+    monkeypatch.setitem(api.app.config, "QUART_RATE_LIMITER_ENABLED", False)
+    return events
+
+
+async def test_predict_batch_captures_every_question(captured):
+    client = api.app.test_client()
+    questions = [
+        "When?",
+        {"question": "Who?", "memory": [{"name": "user", "message": "Hi"}]},
+    ]
+    response = await client.post(
+        "/predict/batch", json={"questions": questions}, headers={"x-user-id": "u"}
+    )
+
+    assert response.status_code == 200
+    assert (await response.get_json())["data"] == [RESULT, RESULT]
+    assert captured == [
+        ("When?", RESULT, "u", "predict/batch"),
+        ("Who?", RESULT, "u", "predict/batch"),
+    ]
+
+
+@pytest.mark.parametrize(
+    "memory", ["Hi", [["user", "Hi"]], [{"name": "user", "message": 1}]]
+)
+async def test_predict_batch_rejects_invalid_memories(captured, memory):
+    client = api.app.test_client()
+    response = await client.post(
+        "/predict/batch", json={"questions": [{"question": "Who?", "memory": memory}]}
+    )
+
+    assert response.status_code == 400
+    assert captured == []
+
+
+async def test_predict_batch_limits_the_batch_size(captured):
+    client = api.app.test_client()
+    questions = ["When?"] * (api.BATCH_MAX_QUESTIONS + 1)
+    response = await client.post("/predict/batch", json={"questions": questions})
+
+    assert response.status_code == 400
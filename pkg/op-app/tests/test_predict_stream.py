@@ -0,0 +1,109 @@
+import json
+
+import pandas as pd
+from langchain_core.documents import Document
+
+from op_app import api
+from op_brains.chat.system_structure import RAGSystem
+
+ANSWER = "Season 6 started in January."
+
+
+def rag_system() -> RAGSystem:
+    async def preprocessor(llm, **prompt):
+        return {
+            "needs_info": True,
+            "answer": None,
+            "expansion": {
+                "user_knowledge": "",
+                "type_search": "factual",
+                "keywords": [],
+                "questions": ["When did Season 6 start?"],
+            },
+        }
+
+    async def retriever(question, reasoning_level, contexts_df, query_embed=None):
+        return [Document(page_content="Season 6", metadata={"url": "https://gov/t/1"})]
+
+    async def context_filter(context_dict, explored, contexts_df, query, *args, **kw):
+        return "context", ["https://gov/t/1"]
+
+    async def responder_stream(llm, **prompt):
+        # partial arguments of the tool call, then the validated output
+        for end in (7, 17, len(ANSWER)):
+            yield {"answer": {"answer": ANSWER[:end]}}
+        yield {
+            "knowledge_summary": [],
+            "answer": {"answer": ANSWER, "url_supporting": ["https://gov/t/1"]},
+        }
+
+    return RAGSystem(
+        llm=[object(), object()],
+        retriever=retriever,
+        context_filter=context_filter,
+        system_prompt_preprocessor=preprocessor,
+        system_prompt_responder=None,
+        system_prompt_responder_stream=responder_stream,
+    )
+
+
+def parse_sse(body: str) -> list:
+    """Splits a text/event-stream body into (event, data) pairs."""
+    assert body.endswith("\n\n")
+    events = []
+    for frame in body[:-2].split("\n\n"):
+        event, data = frame.split("\n")
+        assert event.startswith("event: ") and data.startswith("data: ")
+        events.append((event[len("event: ") :], json.loads(data[len("data: ") :])))
+    return events
+
+
+async def test_stream_events_are_framed_as_sse():
+    events = [
+        (event, data)
+        async for event, data in rag_system().stream("When?", pd.DataFrame())
+        if event != "result"
+    ]
+    body = "".join(api.format_sse(event, data) for event, data in events)
+
+    assert parse_sse(body) == events
+    assert [event for event, _ in events] == [
+        "preprocessed",
+        "contexts",
+        "token",
+        "token",
+        "token",
+    ]
+    assert "".join(data["text"] for event, data in events if event == "token") == (
+        ANSWER
+    )
+
+
+async def test_predict_stream_endpoint(monkeypatch):
+    async def stream_question(question, memory):
+        async for event, data in rag_system().stream(question, pd.DataFrame()):
+            if event == "result":
+                yield "answer", {"data": data["answer"], "error": None}
+            else:
+                yield event, data
+
+    async def capture_predict_event(*args):
+        pass
+
+    monkeypatch.setattr(api, "stream_question", stream_question)
+    monkeypatch.setattr(api, "capture_predict_event", capture_predict_event)
+
+    client = api.app.test_client()
+    response = await client.post("/predict/stream", json={"question": "When?"})
+
+    assert response.status_code == 200
+    assert response.headers["Content-Type"] == "text/event-stream"
+    events = parse_sse(await response.get_data(as_text=True))
+    assert events[0] == ("preprocessed", {"needs_info": True})
+    assert events[-1] == (
+        "answer",
+        {
+            "data": {"answer": ANSWER, "url_supporting": ["https://gov/t/1"]},
+            "error": None,
+        },
+    )
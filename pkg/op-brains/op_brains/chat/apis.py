@@ -1,3 +1,5 @@
+import inspect
+from typing import Any
 from langchain_openai import OpenAIEmbeddings
 from langchain_openai import ChatOpenAI
 from langchain_anthropic import ChatAnthropic
@@ -26,3 +28,27 @@ class access_APIs:
             return HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
         else:
             return OpenAIEmbeddings(model=model, **kwargs)
+
+    @staticmethod
+    async def aclose(model: Any):
+        """Closes the SDK clients (and their connection pools) behind a model."""
+        closed = set()
+        for attr in (
+            "root_client",
+            "root_async_client",
+            "_client",
+            "_async_client",
+            "client",
+            "async_client",
+        ):
+            client = getattr(model, attr, None)
+            # openai resources (e.g. OpenAIEmbeddings.client) wrap the SDK client
+            if client is not None and not hasattr(client, "close"):
+                client = getattr(client, "_client", None)
+            if client is None or id(client) in closed or not hasattr(client, "close"):
+                continue
+
+            closed.add(id(client))
+            result = client.close()
+            if inspect.isawaitable(result):
+                await result
@@ -0,0 +1,321 @@
+import re
+import json
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Set, Tuple
+
+import numpy as np
+
+from op_brains.config import (
+    ANSWER_CACHE_THRESHOLD,
+    ANSWER_CACHE_TTL,
+    ANSWER_CACHE_MAX_ENTRIES,
+    ANSWER_CACHE_MAX_BYTES,
+    EMBEDDING_CACHE_MAX_ENTRIES,
+    EMBEDDING_CACHE_MAX_BYTES,
+)
+
+
+def hash_memory(memory: List[Tuple[str, str]]) -> int:
+    """Stable 63-bit hash of a (formatted) conversation memory."""
+    digest = hashlib.sha1(json.dumps(memory).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "little") >> 1
+
+
+def hash_key_terms(question: str) -> int:
+    """
+    Stable 63-bit hash of the numbers and capitalized words of a question,
+    leaving out its first word.
+
+    Questions differing only in one of them ("Season 5" and "Season 6",
+    proposal 12 and 13) embed almost identically, so the answer cache only
+    reuses an answer when these terms match as well.
+    """
+    words = re.findall(r"\w+", question)[1:]
+    terms = sorted({w.lower() for w in words if w[0].isdigit() or w[0].isupper()})
+    digest = hashlib.sha1(json.dumps(terms).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "little") >> 1
+
+
+class SemanticAnswerCache:
+    """
+    In-memory cache of answers keyed by question embedding and conversation.
+
+    A lookup hits when a cached entry has the same memory hash, the same key
+    terms (see `hash_key_terms`) and a cosine similarity to the question
+    embedding of at least `threshold`. Entries
+    expire after `ttl` seconds and are evicted in LRU order once either
+    `max_entries` or `max_bytes` (vectors plus serialized answers) is exceeded.
+
+    The cache is tied to a version (e.g. the ids of the latest indexes); calling
+    `ensure_version` with a different one drops every entry.
+    """
+
+    def __init__(
+        self,
+        threshold: float = ANSWER_CACHE_THRESHOLD,
+        ttl: float = ANSWER_CACHE_TTL,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+        max_bytes: int = ANSWER_CACHE_MAX_BYTES,
+    ):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.version: Hashable = None
+        self.hits = 0
+        self.misses = 0
+        self.clear()
+
+    def clear(self):
+        # slot -> (answer, size in bytes, insertion time); the LRU order is the
+        # order of the dict, and vectors/memory hashes live in arrays by slot
+        self._entries: OrderedDict[int, Tuple[Dict[str, Any], int, float]] = (
+            OrderedDict()
+        )
+        self._vectors: np.ndarray | None = None
+        self._memory_hashes = np.zeros(self.max_entries, dtype=np.int64)
+        self._terms_hashes = np.zeros(self.max_entries, dtype=np.int64)
+        self._free_slots = list(range(self.max_entries - 1, -1, -1))
+        self.size_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def ensure_version(self, version: Hashable):
+        if version != self.version:
+            self.clear()
+            self.version = version
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _evict(self, slot: int):
+        _, size, _ = self._entries.pop(slot)
+        self.size_bytes -= size
+        self._free_slots.append(slot)
+
+    def get(
+        self, question_embed: List[float], memory_hash: int, question: str = ""
+    ) -> Dict | None:
+        if not self._entries:
+            self.misses += 1
+            return None
+
+        now = time.time()
+        for slot in [s for s, e in self._entries.items() if now - e[2] > self.ttl]:
+            self._evict(slot)
+
+        slots = np.fromiter(self._entries.keys(), dtype=np.int64)
+        slots = slots[
+            (self._memory_hashes[slots] == memory_hash)
+            & (self._terms_hashes[slots] == hash_key_terms(question))
+        ]
+        if len(slots) == 0:
+            self.misses += 1
+            return None
+
+        scores = self._vectors[slots] @ self._normalize(question_embed)
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            self.misses += 1
+            return None
+
+        slot = int(slots[best])
+        self._entries.move_to_end(slot)
+        self.hits += 1
+        return self._entries[slot][0]
+
+    def put(
+        self,
+        question_embed: List[float],
+        memory_hash: int,
+        answer: Dict,
+        question: str = "",
+    ):
+        vector = self._normalize(question_embed)
+        size = vector.nbytes + len(json.dumps(answer, default=str))
+        if size > self.max_bytes:
+            return
+
+        if self._vectors is None:
+            self._vectors = np.zeros((self.max_entries, len(vector)), np.float32)
+
+        while self._entries and (
+            not self._free_slots or self.size_bytes + size > self.max_bytes
+        ):
+            self._evict(next(iter(self._entries)))
+
+        slot = self._free_slots.pop()
+        self._vectors[slot] = vector
+        self._memory_hashes[slot] = memory_hash
+        self._terms_hashes[slot] = hash_key_terms(question)
+        self._entries[slot] = (answer, size, time.time())
+        self.size_bytes += size
+
+
+class EmbeddingCache:
+    """
+    Process-wide LRU cache of embeddings keyed by (model, normalized text).
+
+    `aembed` embeds every text of a call that is neither cached nor already
+    being embedded by a concurrent call in a single request, so a batch of
+    texts costs at most one embedding request. The request runs in its own
+    task, so a cancelled caller does not fail the others waiting on it.
+    Vectors are kept as float32 and evicted in LRU order once either
+    `max_entries` or `max_bytes` is exceeded.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES,
+        max_bytes: int = EMBEDDING_CACHE_MAX_BYTES,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[Tuple[str, str], np.ndarray] = OrderedDict()
+        self._pending: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._requests: Set[asyncio.Task] = set()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return re.sub(r"\s+", " ", text).strip()
+
+    def clear(self):
+        self._entries.clear()
+        self.size_bytes = 0
+
+    def _put(self, key: Tuple[str, str], vector: List[float]):
+        vector = np.asarray(vector, dtype=np.float32)
+        if key in self._entries or vector.nbytes > self.max_bytes:
+            return
+
+        self._entries[key] = vector
+        self.size_bytes += vector.nbytes
+        while len(self._entries) > self.max_entries or self.size_bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size_bytes -= evicted.nbytes
+
+    async def _embed_missing(
+        self,
+        missing: Dict[Tuple[str, str], str],
+        futures: Dict[Tuple[str, str], asyncio.Future],
+        embed: Callable[[List[str]], Awaitable[List[List[float]]]],
+    ):
+        try:
+            embedded = await embed(list(missing.values()))
+            for key, vector in zip(missing, embedded):
+                self._put(key, vector)
+                futures[key].set_result(np.asarray(vector, dtype=np.float32))
+        except Exception as e:
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(e)
+                    # retrieved here, so failures nobody waits for are not logged
+                    future.exception()
+        finally:
+            for key, future in futures.items():
+                if not future.done():
+                    future.cancel()
+                self._pending.pop(key, None)
+
+    async def aembed(
+        self,
+        model: str,
+        texts: List[str],
+        embed: Callable[[List[str]], Awaitable[List[List[float]]]],
+    ) -> List[List[float]]:
+        """
+        Embeds `texts` with `model`, only requesting the missing ones.
+
+        Args:
+            model (str): Name of the embedding model, part of the cache key.
+            texts (List[str]): The texts to embed.
+            embed (Callable): Async function embedding a list of texts in one
+                request, e.g. `Embeddings.aembed_documents`.
+
+        Returns:
+            The embeddings of `texts`, in order.
+        """
+        keys = [(model, self.normalize(t)) for t in texts]
+
+        vectors: Dict[Tuple[str, str], np.ndarray] = {}
+        waiting: Dict[Tuple[str, str], asyncio.Future] = {}
+        missing: Dict[Tuple[str, str], str] = {}
+        for key, text in zip(keys, texts):
+            if key in vectors or key in waiting or key in missing:
+                continue
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                vectors[key] = self._entries[key]
+                self.hits += 1
+            elif key in self._pending:
+                waiting[key] = self._pending[key]
+                self.hits += 1
+            else:
+                missing[key] = text
+                self.misses += 1
+
+        if missing:
+            loop = asyncio.get_running_loop()
+            futures = {key: loop.create_future() for key in missing}
+            self._pending.update(futures)
+            request = asyncio.ensure_future(
+                self._embed_missing(missing, futures, embed)
+            )
+            self._requests.add(request)
+            request.add_done_callback(self._requests.discard)
+            waiting.update(futures)
+
+        # shielded, so a caller going away does not cancel the embeddings the
+        # concurrent callers of the same texts wait for
+        for key, future in waiting.items():
+            vectors[key] = await asyncio.shield(future)
+
+        return [vectors[key].tolist() for key in keys]
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls sharing a key into a single in-flight call.
+
+    The first caller of a key (the leader) starts the call; callers arriving
+    while it runs await the same task instead of starting their own. The task
+    is shielded, so a caller going away does not cancel it for the others.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is None:
+            self.leaders += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+
+            def forget(done: asyncio.Task):
+                if self._calls.get(key) is done:
+                    del self._calls[key]
+
+            task.add_done_callback(forget)
+        else:
+            self.coalesced += 1
+
+        return await asyncio.shield(task)
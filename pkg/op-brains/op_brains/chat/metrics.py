@@ -0,0 +1,190 @@
+import time
+import bisect
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Tuple
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (1_000, 2_500, 5_000, 10_000, 25_000, 50_000, 100_000, 250_000)
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    escaped = [
+        (k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in labels
+    ]
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> Iterator[str]:
+        for labels, value in self._values.items():
+            yield f"{self.name}{_format_labels(labels)} {value}"
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...]):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        # labels -> (non-cumulative bucket counts, +Inf included, sum)
+        self._values: Dict[Tuple, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        if key not in self._values:
+            self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+        counts, total = self._values[key]
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    def samples(self) -> Iterator[str]:
+        for labels, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip([*self.buckets, "+Inf"], counts):
+                cumulative += count
+                bucket_labels = (*labels, ("le", str(bound)))
+                yield f"{self.name}_bucket{_format_labels(bucket_labels)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(labels)} {total[0]}"
+            yield f"{self.name}_count{_format_labels(labels)} {cumulative}"
+
+
+class CallbackMetric:
+    """A metric whose single value is read from a callback at scrape time."""
+
+    def __init__(self, name: str, help: str, type: str, callback: Callable):
+        self.name = name
+        self.help = help
+        self.type = type
+        self.callback = callback
+
+    def samples(self) -> Iterator[str]:
+        yield f"{self.name} {self.callback()}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, Counter | Histogram | CallbackMetric] = {}
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._register(Counter(name, help))
+
+    def histogram(
+        self, name: str, help: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, help, buckets))
+
+    def callback(
+        self, name: str, help: str, callback: Callable, type: str = "gauge"
+    ) -> CallbackMetric:
+        return self._register(CallbackMetric(name, help, type, callback))
+
+    def render(self) -> str:
+        """Renders every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram(
+    "op_brains_stage_seconds",
+    "Latency of each stage of answering a question, by reasoning level.",
+)
+REASONING_LEVELS = registry.histogram(
+    "op_brains_reasoning_levels",
+    "Number of reasoning levels used to answer a question.",
+    buckets=(0, 1, 2, 3, 4, 5),
+)
+CONTEXT_CHARS = registry.histogram(
+    "op_brains_context_chars",
+    "Size, in characters, of the context sent to the responder.",
+    buckets=SIZE_BUCKETS,
+)
+CONTEXT_TOKENS = registry.histogram(
+    "op_brains_context_tokens",
+    "Tokens of context packed for the responder, by reasoning level.",
+    buckets=(500, 1_000, 2_000, 4_000, 8_000, 12_000, 16_000, 32_000),
+)
+PREDICTIONS = registry.counter(
+    "op_brains_predictions_total",
+    "Answered questions, by outcome (answered, cached or error).",
+)
+
+_current_timings: ContextVar[List[Dict] | None] = ContextVar(
+    "op_brains_timings", default=None
+)
+
+
+def record(stage: str, seconds: float, reasoning_level: int | None = None):
+    """Records a timed stage in the histograms and in the collected timings."""
+    level = "" if reasoning_level is None else str(reasoning_level)
+    STAGE_SECONDS.observe(seconds, stage=stage, reasoning_level=level)
+
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.append(
+            {
+                "stage": stage,
+                "reasoning_level": reasoning_level,
+                "seconds": round(seconds, 4),
+            }
+        )
+
+
+@contextmanager
+def span(stage: str, reasoning_level: int | None = None):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start, reasoning_level)
+
+
+@contextmanager
+def collect_timings() -> Iterator[List[Dict]]:
+    """
+    Collects the spans recorded in this context (including tasks created in it)
+    into the yielded list.
+    """
+    timings = []
+    token = _current_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _current_timings.reset(token)
+
+
+def add_timings(timings: List[Dict]):
+    """
+    Adds spans recorded in another context (e.g. a call shared by several
+    requests) to the collected timings, without observing them again.
+    """
+    current = _current_timings.get()
+    if current is not None:
+        current.extend(timings)
@@ -1,7 +1,6 @@
 from typing import List, Callable, Tuple, Dict, Any, Union, Optional
 import time
 import json
-import faiss
 import numpy as np
 import io
 import pandas as pd
@@ -9,14 +8,24 @@ from langchain_openai import ChatOpenAI
 from langchain_anthropic import ChatAnthropic
 from langchain_core.pydantic_v1 import BaseModel, Field
 from op_brains.retriever.connect_faiss import load_faiss_indexes
+from op_brains.retriever.ann import build_ann_index, filtered_search
+from op_brains.retriever.filters import FilterSelector, MetadataFilter
+from op_brains.retriever.managed_index import ManagedIndexTable
 from op_brains.config import (
     SCOPE,
     EMBEDDING_MODEL,
     CHAT_MODEL,
+    CONTEXT_TOKEN_BUDGET,
+    CONTEXT_MIN_TRUNCATED_TOKENS,
 )
 from .apis import access_APIs
+from .tokenizer import count_tokens, truncate_tokens
+from .metrics import CONTEXT_TOKENS
+from op_core.logger import get_logger
 from op_brains.documents import DataExporter
 
+logger = get_logger(__name__)
+
 TODAY = time.strftime("%Y-%m-%d")
 
 
@@ -75,7 +84,7 @@ When adding keywords, adhere to these guidelines:
         )
 
     @staticmethod
-    def preprocessor(llm: ChatOpenAI | ChatAnthropic, **kwargs):
+    def _preprocessor_chain(llm: ChatOpenAI | ChatAnthropic, **kwargs):
         preprocessor_header = f"""
 You are a part of a helpful chatbot assistant system that provides information about {SCOPE}.
 
@@ -116,10 +125,21 @@ The user now provided the following query:
             )
 
         llm = llm.with_structured_output(Preprocessor)
-        return llm.invoke(preprocessor_header.format(**kwargs)).dict()
+        return llm, preprocessor_header.format(**kwargs)
 
     @staticmethod
-    def responder(llm: ChatOpenAI | ChatAnthropic, final: bool = False, **kwargs):
+    def preprocessor(llm: ChatOpenAI | ChatAnthropic, **kwargs):
+        llm, prompt = Prompt._preprocessor_chain(llm, **kwargs)
+        return llm.invoke(prompt).dict()
+
+    @staticmethod
+    async def apreprocessor(llm: ChatOpenAI | ChatAnthropic, **kwargs):
+        llm, prompt = Prompt._preprocessor_chain(llm, **kwargs)
+        out = await llm.ainvoke(prompt)
+        return out.dict()
+
+    @staticmethod
+    def _responder_schema(final: bool = False, **kwargs):
         responder_header = f"""
 You are a helpful assistant that provides information about {SCOPE}. Your goal is to give polite, informative, assertive, objective, and brief answers. Avoid jargon and explain any technical terms, as the user may not be a specialist.
 
@@ -166,14 +186,59 @@ Today's date is {TODAY}. Be aware of information that might be outdated.
                     description="""If you didn't write an answer, provide a new search that encompasses the information that is missing. The system will perform a search. This is going to be used by the system to retrieve a context that can provide this information. The user won't see this.""",
                 )
 
-        llm = llm.with_structured_output(Responder)
+        return Responder, responder_header.format(**kwargs)
+
+    @staticmethod
+    def responder(llm: ChatOpenAI | ChatAnthropic, final: bool = False, **kwargs):
+        schema, prompt = Prompt._responder_schema(final=final, **kwargs)
+        llm = llm.with_structured_output(schema)
         try:
-            out = llm.invoke(responder_header.format(**kwargs))
+            out = llm.invoke(prompt)
         except:
             return None
-        print(out)
+        logger.debug(f"Responder output: {out}")
         return out.dict()
 
+    @staticmethod
+    async def aresponder(
+        llm: ChatOpenAI | ChatAnthropic, final: bool = False, **kwargs
+    ):
+        schema, prompt = Prompt._responder_schema(final=final, **kwargs)
+        llm = llm.with_structured_output(schema)
+        try:
+            out = await llm.ainvoke(prompt)
+        except Exception as e:
+            logger.error(f"Responder failed: {str(e)}")
+            return None
+        logger.debug(f"Responder output: {out}")
+        return out.dict()
+
+    @staticmethod
+    async def astream_responder(
+        llm: ChatOpenAI | ChatAnthropic, final: bool = False, **kwargs
+    ):
+        """
+        Streaming variant of `aresponder`. Yields the partially generated
+        arguments of the responder as they arrive, and then, as the last item,
+        the same validated output `aresponder` would return (None on failure).
+        """
+        schema, prompt = Prompt._responder_schema(final=final, **kwargs)
+        llm = llm.bind_tools([schema], tool_choice=schema.__name__)
+        message = None
+        try:
+            async for chunk in llm.astream(prompt):
+                message = chunk if message is None else message + chunk
+                if message.tool_calls:
+                    yield message.tool_calls[0]["args"]
+
+            out = schema(**message.tool_calls[0]["args"])
+        except Exception as e:
+            logger.error(f"Streaming responder failed: {str(e)}")
+            yield None
+            return
+        logger.debug(f"Streaming responder output: {out}")
+        yield out.dict()
+
 
 class ContextHandling:
     summary_template = """
@@ -187,6 +252,9 @@ class ContextHandling:
 </summary_from_forum_thread>
 
 """
+    # the types of contexts `format_context` renders; contexts of any other
+    # type never reach the responder, so retrieval is restricted to these
+    context_types = ("forum_thread_summary",)
 
     @staticmethod
     async def filter(
@@ -196,12 +264,19 @@ class ContextHandling:
         query: str | None = None,
         type_search: str = "factual",
         k: int = 10,
+        reasoning_level: int | None = None,
+        token_budget: int = CONTEXT_TOKEN_BUDGET,
+        exclude_explored: bool = True,
     ) -> Tuple[str, list]:
+        # contexts sent at earlier reasoning levels are only carried through the
+        # summary of explored contexts, so they are not sent again
+        explored = set(explored_contexts) if exclude_explored else set()
+
         contexts_to_be_explored = {}
         for question, contexts in question_context.items():
-            new_contexts = contexts
-            # TODO: is this used anywhere?
-            # new_contexts = [c for c in contexts if c.metadata.get("url") not in explored_contexts]
+            new_contexts = [
+                c for c in contexts if c.metadata.get("url") not in explored
+            ]
 
             if query is not None:
                 k_i = min(k, len(new_contexts))
@@ -233,29 +308,78 @@ class ContextHandling:
                 if c.metadata.get("url")
             }
 
-        return ContextHandling.format(contexts_to_be_explored, question_context)
+        context, urls, tokens = ContextHandling.pack(
+            contexts_to_be_explored, token_budget
+        )
+        level = "" if reasoning_level is None else reasoning_level
+        CONTEXT_TOKENS.observe(tokens, reasoning_level=level)
+        logger.info(
+            f"Packed {len(urls)}/{len(contexts_to_be_explored)} contexts "
+            f"({tokens}/{token_budget} tokens) at reasoning level {level}"
+        )
+        return context, urls
 
     @staticmethod
-    def format(context: dict, context_dict: dict) -> Tuple[str, list]:
-        urls = list(context.keys())
-        out = []
-        for c in context.values():
-            type_db = c.metadata["type_db_info"]
-            match type_db:
-                case "forum_thread_summary":
-                    out.append(
-                        ContextHandling.summary_template.format(
-                            TITLE=c.metadata["thread_title"],
-                            CREATED_AT=c.metadata["created_at"],
-                            LAST_POST_AT=c.metadata["last_posted_at"],
-                            URL=c.metadata["url"],
-                            CONTENT=c.page_content,
-                        )
-                    )
-                case _:
-                    pass
+    def format_context(c, content: str | None = None) -> str | None:
+        match c.metadata["type_db_info"]:
+            case "forum_thread_summary":
+                return ContextHandling.summary_template.format(
+                    TITLE=c.metadata["thread_title"],
+                    CREATED_AT=c.metadata["created_at"],
+                    LAST_POST_AT=c.metadata["last_posted_at"],
+                    URL=c.metadata["url"],
+                    CONTENT=c.page_content if content is None else content,
+                )
+            case _:
+                return None
 
-        return "".join(out), urls
+    @staticmethod
+    def pack(
+        context: dict,
+        token_budget: int = CONTEXT_TOKEN_BUDGET,
+        min_truncated_tokens: int = CONTEXT_MIN_TRUNCATED_TOKENS,
+    ) -> Tuple[str, list, int]:
+        """
+        Formats contexts in rank order until `token_budget` is filled.
+
+        The first context that does not fit is truncated if at least
+        `min_truncated_tokens` of its content still fit, and every context
+        ranked below it is dropped.
+
+        Args:
+            context (dict): Contexts by url, in rank order.
+            token_budget (int): Maximum number of tokens of the packed contexts.
+            min_truncated_tokens (int): Smallest useful truncated content.
+
+        Returns:
+            The packed contexts, the urls of the contexts included and the
+            number of tokens used.
+        """
+        out, urls, used = [], [], 0
+        for url, c in context.items():
+            formatted = ContextHandling.format_context(c)
+            if formatted is None:
+                continue
+
+            tokens = count_tokens(formatted)
+            if used + tokens <= token_budget:
+                out.append(formatted)
+                urls.append(url)
+                used += tokens
+                continue
+
+            overhead = tokens - count_tokens(c.page_content)
+            room = token_budget - used - overhead
+            if room >= min_truncated_tokens:
+                formatted = ContextHandling.format_context(
+                    c, truncate_tokens(c.page_content, room)
+                )
+                out.append(formatted)
+                urls.append(url)
+                used += count_tokens(formatted)
+            break
+
+        return "".join(out), urls, used
 
     @staticmethod
     async def reordering(
@@ -264,10 +388,9 @@ class ContextHandling:
         if type_search == "factual" or type_search == "ocurrence":
             return context[:k]
         elif type_search == "recent":
-            all_contexts_df = await DataExporter.get_dataframe(only_not_embedded=False)
-            urls = [c.metadata["url"] for c in context]
-            contexts = all_contexts_df[all_contexts_df["url"].isin(urls)].iloc[:k]
-            return contexts.content.tolist()
+            # dates are read from the lookup built once per dataframe
+            lookup = DataExporter.get_context_lookup(contexts_df)
+            return lookup.rank_by_recency(context, k)
 
 
 class RetrieverBuilder:
@@ -276,50 +399,94 @@ class RetrieverBuilder:
         **retriever_pars,
     ):
         db = await load_faiss_indexes()
-        return lambda query: db.similarity_search(query, **retriever_pars)
+
+        async def retrieve(
+            query: str,
+            query_embed: List[float] | None = None,
+            metadata_filter: MetadataFilter | None = None,
+        ):
+            """
+            Vector search over the FAISS stores. `metadata_filter` (see
+            `MetadataFilter.create`) restricts it by type, category or
+            last post date inside the faiss search, still returning k hits.
+            """
+            if query_embed is not None:
+                return await db.asimilarity_search_by_vector(
+                    query_embed, metadata_filter=metadata_filter, **retriever_pars
+                )
+            return await db.asimilarity_search(
+                query, metadata_filter=metadata_filter, **retriever_pars
+            )
+
+        return retrieve
 
     @staticmethod
-    def build_index(index, index_embed, k_max, treshold):
+    def build_index(index, index_embed, k_max, treshold, index_faiss=None):
         embeddings = access_APIs.get_embedding(EMBEDDING_MODEL)
 
-        index_keys = list(index.keys())
+        if not isinstance(index, ManagedIndexTable):
+            index = ManagedIndexTable.from_dict(index)
+        index_keys = index.keys
+
+        if treshold < 1 and treshold > 0 and index_faiss is None:
+            index_faiss = build_ann_index(index_embed)
 
-        if treshold < 1 and treshold > 0:
-            index_faiss = faiss.IndexFlatIP(index_embed.shape[1])
-            index_faiss.add(index_embed)
+        # type_db_info -> (lookup, mask of the keys with a url of those types)
+        type_masks: Dict[Tuple[str, ...], Tuple[Any, FilterSelector]] = {}
+
+        def type_selector(lookup, type_db_info) -> FilterSelector:
+            types = tuple(sorted(type_db_info))
+            cached = type_masks.get(types)
+            if cached is not None and cached[0] is lookup:
+                return cached[1]
+            typed_urls = [lookup.by_type.get(t, {}) for t in types]
+            mask = index.rows_with_urls(lambda u: any(u in urls for urls in typed_urls))
+            type_masks[types] = (lookup, FilterSelector(mask))
+            return type_masks[types][1]
 
         async def find_similar(
             query: str,
             contexts_df: pd.DataFrame,
             criteria: Callable = lambda x: x,
+            query_embed: List[float] | None = None,
             **kwargs,
         ):
+            lookup = DataExporter.get_context_lookup(contexts_df)
+            type_db_info = kwargs.get("type_db_info")
+            # keys without a context of the wanted types are excluded inside
+            # the search, so they do not take the place of the k_max matches
+            selector = None
+            if type_db_info is not None and treshold < 1:
+                selector = type_selector(lookup, type_db_info)
+
             if treshold < 1:
                 if treshold > 0:
-                    query_embed = np.array(embeddings.embed_documents([query]))
-                    distances, indices = index_faiss.search(query_embed, k_max)
-
-                    similar = [index_keys[i] for i in indices[0]]
-                    dists = distances[0]
+                    if query_embed is None:
+                        query_embed = (await embeddings.aembed_documents([query]))[0]
+                    query_embed = np.array([query_embed], dtype=np.float32)
+                    distances, indices = filtered_search(
+                        index_faiss, query_embed, k_max, selector
+                    )
 
-                    dists = [d for d in dists if d >= treshold]
-                    similar = [s for s, d in zip(similar, dists) if d >= treshold]
+                    # approximate indexes pad missing neighbors with -1
+                    rows = [
+                        int(i)
+                        for i, d in zip(indices[0], distances[0])
+                        if i >= 0 and d >= treshold
+                    ]
+                elif selector is not None:
+                    rows = np.flatnonzero(selector.mask).tolist()
                 else:
-                    similar = index_keys
+                    rows = range(len(index_keys))
             else:
-                similar = [query]
-
-            similar = criteria(similar)
+                row = index.row(query)
+                rows = [] if row is None else [row]
 
-            urls = [u for s in similar for u in index[s]]
+            similar = {index_keys[row]: row for row in rows}
+            rows = [similar[s] for s in criteria(list(similar))]
 
-            contexts = contexts_df
-            if "type_db_info" in kwargs:
-                contexts = contexts[
-                    contexts["type_db_info"].isin(kwargs["type_db_info"])
-                ]
-            contexts = contexts[contexts["url"].isin(urls)]
+            urls = index.urls_of(rows)
 
-            return [contexts[contexts["url"] == u].content.tolist()[0] for u in urls]
+            return lookup.get(urls, type_db_info)
 
         return find_similar
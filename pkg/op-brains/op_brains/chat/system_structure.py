@@ -1,6 +1,9 @@
 from typing import Tuple, Any, Callable
 from op_brains.chat.apis import access_APIs
+from op_brains.config import RETRIEVAL_CONCURRENCY
+from op_brains.chat.metrics import span, REASONING_LEVELS, CONTEXT_CHARS
 import pandas as pd
+import asyncio
 
 import re
 
@@ -9,34 +12,51 @@ class RAGSystem:
     REASONING_LIMIT: int
     models_to_use: list
     retriever: Callable
+    embedder: Callable | None
+    searched_text: Callable | None
+    retrieval_concurrency: int
     context_filter: Callable
     system_prompt_preprocessor: Callable
     system_prompt_responder: Callable
+    system_prompt_responder_stream: Callable | None
 
-    llm: list = []
+    llm: list
     number_of_models: int = 2
 
     def __init__(self, **kwargs):
         self.REASONING_LIMIT = kwargs.get("REASONING_LIMIT", 3)
         self.models_to_use = kwargs.get("models_to_use")
         self.retriever = kwargs.get("retriever")
+        self.embedder = kwargs.get("embedder")
+        # (question, reasoning_level) -> text the retriever searches, or None
+        self.searched_text = kwargs.get("searched_text")
+        self.retrieval_concurrency = kwargs.get(
+            "retrieval_concurrency", RETRIEVAL_CONCURRENCY
+        )
         self.context_filter = kwargs.get("context_filter")
         self.system_prompt_preprocessor = kwargs.get("system_prompt_preprocessor")
         self.system_prompt_responder = kwargs.get("system_prompt_responder")
+        self.system_prompt_responder_stream = kwargs.get(
+            "system_prompt_responder_stream"
+        )
 
-        assert len(self.models_to_use) == self.number_of_models
+        # clients can be injected so long-lived callers reuse their connection pools
+        self.llm = kwargs.get("llm")
+        if self.llm is None:
+            assert len(self.models_to_use) == self.number_of_models
+            self.llm = [
+                access_APIs.get_llm(m, **pars) for m, pars in self.models_to_use
+            ]
 
-        for m in self.models_to_use:
-            m, pars = m
-            self.llm += [access_APIs.get_llm(m, **pars)]
+        assert len(self.llm) == self.number_of_models
 
-    def query_preprocessing_LLM(
+    async def query_preprocessing_LLM(
         self, query: str, memory: list, LLM: Any = None
     ) -> Tuple[bool, str | Tuple[str, list]]:
         if LLM is None:
             LLM = self.llm[0]
 
-        output_LLM = self.system_prompt_preprocessor(
+        output_LLM = await self.system_prompt_preprocessor(
             LLM, QUERY=query, CONVERSATION_HISTORY=memory
         )
 
@@ -56,7 +76,7 @@ class RAGSystem:
 
             return True, (user_knowledge, keywords + questions, type_search)
 
-    def responder_LLM(
+    async def responder_LLM(
         self,
         query: str,
         context: str,
@@ -64,18 +84,22 @@ class RAGSystem:
         summary_of_explored_contexts: str,
         final: bool = False,
         LLM: Any = None,
+        emit: Callable | None = None,
     ):  # -> Tuple[str|list, bool]:
         if LLM is None:
             LLM = self.llm[1]
 
-            output_LLM = self.system_prompt_responder(
-                LLM,
+            prompt_kwargs = dict(
                 final=final,
                 QUERY=query,
                 CONTEXT=context,
                 USER_KNOWLEDGE=user_knowledge,
                 SUMMARY_OF_EXPLORED_CONTEXTS=summary_of_explored_contexts,
             )
+            if emit is not None and self.system_prompt_responder_stream is not None:
+                output_LLM = await self.stream_responder(LLM, emit, **prompt_kwargs)
+            else:
+                output_LLM = await self.system_prompt_responder(LLM, **prompt_kwargs)
 
             if output_LLM is None:
                 return ("", [], ""), False
@@ -99,16 +123,83 @@ class RAGSystem:
 
             raise Exception("ERROR: Unexpected error during prediction")
 
+    async def stream_responder(self, LLM: Any, emit: Callable, **kwargs) -> dict:
+        """
+        Runs the streaming responder, emitting the answer text as "token"
+        events while it is generated, and returns its final output.
+        """
+        output_LLM, streamed = None, ""
+        async for output_LLM in self.system_prompt_responder_stream(LLM, **kwargs):
+            answer = (output_LLM or {}).get("answer")
+            text = answer.get("answer") if isinstance(answer, dict) else None
+            if (
+                isinstance(text, str)
+                and len(text) > len(streamed)
+                and text.startswith(streamed)
+            ):
+                await emit("token", {"text": text[len(streamed) :]})
+                streamed = text
+
+        return output_LLM
+
+    async def retrieve_contexts(
+        self,
+        questions: list,
+        reasoning_level: int,
+        contexts_df: pd.DataFrame,
+        embedder: Callable | None = None,
+        retriever: Callable | None = None,
+    ) -> dict:
+        embedder = embedder or self.embedder
+        retriever = retriever or self.retriever
+        texts = [list(q.values())[0] for q in questions]
+
+        # one batched embedding request for every expansion of this level that
+        # the retriever searches
+        query_embeds = {}
+        if embedder is not None:
+            searched = texts
+            if self.searched_text is not None:
+                searched = [self.searched_text(q, reasoning_level) for q in questions]
+            unique_texts = list(dict.fromkeys(t for t in searched if t is not None))
+            if unique_texts:
+                with span("embedding", reasoning_level):
+                    vectors = await embedder(unique_texts)
+                query_embeds = dict(zip(unique_texts, vectors))
+
+        semaphore = asyncio.Semaphore(self.retrieval_concurrency)
+
+        async def retrieve(question: dict, text: str) -> list:
+            async with semaphore:
+                return await retriever(
+                    question,
+                    reasoning_level=reasoning_level,
+                    contexts_df=contexts_df,
+                    query_embed=query_embeds.get(text),
+                )
+
+        contexts = await asyncio.gather(
+            *[retrieve(q, t) for q, t in zip(questions, texts)]
+        )
+        return dict(zip(texts, contexts))
+
     async def predict(
         self,
         query: str,
         contexts_df: pd.DataFrame,
         memory: list = [],
         verbose: bool = False,
+        emit: Callable | None = None,
+        preprocessed: Tuple[bool, Any] | None = None,
+        embedder: Callable | None = None,
+        retriever: Callable | None = None,
     ) -> str:
-        needs_info, preprocess_reasoning = self.query_preprocessing_LLM(
-            query, memory=memory
-        )
+        if preprocessed is None:
+            with span("preprocessor"):
+                preprocessed = await self.query_preprocessing_LLM(query, memory=memory)
+        needs_info, preprocess_reasoning = preprocessed
+        if emit is not None:
+            await emit("preprocessed", {"needs_info": needs_info})
         history_reasoning = {
             "query": query,
             "needs_info": needs_info,
@@ -132,35 +223,47 @@ class RAGSystem:
                 except:
                     pass
 
-                context_dict = {
-                    list(q.values())[0]: await self.retriever(
-                        q, reasoning_level=reasoning_level
+                with span("retrieval", reasoning_level):
+                    context_dict = await self.retrieve_contexts(
+                        questions,
+                        reasoning_level,
+                        contexts_df,
+                        embedder=embedder,
+                        retriever=retriever,
                     )
-                    for q in questions
-                }
                 # context_dict = {c.metadata['url']:c for cc in context_list for c in cc}
 
-                context, context_urls = await self.context_filter(
-                    context_dict,
-                    explored_contexts_urls,
-                    contexts_df,
-                    query,
-                    type_search,
-                )
+                with span("context_filter", reasoning_level):
+                    context, context_urls = await self.context_filter(
+                        context_dict,
+                        explored_contexts_urls,
+                        contexts_df,
+                        query,
+                        type_search,
+                        reasoning_level=reasoning_level,
+                    )
+                CONTEXT_CHARS.observe(len(context), reasoning_level=reasoning_level)
                 explored_contexts_urls.extend(context_urls)
+                if emit is not None:
+                    await emit(
+                        "contexts",
+                        {"reasoning_level": reasoning_level, "urls": context_urls},
+                    )
 
                 if verbose:
                     print(
                         f"-------Reasoning level {reasoning_level}\nExploring Context URLS: {context_urls}"
                     )
 
-                result, is_enough = self.responder_LLM(
-                    query,
-                    context,
-                    user_knowledge,
-                    summary_of_explored_contexts,
-                    final=reasoning_level > self.REASONING_LIMIT,
-                )
+                with span("responder", reasoning_level):
+                    result, is_enough = await self.responder_LLM(
+                        query,
+                        context,
+                        user_knowledge,
+                        summary_of_explored_contexts,
+                        final=reasoning_level > self.REASONING_LIMIT,
+                        emit=emit,
+                    )
 
                 if verbose:
                     print(f"-------Result: {result}\n")
@@ -173,7 +276,38 @@ class RAGSystem:
                     "result": result,
                 }
             answer = result
+            REASONING_LEVELS.observe(reasoning_level)
         else:
+            REASONING_LEVELS.observe(0)
             answer = {"answer": preprocess_reasoning, "url_supporting": []}
+            if emit is not None:
+                await emit("token", {"text": preprocess_reasoning or ""})
         history_reasoning["answer"] = answer
         return history_reasoning
+
+    async def stream(
+        self,
+        query: str,
+        contexts_df: pd.DataFrame,
+        memory: list = [],
+        verbose: bool = False,
+    ):
+        """
+        Runs `predict`, yielding its stage events as `(event, data)` tuples
+        while it runs. The last item is `("result", history_reasoning)`.
+        """
+        queue = asyncio.Queue()
+
+        async def emit(event: str, data: dict):
+            await queue.put((event, data))
+
+        task = asyncio.create_task(
+            self.predict(query, contexts_df, memory=memory, verbose=verbose, emit=emit)
+        )
+        task.add_done_callback(lambda _: queue.put_nowait(None))
+        try:
+            while (item := await queue.get()) is not None:
+                yield item
+            yield "result", task.result()
+        finally:
+            task.cancel()
@@ -0,0 +1,51 @@
+from functools import lru_cache
+
+import tiktoken
+
+from op_brains.config import CONTEXT_TOKEN_ENCODING
+from op_core.logger import get_logger
+
+logger = get_logger(__name__)
+
+# rough characters per token, used when the encoding files cannot be loaded
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=None)
+def get_encoding(name: str = CONTEXT_TOKEN_ENCODING) -> tiktoken.Encoding | None:
+    try:
+        return tiktoken.get_encoding(name)
+    except Exception as e:
+        logger.warning(
+            f"Could not load the {name} encoding, estimating token counts: {e}"
+        )
+        return None
+
+
+def count_tokens(text: str) -> int:
+    encoding = get_encoding()
+    if encoding is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """
+    Cuts `text` down to at most `max_tokens` tokens.
+
+    Args:
+        text (str): The text to truncate.
+        max_tokens (int): Maximum number of tokens to keep.
+
+    Returns:
+        The leading part of `text` that fits in `max_tokens` tokens.
+    """
+    if max_tokens <= 0:
+        return ""
+    encoding = get_encoding()
+    if encoding is None:
+        return text[: max_tokens * CHARS_PER_TOKEN]
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
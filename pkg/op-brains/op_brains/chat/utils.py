@@ -1,16 +1,46 @@
 import os
 from op_brains.chat import model_utils
 from op_brains.chat.system_structure import RAGSystem
-from typing import Dict, Any, List, Tuple
+from typing import Dict, Any, List, Tuple, AsyncIterator
 from op_brains.documents import DataExporter
 import numpy as np
+import pandas as pd
 import io
-from op_data.db.models import ManagedIndex
+from op_data.db.models import ManagedIndex, FaissIndex
 import pickle
 import zlib
-from op_brains.config import DB_STORAGE_PATH, CHAT_MODEL
+from op_brains.config import (
+    DB_STORAGE_PATH,
+    CHAT_MODEL,
+    EMBEDDING_MODEL,
+    ANSWER_CACHE_ENABLED,
+    ANSWER_CACHE_VERSION_TTL,
+    BATCH_CONCURRENCY,
+    LEXICAL_K,
+    LEXICAL_INDEX_RETRY,
+    RRF_K,
+)
+from op_brains.chat.apis import access_APIs
+from op_brains.chat.cache import (
+    SemanticAnswerCache,
+    SingleFlight,
+    EmbeddingCache,
+    hash_memory,
+)
+from op_brains.chat.metrics import (
+    registry,
+    span,
+    collect_timings,
+    add_timings,
+    PREDICTIONS,
+)
 from op_data.sources.incremental_indexer import IncrementalIndexerService
-import json
+from op_brains.retriever.lexical import BM25Index, reciprocal_rank_fusion
+from op_brains.retriever.ann import deserialize_index, index_type_of, storage_of
+from op_brains.retriever.managed_index import ManagedIndexTable
+from op_brains.retriever.filters import MetadataFilter
+from op_brains.retriever.connect_faiss import close_faiss_indexes
+import time
 import asyncio
 from aiocache import cached
 from op_core.logger import get_logger
@@ -48,12 +78,28 @@ async def build_managed_index(k_max=5, treshold=0.95, indexType="questions"):
     managed_index_npz_bytes = io.BytesIO(managed_index_npz)
     loaded_data = np.load(managed_index_npz_bytes)
 
-    embed_index = loaded_data["index_embed"]
-    index_dict = json.loads(managed_index_json)
+    # indexes saved as a {key: [url, ...]} JSON are converted on load
+    index_table = ManagedIndexTable.from_bytes(managed_index_json, loaded_data)
 
-    logger.info(f"Building managed index, {indexType}, {len(index_dict.keys())}")
+    # indexes saved before the search index was persisted are built on load;
+    # otherwise the raw embeddings are not even decompressed
+    embed_index = None
+    index_faiss = None
+    if "faiss_index" in loaded_data:
+        index_faiss = deserialize_index(loaded_data["faiss_index"])
+        logger.info(
+            f"Loaded persisted {index_type_of(index_faiss)} {indexType} index "
+            f"({storage_of(index_faiss)}, {len(managed_index_npz)} bytes)"
+        )
+    else:
+        embed_index = loaded_data["index_embed"]
+
+    logger.info(
+        f"Building managed index, {indexType}, {len(index_table)} keys, "
+        f"{len(index_table.urls)} urls"
+    )
     return model_utils.RetrieverBuilder.build_index(
-        index_dict, embed_index, k_max, treshold
+        index_table, embed_index, k_max, treshold, index_faiss=index_faiss
     )
 
 
@@ -72,107 +118,635 @@ async def get_indexes():
     return questions_index_retriever, keywords_index_retriever, default_retriever
 
 
-async def process_question(
-    question: str,
-    memory: List[Dict[str, str]],
-    # config: Dict[str, Any],
-    verbose: bool = False,
-) -> Dict[str, Any]:
-    """
-    Processes a given question using a RAG model,
-    leveraging contextual memory and retrievers for enhanced response generation.
+@cached(ttl=60 * 60 * 24)
+async def _load_lexical_index() -> BM25Index | None:
+    lexical_index = await IncrementalIndexerService.get_latest_lexical_index()
+    if lexical_index is None:
+        logger.debug("No lexical index found, using vector retrieval only")
+    else:
+        logger.info(f"Loaded lexical index, {len(lexical_index)} contexts")
+    return lexical_index
 
-    Args:
-        question (str): The input question to be processed.
-        memory (List[Dict[str, str]], optional): A list of dictionaries containing
-            previous interactions, each with 'name' (being 'user' or 'chat') and 'message' keys.
-            Defaults to an empty list.
 
-    Returns:
-        A dict containing the response to the question.
-            The dictionary has the following keys:
-            - "answer" (str): The generated answer from the RAG model.
-            - "error" (str): An error message if an exception occurred, otherwise None.
+# aiocache does not store None, so until the indexer saves the first lexical
+# index its absence is remembered here, and looked up again after a while
+_lexical_index_missing_at: float | None = None
 
-    Raises:
-        Exception: Any unexpected error that occurs during the prediction process
-            is caught and logged, with a user-friendly error message returned in the dictionary.
+
+async def get_lexical_index() -> BM25Index | None:
+    global _lexical_index_missing_at
+    if (
+        _lexical_index_missing_at is not None
+        and time.monotonic() - _lexical_index_missing_at < LEXICAL_INDEX_RETRY
+    ):
+        return None
+
+    lexical_index = await _load_lexical_index()
+    _lexical_index_missing_at = time.monotonic() if lexical_index is None else None
+    return lexical_index
+
+
+async def lexical_search(text: str, contexts_df: pd.DataFrame) -> list:
+    try:
+        lexical_index = await get_lexical_index()
+    except Exception as e:
+        logger.error(f"Failed to load the lexical index: {str(e)}")
+        return []
+    if lexical_index is None:
+        return []
+
+    urls = [url for url, _ in lexical_index.search(text, k=LEXICAL_K)]
+    return DataExporter.get_context_lookup(contexts_df).get(
+        urls, model_utils.ContextHandling.context_types
+    )
+
+
+# contexts the responder can use; applied inside the faiss searches, so the
+# k matches of each retriever are not taken by contexts dropped later
+CONTEXT_FILTER = MetadataFilter.create(
+    type_db_info=model_utils.ContextHandling.context_types
+)
+
+
+def contains(must_contain):
+    return lambda similar: [s for s in similar if must_contain in s]
+
+
+class RAGEngine:
     """
+    Long-lived owner of the chat and embedding clients used to answer questions.
 
-    contexts_df = await DataExporter.get_dataframe(only_not_embedded=False)
+    The clients (and their HTTP connection pools) are created once in `startup`
+    and shared by every request, while the state of each question lives only
+    in the `RAGSystem.predict` call answering it.
+    """
 
-    chat_model = (
-        CHAT_MODEL,
-        {
+    def __init__(
+        self,
+        chat_model: str = CHAT_MODEL,
+        chat_model_pars: Dict[str, Any] | None = None,
+        embedding_model: str = EMBEDDING_MODEL,
+    ):
+        self.chat_model = chat_model
+        self.chat_model_pars = chat_model_pars or {
             "temperature": 0.0,
             "max_retries": 5,
             "max_tokens": 1024,
             "timeout": 60,
-        },
-    )
+        }
+        self.embedding_model = embedding_model
+        self.llm = None
+        self.embeddings = None
+        self.rag_model: RAGSystem | None = None
+        self._lifecycle_lock = asyncio.Lock()
+
+    async def startup(self):
+        async with self._lifecycle_lock:
+            if self.rag_model is not None:
+                return
+
+            self.llm = access_APIs.get_llm(self.chat_model, **self.chat_model_pars)
+            self.embeddings = access_APIs.get_embedding(self.embedding_model)
+            self.rag_model = RAGSystem(
+                reasoning_limit=1,
+                llm=[self.llm, self.llm],
+                retriever=self.retriever,
+                embedder=self.embed,
+                searched_text=self.searched_text,
+                context_filter=model_utils.ContextHandling.filter,
+                system_prompt_preprocessor=model_utils.Prompt.apreprocessor,
+                system_prompt_responder=model_utils.Prompt.aresponder,
+                system_prompt_responder_stream=model_utils.Prompt.astream_responder,
+            )
+            logger.info(f"RAG engine started with {self.chat_model}")
+
+        try:
+            await asyncio.gather(
+                get_indexes(),
+                get_lexical_index(),
+                DataExporter.get_dataframe(only_not_embedded=False),
+            )
+        except Exception as e:
+            logger.error(f"Failed to warm up the retrieval indexes: {str(e)}")
+
+    async def shutdown(self):
+        async with self._lifecycle_lock:
+            if self.rag_model is None:
+                return
+
+            await access_APIs.aclose(self.llm)
+            await access_APIs.aclose(self.embeddings)
+            # the cached retrievers search the faiss stores being closed
+            await get_indexes.cache.clear()
+            await close_faiss_indexes()
+            self.llm = None
+            self.embeddings = None
+            self.rag_model = None
+            logger.info("RAG engine shut down")
+
+    @staticmethod
+    def searched_text(query: dict, reasoning_level: int) -> str | None:
+        """
+        The text `retriever` embeds and searches for an expansion at
+        `reasoning_level`, or None if it returns no contexts for it.
+        """
+        if reasoning_level < 1 and "keyword" in query:
+            return query["keyword"]
+        if "question" in query:
+            return query["question"]
+        if "query" in query and reasoning_level > 1:
+            return query["query"]
+        return None
+
+    async def retriever(
+        self,
+        query: dict,
+        reasoning_level: int,
+        contexts_df: pd.DataFrame,
+        query_embed: list | None = None,
+    ) -> list:
+        text = self.searched_text(query, reasoning_level)
+        if text is None:
+            return []
 
-    try:
         (
             questions_index_retriever,
             keywords_index_retriever,
             default_retriever,
         ) = await get_indexes()
 
-        def contains(must_contain):
-            return lambda similar: [s for s in similar if must_contain in s]
+        # embedded once through the cache, then shared by every retriever
+        if query_embed is None:
+            query_embed = (await self.embed([text]))[0]
 
-        async def retriever(query: dict, reasoning_level: int) -> list:
-            if reasoning_level < 1 and "keyword" in query:
+        types = CONTEXT_FILTER.type_db_info
+        if reasoning_level < 1 and "keyword" in query:
+            with span("keywords_index_retriever", reasoning_level):
                 if "instance" in query:
                     context = await keywords_index_retriever(
                         query["keyword"],
                         contexts_df,
                         criteria=contains(query["instance"]),
+                        query_embed=query_embed,
+                        type_db_info=types,
                     )
                 else:
                     context = await keywords_index_retriever(
-                        query["keyword"], contexts_df
+                        query["keyword"],
+                        contexts_df,
+                        query_embed=query_embed,
+                        type_db_info=types,
                     )
-                return context
 
-            if "question" in query:
-                if reasoning_level < 1:
+            # exact terms (e.g. "Season #5", proposal numbers) are often missed
+            # by the embedding match, so a BM25 ranking is fused with it
+            with span("lexical_retriever", reasoning_level):
+                lexical_context = await lexical_search(
+                    " ".join([query["keyword"], query.get("instance", "")]),
+                    contexts_df,
+                )
+            return reciprocal_rank_fusion(
+                [context, lexical_context],
+                key=lambda c: c.metadata.get("url"),
+                k=RRF_K,
+            )
+
+        if "question" in query:
+            if reasoning_level < 1:
+                with span("questions_index_retriever", reasoning_level):
                     context = await questions_index_retriever(
-                        query["question"], contexts_df
+                        query["question"],
+                        contexts_df,
+                        query_embed=query_embed,
+                        type_db_info=types,
                     )
-                    if len(context) > 0:
-                        return context
-                return default_retriever(query["question"])
+                if len(context) > 0:
+                    return context
+            with span("default_retriever", reasoning_level):
+                return await default_retriever(
+                    query["question"],
+                    query_embed=query_embed,
+                    metadata_filter=CONTEXT_FILTER,
+                )
 
-            if "query" in query:
-                if reasoning_level > 1:
-                    return default_retriever(query["query"])
-            return []
+        with span("default_retriever", reasoning_level):
+            return await default_retriever(
+                query["query"], query_embed=query_embed, metadata_filter=CONTEXT_FILTER
+            )
 
-        rag_model = RAGSystem(
-            reasoning_limit=1,
-            models_to_use=[chat_model, chat_model],
-            retriever=retriever,
-            context_filter=model_utils.ContextHandling.filter,
-            system_prompt_preprocessor=model_utils.Prompt.preprocessor,
-            system_prompt_responder=model_utils.Prompt.responder,
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        if self.rag_model is None:
+            await self.startup()
+
+        return await embedding_cache.aembed(
+            self.embedding_model, texts, self.embeddings.aembed_documents
+        )
+
+    async def preprocess(
+        self, question: str, memory: List[Dict[str, str]]
+    ) -> Tuple[bool, Any]:
+        if self.rag_model is None:
+            await self.startup()
+
+        formatted_memory = transform_memory_entries(memory)
+        return await self.rag_model.query_preprocessing_LLM(
+            question, memory=formatted_memory
         )
 
+    async def predict(
+        self,
+        question: str,
+        contexts_df: pd.DataFrame,
+        memory: List[Dict[str, str]],
+        verbose: bool = False,
+        **kwargs,
+    ) -> Dict[str, Any]:
+        if self.rag_model is None:
+            await self.startup()
+
         formatted_memory = transform_memory_entries(memory)
-        result = await rag_model.predict(
-            question, contexts_df, memory=formatted_memory, verbose=verbose
+        return await self.rag_model.predict(
+            question, contexts_df, memory=formatted_memory, verbose=verbose, **kwargs
         )
 
-        # logger.log_query(question, result)
-        return {"data": result["answer"], "error": None}
+
+rag_engine = RAGEngine()
+answer_cache = SemanticAnswerCache()
+embedding_cache = EmbeddingCache()
+question_flight = SingleFlight()
+
+registry.callback(
+    "op_brains_answer_cache_hits_total",
+    "Questions answered from the semantic answer cache.",
+    lambda: answer_cache.hits,
+    type="counter",
+)
+registry.callback(
+    "op_brains_answer_cache_misses_total",
+    "Semantic answer cache lookups without a match.",
+    lambda: answer_cache.misses,
+    type="counter",
+)
+registry.callback(
+    "op_brains_answer_cache_entries",
+    "Answers currently held by the semantic answer cache.",
+    lambda: len(answer_cache),
+)
+registry.callback(
+    "op_brains_embedding_cache_hits_total",
+    "Texts whose embedding was cached or already being requested.",
+    lambda: embedding_cache.hits,
+    type="counter",
+)
+registry.callback(
+    "op_brains_embedding_cache_misses_total",
+    "Texts sent to the embedding model.",
+    lambda: embedding_cache.misses,
+    type="counter",
+)
+registry.callback(
+    "op_brains_coalesced_questions_total",
+    "Questions that joined an identical in-flight prediction.",
+    lambda: question_flight.coalesced,
+    type="counter",
+)
+
+
+@cached(ttl=ANSWER_CACHE_VERSION_TTL)
+async def get_index_version() -> Tuple[int | None, int | None]:
+    managed_index = await ManagedIndex.all().order_by("-createdAt").first()
+    faiss_index = await FaissIndex.all().order_by("-createdAt").first()
+    return (
+        managed_index.id if managed_index else None,
+        faiss_index.id if faiss_index else None,
+    )
+
+
+async def lookup_cached_answer(
+    question: str, memory: List[Dict[str, str]]
+) -> Tuple[Tuple[List[float], int] | None, Dict[str, Any] | None]:
+    """
+    Looks a question up in the semantic answer cache, dropping the cache first
+    if a newer managed or FAISS index was saved.
+
+    Returns:
+        The cache key of the question (None if the cache is disabled) and the
+        cached response, if any.
+    """
+    if not ANSWER_CACHE_ENABLED:
+        return None, None
+
+    answer_cache.ensure_version(await get_index_version())
+    question_embed = (await rag_engine.embed([question]))[0]
+    memory_hash = hash_memory(transform_memory_entries(memory))
+
+    return (question_embed, memory_hash), answer_cache.get(
+        question_embed, memory_hash, question
+    )
+
+
+async def answer_question(
+    question: str,
+    contexts_df: pd.DataFrame,
+    memory: List[Dict[str, str]],
+    verbose: bool = False,
+    cache_key: Tuple[List[float], int] | None = None,
+    **predict_kwargs,
+) -> Dict[str, Any]:
+    """
+    Answers a question from the answer cache or with `rag_engine.predict`.
+
+    `cache_key` is given by callers that already looked the question up in
+    the answer cache, so it is not looked up again. `predict_kwargs` are
+    passed to `rag_engine.predict`.
+    """
+    if cache_key is None:
+        with span("answer_cache_lookup"):
+            cache_key, cached_answer = await lookup_cached_answer(question, memory)
+        if cached_answer is not None:
+            PREDICTIONS.inc(outcome="cached")
+            return cached_answer
+
+    result = await rag_engine.predict(
+        question, contexts_df, memory=memory, verbose=verbose, **predict_kwargs
+    )
+
+    # logger.log_query(question, result)
+    response = {"data": result["answer"], "error": None}
+    if cache_key is not None:
+        answer_cache.put(*cache_key, response, question)
+    PREDICTIONS.inc(outcome="answered")
+    return response
+
+
+async def process_question(
+    question: str,
+    memory: List[Dict[str, str]],
+    # config: Dict[str, Any],
+    verbose: bool = False,
+    include_timings: bool = False,
+) -> Dict[str, Any]:
+    """
+    Processes a given question using a RAG model,
+    leveraging contextual memory and retrievers for enhanced response generation.
+
+    Args:
+        question (str): The input question to be processed.
+        memory (List[Dict[str, str]], optional): A list of dictionaries containing
+            previous interactions, each with 'name' (being 'user' or 'chat') and 'message' keys.
+            Defaults to an empty list.
+        include_timings (bool): Whether to add the timed stages of the prediction
+            to the response.
+
+    Returns:
+        A dict containing the response to the question.
+            The dictionary has the following keys:
+            - "answer" (str): The generated answer from the RAG model.
+            - "error" (str): An error message if an exception occurred, otherwise None.
+            - "timings" (list): Only if include_timings, the timed stages, each
+              with "stage", "reasoning_level" and "seconds" keys. A question
+              that joined an identical in-flight prediction gets its stages too.
+
+    Raises:
+        Exception: Any unexpected error that occurs during the prediction process
+            is caught and logged, with a user-friendly error message returned in the dictionary.
+    """
+
+    with collect_timings() as timings, span("total"):
+        response = await _process_question(question, memory, verbose)
+
+    if include_timings:
+        response = {**response, "timings": timings}
+    return response
+
+
+async def _process_question(
+    question: str,
+    memory: List[Dict[str, str]],
+    verbose: bool,
+    contexts_df: pd.DataFrame | None = None,
+    **answer_kwargs,
+) -> Dict[str, Any]:
+    if contexts_df is None:
+        contexts_df = await DataExporter.get_dataframe(only_not_embedded=False)
+
+    async def answer() -> Tuple[Dict[str, Any], List[Dict]]:
+        with collect_timings() as timings:
+            response = await answer_question(
+                question, contexts_df, memory, verbose, **answer_kwargs
+            )
+        return response, timings
+
+    try:
+        # concurrent requests for the same question and memory share one answer,
+        # and every one of them gets the spans of the shared prediction
+        key = (question, hash_memory(transform_memory_entries(memory)))
+        response, timings = await question_flight.do(key, answer)
+        add_timings(timings)
+        return response
     except Exception as e:
         logger.error(f"Error. An unexpected error occurred during prediction: {str(e)}")
+        PREDICTIONS.inc(outcome="error")
         return {
             "data": {},
             "error": "An unexpected error occurred during prediction",
         }
 
 
+async def stream_question(
+    question: str,
+    memory: List[Dict[str, str]],
+    verbose: bool = False,
+) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Streaming counterpart of `process_question`.
+
+    Yields `(event, data)` tuples as the question is answered: "preprocessed",
+    "contexts" (one per reasoning level, with the URLs being explored) and
+    "token" (increments of the answer text). The last event is "answer", whose
+    data is the same dict `process_question` returns.
+
+    Like `process_question`, the question joins an identical one already being
+    answered, in which case (as for a cached answer) only "answer" is yielded.
+    """
+
+    contexts_df = await DataExporter.get_dataframe(only_not_embedded=False)
+    events: asyncio.Queue = asyncio.Queue()
+
+    async def emit(event: str, data: Dict[str, Any]):
+        events.put_nowait((event, data))
+
+    with span("total"):
+        task = asyncio.ensure_future(
+            _process_question(
+                question, memory, verbose, contexts_df=contexts_df, emit=emit
+            )
+        )
+        task.add_done_callback(lambda _: events.put_nowait(None))
+        try:
+            while (item := await events.get()) is not None:
+                yield item
+            yield "answer", task.result()
+        finally:
+            # a shared prediction is shielded and goes on for the other callers
+            task.cancel()
+
+
+class BatchRetrieval:
+    """
+    Retrieval work shared by the questions of a batch: each distinct text is
+    embedded once, and each distinct expansion is retrieved once per
+    reasoning level.
+    """
+
+    def __init__(self, engine: RAGEngine):
+        self.engine = engine
+        self.query_embeds: Dict[str, List[float]] = {}
+        self.contexts: Dict[Tuple, asyncio.Future] = {}
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        missing = [t for t in dict.fromkeys(texts) if t not in self.query_embeds]
+        if missing:
+            vectors = await self.engine.embed(missing)
+            self.query_embeds.update(zip(missing, vectors))
+
+        return [self.query_embeds[t] for t in texts]
+
+    async def retriever(
+        self,
+        query: dict,
+        reasoning_level: int,
+        contexts_df: pd.DataFrame,
+        query_embed: list | None = None,
+    ) -> list:
+        key = (tuple(query.items()), reasoning_level)
+        if key not in self.contexts:
+            self.contexts[key] = asyncio.ensure_future(
+                self.engine.retriever(query, reasoning_level, contexts_df, query_embed)
+            )
+
+        return await self.contexts[key]
+
+
+def expansion_texts(preprocessed: Tuple[bool, Any]) -> List[str]:
+    needs_info, preprocess_reasoning = preprocessed
+    if not needs_info:
+        return []
+
+    _, questions, _ = preprocess_reasoning
+    return [list(q.values())[0] for q in questions]
+
+
+async def process_questions(
+    questions: List[str],
+    memories: List[List[Dict[str, str]]] | None = None,
+    concurrency: int = BATCH_CONCURRENCY,
+    verbose: bool = False,
+) -> List[Dict[str, Any]]:
+    """
+    Processes a batch of questions, sharing work across them.
+
+    Identical (question, memory) pairs are answered once, and a question
+    already being answered for another request is joined, as in
+    `process_question`. Every question and every first-level expansion of the
+    batch is embedded in one bulk request, retrievals of the same expansion
+    are shared, all questions use the same `contexts_df` snapshot, and at most
+    `concurrency` questions are being worked on by the LLMs at a time.
+
+    Args:
+        questions (List[str]): The questions to be processed.
+        memories (List[List[Dict[str, str]]], optional): The conversation memory
+            of each question, as in `process_question`. Defaults to no memory.
+        concurrency (int): Maximum number of questions in flight.
+
+    Returns:
+        One dict per question, in order, with the keys returned by
+        `process_question` plus "latency", the seconds spent answering it.
+    """
+    if memories is None:
+        memories = [[] for _ in questions]
+
+    contexts_df = await DataExporter.get_dataframe(only_not_embedded=False)
+    batch = BatchRetrieval(rag_engine)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    keys = [
+        (question, hash_memory(transform_memory_entries(memory)))
+        for question, memory in zip(questions, memories)
+    ]
+    unique = dict(zip(keys, memories))
+    responses: Dict[Tuple, Dict[str, Any]] = {}
+    latencies = {key: 0.0 for key in unique}
+    error_response = {
+        "data": {},
+        "error": "An unexpected error occurred during prediction",
+    }
+
+    try:
+        question_embeds = await batch.embed([question for question, _ in unique])
+        question_embeds = dict(zip(unique, question_embeds))
+        if ANSWER_CACHE_ENABLED:
+            answer_cache.ensure_version(await get_index_version())
+            for key in unique:
+                cached_answer = answer_cache.get(question_embeds[key], key[1], key[0])
+                if cached_answer is not None:
+                    responses[key] = cached_answer
+    except Exception as e:
+        logger.error(f"Error. An unexpected error occurred during prediction: {str(e)}")
+        return [{**error_response, "latency": 0.0} for _ in questions]
+
+    pending = [key for key in unique if key not in responses]
+
+    async def preprocess(key: Tuple) -> Tuple[bool, Any] | None:
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                return await rag_engine.preprocess(key[0], unique[key])
+            except Exception as e:
+                logger.error(
+                    f"Error. An unexpected error occurred during prediction: {str(e)}"
+                )
+                responses[key] = error_response
+            finally:
+                latencies[key] += time.perf_counter() - start
+
+    preprocessed = dict(zip(pending, await asyncio.gather(*map(preprocess, pending))))
+    pending = [key for key in pending if key not in responses]
+
+    # expansions repeat across questions, so they are embedded together; on
+    # failure each question embeds its own expansions while predicting
+    try:
+        await batch.embed(
+            [t for key in pending for t in expansion_texts(preprocessed[key])]
+        )
+    except Exception as e:
+        logger.error(f"Failed to embed the batch expansions: {str(e)}")
+
+    async def predict(key: Tuple):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                # joins an identical question already being answered, if any
+                responses[key] = await _process_question(
+                    key[0],
+                    unique[key],
+                    verbose,
+                    contexts_df=contexts_df,
+                    cache_key=(question_embeds[key], key[1])
+                    if ANSWER_CACHE_ENABLED
+                    else None,
+                    preprocessed=preprocessed[key],
+                    embedder=batch.embed,
+                    retriever=batch.retriever,
+                )
+            finally:
+                latencies[key] += time.perf_counter() - start
+
+    await asyncio.gather(*map(predict, pending))
+
+    return [{**responses[key], "latency": latencies[key]} for key in keys]
+
+
 # if __name__ == "__main__":
 #     print(
 #         process_question("Can the length of the challenge period be changed?", [], "")
@@ -1,4 +1,6 @@
 import os
+import json
+import tempfile
 import importlib.resources
 import op_artifacts.dbs
 import op_artifacts
@@ -18,15 +20,82 @@ CHAT_MODEL = os.getenv("CHAT_MODEL", "gpt-4o-mini")
 CHAT_TEMPERATURE = float(os.getenv("CHAT_TEMPERATURE", "0"))
 MAX_RETRIES = int(os.getenv("MAX_RETRIES", "2"))
 K_RETRIEVER = int(os.getenv("K_RETRIEVER", "8"))
+RETRIEVAL_CONCURRENCY = int(os.getenv("RETRIEVAL_CONCURRENCY", "8"))
+
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+# /predict/batch allows 100 // BATCH_MAX_QUESTIONS batches a minute per client
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "20"))
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "False") == "True"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", str(60 * 60 * 6)))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "2048"))
+ANSWER_CACHE_MAX_BYTES = int(os.getenv("ANSWER_CACHE_MAX_BYTES", str(64 * 2**20)))
+ANSWER_CACHE_VERSION_TTL = int(os.getenv("ANSWER_CACHE_VERSION_TTL", "60"))
+
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "20000"))
+EMBEDDING_CACHE_MAX_BYTES = int(
+    os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(128 * 2**20))
+)
+
+# managed (questions/keywords) index type: flat, hnsw, ivf_flat or ivf_pq
+MANAGED_INDEX_TYPE = os.getenv("MANAGED_INDEX_TYPE", "flat")
+# storage of the managed index vectors (float32, float16 or pq), per index type
+MANAGED_INDEX_STORAGE = {
+    "default": os.getenv("MANAGED_INDEX_STORAGE", "float32"),
+    "questions": os.getenv(
+        "QUESTIONS_INDEX_STORAGE", os.getenv("MANAGED_INDEX_STORAGE", "float32")
+    ),
+    "keywords": os.getenv(
+        "KEYWORDS_INDEX_STORAGE", os.getenv("MANAGED_INDEX_STORAGE", "float32")
+    ),
+}
+HNSW_M = int(os.getenv("HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "80"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+IVF_NLIST = int(os.getenv("IVF_NLIST", "0"))
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "16"))
+PQ_M = int(os.getenv("PQ_M", "64"))
+PQ_NBITS = int(os.getenv("PQ_NBITS", "8"))
+
+LEXICAL_K = int(os.getenv("LEXICAL_K", "5"))
+# seconds before looking a missing lexical index up again
+LEXICAL_INDEX_RETRY = int(os.getenv("LEXICAL_INDEX_RETRY", "600"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# "recent" searches rank contexts by (1 - weight) * relevance + weight * freshness,
+# where freshness halves every RECENCY_HALF_LIFE_DAYS since the last post
+RECENCY_WEIGHT = float(os.getenv("RECENCY_WEIGHT", "0.5"))
+RECENCY_HALF_LIFE_DAYS = float(os.getenv("RECENCY_HALF_LIFE_DAYS", "90"))
+
+# age (seconds) after which the exported contexts are refreshed in the background
+DATAFRAME_REFRESH_INTERVAL = int(os.getenv("DATAFRAME_REFRESH_INTERVAL", "600"))
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "12000"))
+CONTEXT_TOKEN_ENCODING = os.getenv("CONTEXT_TOKEN_ENCODING", "o200k_base")
+CONTEXT_MIN_TRUNCATED_TOKENS = int(os.getenv("CONTEXT_MIN_TRUNCATED_TOKENS", "200"))
 LOG_FILE = os.path.join(BASE_PATH, "logs.csv")
 
 CHAT_MODEL_OPENAI = os.getenv("CHAT_MODEL_OPENAI", "gpt-4o")
 SUMMARIZER_MODEL = os.getenv("SUMMARIZER_MODEL", CHAT_MODEL_OPENAI)
 
 DB_STORAGE_PATH = importlib.resources.files(op_artifacts.dbs)
+# sharded vector search: threads searching the shards in parallel, and how
+# many shards (besides SHARD_ALWAYS_SEARCH) a query is routed to; 0 searches all
+SHARD_SEARCH_THREADS = int(os.getenv("SHARD_SEARCH_THREADS", "4"))
+SHARD_ROUTING_TOP_N = int(os.getenv("SHARD_ROUTING_TOP_N", "0"))
+# prior added to the centroid similarity of a shard, e.g. {"summary_Governance": 0.05}
+SHARD_PRIORS = json.loads(os.getenv("SHARD_PRIORS", "{}"))
+SHARD_ALWAYS_SEARCH = os.getenv("SHARD_ALWAYS_SEARCH", "documentation").split(",")
+# local copies of the binary faiss artifacts, shared by the workers of a host
+FAISS_ARTIFACT_DIR = os.getenv(
+    "FAISS_ARTIFACT_DIR", os.path.join(tempfile.gettempdir(), "op_brains_faiss")
+)
 POSTHOG_API_KEY = os.getenv("POSTHOG_API_KEY", "")
 
 RAW_FORUM_DB = "RawTopic"
+# raw topics read per query when paging through the forum
+RAW_TOPICS_PAGE_SIZE = int(os.getenv("RAW_TOPICS_PAGE_SIZE", "100"))
 FORUM_SUMMARY_DB = "Topic"
 USE_SUMMARY_MOCK_DATA = os.getenv("USE_SUMMARY_MOCK_DATA", "False") == "True"
 SNAPSHOT_DB = "SnapshotProposal"
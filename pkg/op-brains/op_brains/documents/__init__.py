@@ -1,12 +1,23 @@
+import heapq
+import numpy as np
 import pandas as pd
+from op_brains.config import (
+    RECENCY_WEIGHT,
+    RECENCY_HALF_LIFE_DAYS,
+    DATAFRAME_REFRESH_INTERVAL,
+)
 from op_brains.documents.optimism import (
     FragmentsProcessingStrategy,
     SummaryProcessingStrategy,
 )
-from typing import Optional, Dict
+from typing import Optional, Dict, Iterable, List, Tuple
 import asyncio
 import aiohttp
 import time
+import datetime as dt
+from op_core.logger import get_logger
+
+logger = get_logger(__name__)
 
 chat_sources = [
     [
@@ -18,41 +29,319 @@ chat_sources = [
 ]
 
 
+class ContextLookup:
+    """
+    Hash index from url to the context (`ContextRecord`) of a contexts
+    dataframe, also partitioned by `type_db_info`.
+
+    When a url appears in several rows, the first one in the dataframe order
+    wins, as with a filter on the dataframe.
+
+    The `last_date` of each url is also kept, with its rank in the urls
+    sorted by date (newest first), for recency-aware ranking.
+    """
+
+    def __init__(self, contexts_df: pd.DataFrame):
+        # url -> (row position, context)
+        self.by_url: Dict[str, Tuple[int, object]] = {}
+        self.by_type: Dict[str, Dict[str, Tuple[int, object]]] = {}
+
+        for position, (url, type_db_info, content) in enumerate(
+            zip(
+                contexts_df["url"],
+                contexts_df["type_db_info"],
+                contexts_df["content"],
+            )
+        ):
+            self.by_url.setdefault(url, (position, content))
+            self.by_type.setdefault(type_db_info, {}).setdefault(
+                url, (position, content)
+            )
+
+        # seconds since the epoch, NaN when missing
+        last_dates = (
+            (
+                pd.to_datetime(
+                    contexts_df["last_date"], utc=True, errors="coerce", format="mixed"
+                )
+                - pd.Timestamp(0, tz="UTC")
+            )
+            .dt.total_seconds()
+            .to_numpy()
+        )
+        positions = np.fromiter(
+            (position for position, _ in self.by_url.values()),
+            dtype=np.int64,
+            count=len(self.by_url),
+        )
+        urls_dates = last_dates[positions]
+        self.last_date: Dict[str, float] = dict(zip(self.by_url, urls_dates.tolist()))
+        # stable, so urls posted at the same time keep the dataframe order;
+        # undated urls go last
+        by_date = np.argsort(-np.nan_to_num(urls_dates, nan=-np.inf), kind="stable")
+        urls = list(self.by_url)
+        self.recency_rank: Dict[str, int] = {
+            urls[i]: rank for rank, i in enumerate(by_date.tolist())
+        }
+
+    def __len__(self) -> int:
+        return len(self.by_url)
+
+    def _find(self, url: str, type_db_info: Iterable[str] | None):
+        if type_db_info is None:
+            return self.by_url.get(url)
+        found = [
+            self.by_type[t][url]
+            for t in type_db_info
+            if t in self.by_type and url in self.by_type[t]
+        ]
+        return min(found, key=lambda f: f[0]) if found else None
+
+    def get(
+        self, urls: Iterable[str], type_db_info: Iterable[str] | None = None
+    ) -> List:
+        """
+        Returns the contexts of `urls`, in order, skipping urls without one.
+
+        Args:
+            urls (Iterable[str]): The urls to look up.
+            type_db_info (Iterable[str], optional): Only consider contexts of
+                these types. Defaults to every type.
+
+        Returns:
+            The list of contexts found.
+        """
+        found = (self._find(url, type_db_info) for url in urls)
+        return [f[1] for f in found if f is not None]
+
+    def rank_by_recency(
+        self,
+        contexts: List,
+        k: int,
+        weight: float = RECENCY_WEIGHT,
+        half_life_days: float = RECENCY_HALF_LIFE_DAYS,
+        now: float | None = None,
+    ) -> List:
+        """
+        Returns the k best of `contexts` (ordered by relevance) by a mix of
+        their relevance rank and how recently their url was posted to.
+
+        The score is `(1 - weight) * relevance + weight * freshness`, with
+        relevance going from 1 for the first context to 0 past the last, and
+        freshness halving every `half_life_days`, 0 for undated contexts.
+        Ties go to the most recent url.
+
+        Args:
+            contexts (List): The contexts, most relevant first.
+            k (int): Number of contexts to return.
+            weight (float): Weight of freshness, from 0 (relevance order) to
+                1 (date order).
+            half_life_days (float): Age at which freshness is halved.
+            now (float, optional): Reference time, defaults to the current one.
+
+        Returns:
+            The k contexts with the best score, best first.
+        """
+        now = time.time() if now is None else now
+        half_life = half_life_days * 24 * 60 * 60
+        n = len(contexts)
+        unranked = len(self.recency_rank)
+
+        def score(item):
+            rank, context = item
+            url = context.metadata.get("url")
+            last_date = self.last_date.get(url, np.nan)
+            freshness = (
+                0.0
+                if np.isnan(last_date)
+                else 0.5 ** (max(now - last_date, 0.0) / half_life)
+            )
+            relevance = 1 - rank / n
+            return (
+                (1 - weight) * relevance + weight * freshness,
+                -self.recency_rank.get(url, unranked),
+            )
+
+        best = heapq.nlargest(k, enumerate(contexts), key=score)
+        return [context for _, context in best]
+
+
 class DataExporter:
-    _dataframe_cache: Optional[pd.DataFrame] = None
-    _dataframe_cache_time: Optional[float] = None
-    _dataframe_cache_with_embedded: Optional[bool] = None
-    _cache_lock = asyncio.Lock()
+    """
+    Exports the contexts of every source as one dataframe, cached per
+    `only_not_embedded` mode so the API and the indexer do not evict each
+    other.
+
+    A cached dataframe older than `REFRESH_INTERVAL` is still returned, and
+    refreshed in the background: only the rows of the urls changed since the
+    watermark of their source (see `SummaryProcessingStrategy.changed_urls`)
+    are rebuilt, and the whole dataframe is rebuilt once every `CACHE_TTL`.
+    """
+
+    # only_not_embedded -> dataframe, and its parts per priority class
+    _dataframe_cache: Dict[bool, pd.DataFrame] = {}
+    _class_frames: Dict[bool, List[pd.DataFrame]] = {}
+    # only_not_embedded -> time of the last full build and of the last refresh
+    _dataframe_built_time: Dict[bool, float] = {}
+    _dataframe_cache_time: Dict[bool, float] = {}
+    # (only_not_embedded, source name) -> latest change already exported
+    _watermarks: Dict[Tuple[bool, str], Optional[dt.datetime]] = {}
+    _refresh_tasks: Dict[bool, asyncio.Task] = {}
+    _cache_locks: Dict[bool, asyncio.Lock] = {
+        False: asyncio.Lock(),
+        True: asyncio.Lock(),
+    }
+    # only_not_embedded -> (dataframe, lookup), built along with the dataframe
+    _lookups: Dict[bool, Tuple[pd.DataFrame, ContextLookup]] = {}
+    # (dataframe, lookup) of the last other dataframe a lookup was built for
+    _lookup_cache: Optional[Tuple[pd.DataFrame, ContextLookup]] = None
     CACHE_TTL = 60 * 60 * 24  # day in seconds
+    REFRESH_INTERVAL = DATAFRAME_REFRESH_INTERVAL
 
     @classmethod
     async def get_dataframe(cls, only_not_embedded=False):
-        async with cls._cache_lock:
-            current_time = time.time()
+        mode = bool(only_not_embedded)
+        dataframe = cls._dataframe_cache.get(mode)
+        if dataframe is None:
+            async with cls._cache_locks[mode]:
+                if mode not in cls._dataframe_cache:
+                    await cls._build(mode)
+            return cls._dataframe_cache[mode]
+
+        if time.time() - cls._dataframe_cache_time[mode] > cls.REFRESH_INTERVAL:
+            cls._schedule_refresh(mode)
+        return dataframe
+
+    @staticmethod
+    def _sort_class(frame: pd.DataFrame) -> pd.DataFrame:
+        return frame.sort_values(by="last_date", ascending=False)
+
+    @staticmethod
+    async def _watermark(source) -> Optional[dt.datetime]:
+        # sources without one (e.g. the documentation) change on full builds only
+        if not hasattr(source, "changed_urls"):
+            return None
+        return await source.watermark()
+
+    @classmethod
+    async def _build(cls, mode: bool):
+        """Rebuilds every row; must hold the lock of the mode."""
+        class_frames = []
+        for priority_class in chat_sources:
+            # read before the data, so changes made meanwhile are patched later
+            watermarks = await asyncio.gather(
+                *[cls._watermark(source) for source in priority_class]
+            )
+            dfs_class = await asyncio.gather(
+                *[
+                    source.dataframe_process(only_not_embedded=mode)
+                    for source in priority_class
+                ]
+            )
+            class_frames.append(cls._sort_class(pd.concat(dfs_class)))
+            for source, watermark in zip(priority_class, watermarks):
+                cls._watermarks[(mode, source.name_source)] = watermark
+
+        cls._store(mode, class_frames)
+        cls._dataframe_built_time[mode] = cls._dataframe_cache_time[mode]
+        logger.info(
+            f"Exported {len(cls._dataframe_cache[mode])} contexts "
+            f"(only_not_embedded={mode})"
+        )
+
+    @classmethod
+    async def _patch(cls, mode: bool):
+        """Rebuilds the rows changed since the watermarks; must hold the lock."""
+        class_frames = list(cls._class_frames[mode])
+        patched = 0
+        for i, priority_class in enumerate(chat_sources):
+            for source in priority_class:
+                if not hasattr(source, "changed_urls"):
+                    continue
+                key = (mode, source.name_source)
+                since = cls._watermarks.get(key)
+                watermark = await source.watermark()
+                if since is None and watermark is not None:
+                    # the source was empty when last built
+                    return await cls._build(mode)
+                if watermark is None or watermark == since:
+                    continue
+
+                changed = await source.changed_urls(since)
+                if changed:
+                    rows = await source.dataframe_process(
+                        only_not_embedded=mode, urls=changed
+                    )
+                    frame = class_frames[i]
+                    class_frames[i] = cls._sort_class(
+                        pd.concat([frame[~frame["url"].isin(changed)], rows])
+                    )
+                    patched += len(changed)
+                cls._watermarks[key] = watermark
+
+        if patched:
+            cls._store(mode, class_frames)
+            logger.info(f"Refreshed {patched} urls (only_not_embedded={mode})")
+        else:
+            cls._dataframe_cache_time[mode] = time.time()
+
+    @classmethod
+    def _store(cls, mode: bool, class_frames: List[pd.DataFrame]):
+        dataframe = pd.concat(class_frames)
+        # built here, once per refresh, rather than by the first request on
+        # the new dataframe
+        cls._lookups[mode] = (dataframe, ContextLookup(dataframe))
+        cls._class_frames[mode] = class_frames
+        cls._dataframe_cache[mode] = dataframe
+        cls._dataframe_cache_time[mode] = time.time()
+
+    @classmethod
+    async def refresh(cls, only_not_embedded=False, full: bool = False):
+        """
+        Updates the cached dataframe of a mode: the changed rows only, or
+        every row when `full`, the cache is empty or older than `CACHE_TTL`.
+        """
+        mode = bool(only_not_embedded)
+        async with cls._cache_locks[mode]:
+            built = cls._dataframe_built_time.get(mode)
             if (
-                cls._dataframe_cache is None
-                or (current_time - cls._dataframe_cache_time) > cls.CACHE_TTL
-                or cls._dataframe_cache_with_embedded != only_not_embedded
+                full
+                or mode not in cls._dataframe_cache
+                or built is None
+                or time.time() - built > cls.CACHE_TTL
             ):
-                context_df = []
-                for priority_class in chat_sources:
-                    dfs_class = await asyncio.gather(
-                        *[
-                            source.dataframe_process(
-                                only_not_embedded=only_not_embedded
-                            )
-                            for source in priority_class
-                        ]
-                    )
-                    dfs_class = pd.concat(dfs_class)
-                    dfs_class = dfs_class.sort_values(by="last_date", ascending=False)
-                    context_df.append(dfs_class)
+                await cls._build(mode)
+            else:
+                await cls._patch(mode)
+
+    @classmethod
+    def _schedule_refresh(cls, mode: bool):
+        task = cls._refresh_tasks.get(mode)
+        if task is not None and not task.done():
+            return
 
-                cls._dataframe_cache_with_embedded = only_not_embedded
-                cls._dataframe_cache = pd.concat(context_df)
-                cls._dataframe_cache_time = current_time
+        async def refresh():
+            try:
+                await cls.refresh(mode)
+            except Exception as e:
+                logger.error(f"Failed to refresh the contexts dataframe: {str(e)}")
 
-        return cls._dataframe_cache
+        cls._refresh_tasks[mode] = asyncio.create_task(refresh())
+
+    @classmethod
+    def get_context_lookup(cls, contexts_df: pd.DataFrame) -> ContextLookup:
+        """
+        Returns the url lookup of `contexts_df`, built once per dataframe, so
+        every retriever shares the one of the current cached dataframe. The
+        lookups of the cached dataframes are built when they are stored, one
+        per mode; other dataframes share a single slot.
+        """
+        for dataframe, lookup in list(cls._lookups.values()):
+            if dataframe is contexts_df:
+                return lookup
+        if cls._lookup_cache is None or cls._lookup_cache[0] is not contexts_df:
+            cls._lookup_cache = (contexts_df, ContextLookup(contexts_df))
+        return cls._lookup_cache[1]
 
     @classmethod
     async def get_langchain_documents(cls, only_not_embedded=False):
@@ -82,12 +371,16 @@ class DataExporter:
 
     @classmethod
     async def clear_cache(cls):
-        async with cls._cache_lock:
-            cls._dataframe_cache = None
-            cls._dataframe_cache_time = None
-            cls._dataframe_cache_with_embedded = None
+        for mode, lock in cls._cache_locks.items():
+            async with lock:
+                cls._dataframe_cache.pop(mode, None)
+                cls._class_frames.pop(mode, None)
+                cls._dataframe_cache_time.pop(mode, None)
+                cls._dataframe_built_time.pop(mode, None)
+                cls._lookups.pop(mode, None)
+        cls._watermarks.clear()
+        cls._lookup_cache = None
 
     @classmethod
     async def refresh_data(cls):
-        await cls.clear_cache()
-        await cls.get_dataframe()
+        await cls.refresh(only_not_embedded=False, full=True)
@@ -2,14 +2,22 @@ import re
 import json
 import time
 import pandas as pd
-from typing import Any, Dict, List, Tuple
+from typing import Any, AsyncIterator, Dict, List, Tuple
 import datetime as dt
 from langchain_core.documents.base import Document
 from langchain_text_splitters import MarkdownHeaderTextSplitter
 from op_data.db.models import RawTopic, Topic, TopicCategory, SnapshotProposal
-from op_brains.config import RAW_FORUM_DB, FORUM_SUMMARY_DB, DOCS_PATH, SNAPSHOT_DB
+from op_brains.documents.records import ContextRecord
+from op_brains.config import (
+    RAW_FORUM_DB,
+    FORUM_SUMMARY_DB,
+    DOCS_PATH,
+    SNAPSHOT_DB,
+    RAW_TOPICS_PAGE_SIZE,
+)
 import aiofiles
-from tortoise.expressions import Q, F
+from tortoise.expressions import Q, F, Subquery
+from tortoise.queryset import QuerySet
 
 NOW = time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime())
 
@@ -74,7 +82,10 @@ class FragmentsProcessingStrategy:
     @staticmethod
     async def dataframe_process(**kwargs) -> pd.DataFrame:
         fragments = await FragmentsProcessingStrategy.langchain_process(**kwargs)
-        data = [(f.metadata["url"], NOW, f, "fragments_docs") for f in fragments]
+        data = [
+            (f.metadata["url"], NOW, ContextRecord.from_document(f), "fragments_docs")
+            for f in fragments
+        ]
 
         return pd.DataFrame(
             data, columns=["url", "last_date", "content", "type_db_info"]
@@ -82,50 +93,143 @@ class FragmentsProcessingStrategy:
 
 
 class ForumPostsProcessingStrategy:
+    # fields of the raw Discourse topic and posts used to render a thread
+    thread_fields = (
+        "title",
+        "category_id",
+        "tags",
+        "created_at",
+        "last_posted_at",
+        "pinned",
+        "visible",
+        "closed",
+        "archived",
+    )
+    post_fields = (
+        "id",
+        "post_number",
+        "username",
+        "created_at",
+        "trust_level",
+        "reply_to_post_number",
+        "cooked",
+        "moderator",
+        "admin",
+        "staff",
+    )
+
     @staticmethod
-    async def retrieve(
-        only_not_summarized: bool = False, only_not_embedded: bool = False
-    ) -> Tuple[Dict, Dict]:
+    def filter_raw_topics(
+        only_not_summarized: bool = False,
+        only_not_embedded: bool = False,
+        urls: List[str] | None = None,
+        with_summary: bool = False,
+    ) -> QuerySet:
+        raw_topics = RawTopic.all()
         if only_not_summarized:
-            raw_topics = await RawTopic.filter(
+            raw_topics = raw_topics.filter(
                 Q(lastSummarizedAt__lt=F("lastUpdatedAt"))
                 | Q(lastSummarizedAt__isnull=True)
-            ).values("rawData", "url", "type", "externalId")
+            )
         elif only_not_embedded:
-            raw_topics = await RawTopic.filter(
+            raw_topics = raw_topics.filter(
                 Q(lastEmbeddedAt__lt=F("lastUpdatedAt"))
                 | Q(lastEmbeddedAt__isnull=True)
-            ).values("rawData", "url", "type", "externalId")
-        else:
-            raw_topics = await RawTopic.all().values(
-                "rawData", "url", "type", "externalId"
             )
+        if urls is not None:
+            raw_topics = raw_topics.filter(url__in=urls)
+        if with_summary:
+            # semi-join, so threads without a summary are not even loaded
+            topics = Topic.all() if urls is None else Topic.filter(url__in=urls)
+            raw_topics = raw_topics.filter(url__in=Subquery(topics.values("url")))
+        return raw_topics
 
+    @staticmethod
+    def parse_raw_topics(raw_topics: List[Dict]) -> Tuple[Dict, Dict]:
+        """
+        Splits raw topic rows into their `posts` and `threads`, keeping only
+        the fields in `thread_fields` and `post_fields`.
+        """
         posts, threads = {}, {}
         for line in raw_topics:
             id = int(line["externalId"])
-            type_line = line["type"]
             url_line = line["url"]
             data_line = line["rawData"]
+            if "title" not in data_line or "category_id" not in data_line:
+                continue
+
+            threads[id] = {
+                key: data_line.get(key)
+                for key in ForumPostsProcessingStrategy.thread_fields
+            }
+            threads[id]["url"] = url_line
             for post in data_line.get("post_stream", {}).get("posts", []):
                 post_id = post.get("id")
-                posts[post_id] = post
+                posts[post_id] = {
+                    key: post.get(key)
+                    for key in ForumPostsProcessingStrategy.post_fields
+                }
                 posts[post_id]["url"] = f"{url_line}/{post_id}"
-                posts[post_id]["thread_id"] = int(id)
+                posts[post_id]["thread_id"] = id
+                posts[post_id]["thread_title"] = data_line["title"]
+                posts[post_id]["category_id"] = data_line["category_id"]
 
-            threads[id] = data_line
-            threads[id]["url"] = url_line
+        return posts, threads
 
-        to_del = []
-        for key in posts:
-            try:
-                posts[key]["thread_title"] = threads[posts[key]["thread_id"]]["title"]
-                posts[key]["category_id"] = threads[posts[key]["thread_id"]][
-                    "category_id"
-                ]
-            except KeyError:
-                to_del.append(posts[key]["thread_id"])
-        posts = {k: v for k, v in posts.items() if k not in to_del}
+    @staticmethod
+    async def iter_raw_topics(
+        only_not_summarized: bool = False,
+        only_not_embedded: bool = False,
+        urls: List[str] | None = None,
+        with_summary: bool = False,
+        page_size: int = RAW_TOPICS_PAGE_SIZE,
+    ) -> AsyncIterator[Tuple[Dict, Dict]]:
+        """
+        Pages through the raw topics in id order, with keyset pagination, and
+        yields the `posts` and `threads` of each page (see `parse_raw_topics`).
+        Only one page of raw topics is loaded at a time.
+        """
+        raw_topics = ForumPostsProcessingStrategy.filter_raw_topics(
+            only_not_summarized=only_not_summarized,
+            only_not_embedded=only_not_embedded,
+            urls=urls,
+            with_summary=with_summary,
+        )
+        last_id = None
+        while True:
+            page = raw_topics if last_id is None else raw_topics.filter(id__gt=last_id)
+            lines = (
+                await page.order_by("id")
+                .limit(page_size)
+                .values("id", "rawData", "url", "externalId")
+            )
+            if not lines:
+                return
+            last_id = lines[-1]["id"]
+
+            yield ForumPostsProcessingStrategy.parse_raw_topics(lines)
+            if len(lines) < page_size:
+                return
+
+    @staticmethod
+    async def retrieve(
+        only_not_summarized: bool = False,
+        only_not_embedded: bool = False,
+        urls: List[str] | None = None,
+        with_summary: bool = False,
+    ) -> Tuple[Dict, Dict]:
+        posts, threads = {}, {}
+        async for (
+            page_posts,
+            page_threads,
+        ) in ForumPostsProcessingStrategy.iter_raw_topics(
+            only_not_summarized=only_not_summarized,
+            only_not_embedded=only_not_embedded,
+            urls=urls,
+            with_summary=with_summary,
+        ):
+            posts.update(page_posts)
+            threads.update(page_threads)
 
         return posts, threads
 
@@ -241,60 +345,104 @@ trust_level (0-4): {TRUST_LEVEL}
     """
 
     @staticmethod
-    async def return_threads(
-        only_not_summarized: bool = False, only_not_embedded: bool = False
-    ) -> List:
-        posts, threads_info = await ForumPostsProcessingStrategy.retrieve(
+    async def iter_threads(
+        only_not_summarized: bool = False,
+        only_not_embedded: bool = False,
+        urls: List[str] | None = None,
+        with_summary: bool = False,
+        page_size: int = RAW_TOPICS_PAGE_SIZE,
+    ) -> AsyncIterator[List]:
+        """
+        Renders the forum threads one page of raw topics at a time (see
+        `iter_raw_topics`), yielding `[str_thread, metadata]` for each, so the
+        whole forum can be processed in constant memory.
+        """
+        category_names = None
+        async for posts, threads_info in ForumPostsProcessingStrategy.iter_raw_topics(
             only_not_summarized=only_not_summarized,
             only_not_embedded=only_not_embedded,
-        )
+            urls=urls,
+            with_summary=with_summary,
+            page_size=page_size,
+        ):
+            if category_names is None:
+                categories = await TopicCategory.all().values("externalId", "name")
+                category_names = {int(c["externalId"]): c["name"] for c in categories}
+
+            for thread in ForumPostsProcessingStrategy.render_threads(
+                posts, threads_info, category_names
+            ):
+                yield thread
 
-        if not threads_info:
-            return []
+    @staticmethod
+    async def return_threads(
+        only_not_summarized: bool = False,
+        only_not_embedded: bool = False,
+        urls: List[str] | None = None,
+        with_summary: bool = False,
+    ) -> List:
+        return [
+            thread
+            async for thread in ForumPostsProcessingStrategy.iter_threads(
+                only_not_summarized=only_not_summarized,
+                only_not_embedded=only_not_embedded,
+                urls=urls,
+                with_summary=with_summary,
+            )
+        ]
 
-        df_posts = pd.DataFrame(posts).T
-        threads = []
-        categories = await TopicCategory.all().values("externalId", "name")
-        category_names = {int(c["externalId"]): c["name"] for c in categories}
+    @staticmethod
+    def render_threads(
+        posts: Dict, threads_info: Dict, category_names: Dict[int, str]
+    ) -> List:
+        """
+        Renders the threads of `posts` (as returned by `retrieve`), in order of
+        their first post, with their posts in order of creation.
+        """
+        posts_by_thread = {}
+        for post in posts.values():
+            posts_by_thread.setdefault(post["thread_id"], []).append(post)
 
-        for t in df_posts["thread_id"].unique():
-            posts_thread = df_posts[df_posts["thread_id"] == t].sort_values(
-                by="created_at"
-            )
-            url = posts_thread["url"].iloc[0]
-            url = url.split("/")[:-1]
-            url = "/".join(url)
-            t_i = threads_info[int(t)]
+        threads = []
+        for t, posts_thread in posts_by_thread.items():
+            posts_thread.sort(key=lambda post: post["created_at"])
+            url = posts_thread[0]["url"].rsplit("/", 1)[0]
+            t_i = threads_info[t]
             category_name = category_names[t_i["category_id"]]
 
-            str_thread = ForumPostsProcessingStrategy.template_thread.format(
-                CATEGORY_NAME=category_name,
-                THREAD_TITLE=t_i["title"],
-                TAGS=t_i["tags"],
-                CREATED_AT=t_i["created_at"],
-                LAST_POSTED_AT=t_i["last_posted_at"],
-                PINNED=t_i["pinned"],
-                VISIBLE=t_i["visible"],
-                CLOSED=t_i["closed"],
-                ARCHIVED=t_i["archived"],
-            )
-
-            for i, post in posts_thread.iterrows():
-                str_thread += ForumPostsProcessingStrategy.template_post.format(
-                    POST_NUMBER=post["post_number"],
-                    USERNAME=post["username"],
-                    CREATED_AT=post["created_at"],
-                    TRUST_LEVEL=post["trust_level"],
-                    IS_REPLY=f"(reply to post #{post['reply_to_post_number']})\n"
-                    if post["reply_to_post_number"] is not None
-                    else "",
-                    CONTENT=post["cooked"]
-                    .replace("<\\content_user_input>", "")
-                    .replace("<content_user_input>", ""),
-                    MODERATOR=post["moderator"],
-                    ADMIN=post["admin"],
-                    STAFF=post["staff"],
+            parts = [
+                ForumPostsProcessingStrategy.template_thread.format(
+                    CATEGORY_NAME=category_name,
+                    THREAD_TITLE=t_i["title"],
+                    TAGS=t_i["tags"],
+                    CREATED_AT=t_i["created_at"],
+                    LAST_POSTED_AT=t_i["last_posted_at"],
+                    PINNED=t_i["pinned"],
+                    VISIBLE=t_i["visible"],
+                    CLOSED=t_i["closed"],
+                    ARCHIVED=t_i["archived"],
+                )
+            ]
+            for post in posts_thread:
+                reply_to = post.get("reply_to_post_number")
+                parts.append(
+                    ForumPostsProcessingStrategy.template_post.format(
+                        POST_NUMBER=post["post_number"],
+                        USERNAME=post["username"],
+                        CREATED_AT=post["created_at"],
+                        TRUST_LEVEL=post["trust_level"],
+                        IS_REPLY=f"(reply to post #{reply_to})\n"
+                        if reply_to is not None
+                        else "",
+                        CONTENT=post["cooked"]
+                        .replace("<\\content_user_input>", "")
+                        .replace("<content_user_input>", ""),
+                        MODERATOR=post["moderator"],
+                        ADMIN=post["admin"],
+                        STAFF=post["staff"],
+                    )
                 )
+            str_thread = "".join(parts)
 
             metadata = {
                 "thread_id": t,
@@ -309,7 +457,7 @@ trust_level (0-4): {TRUST_LEVEL}
                 "category_name": category_name,
                 "url": url,
                 "num_posts": len(posts_thread),
-                "users": list(posts_thread["username"].unique()),
+                "users": list(dict.fromkeys(post["username"] for post in posts_thread)),
                 "length_str_thread": len(str_thread),
                 "type_db_info": "forum_thread",
             }
@@ -317,6 +465,12 @@ trust_level (0-4): {TRUST_LEVEL}
 
         return threads
 
+    @staticmethod
+    async def get_whole_thread(url: str) -> str | None:
+        """Renders the forum thread at `url`, from the database."""
+        threads = await ForumPostsProcessingStrategy.return_threads(urls=[url])
+        return threads[0][0] if threads else None
+
     @staticmethod
     async def get_threads_documents() -> List[Document]:
         threads = await ForumPostsProcessingStrategy.return_threads()
@@ -354,10 +508,43 @@ class SummaryProcessingStrategy:
     """
 
     @staticmethod
-    async def retrieve(only_not_embedded: bool = False) -> List[dict]:
-        out_db = await Topic.all().values(
-            "url", "tldr", "about", "overview", "reaction"
-        )
+    async def watermark() -> dt.datetime | None:
+        """
+        Latest change to the tables summaries are built from; rows changed
+        after it are found with `changed_urls`.
+        """
+        latest = [
+            await Topic.all()
+            .order_by("-updatedAt")
+            .first()
+            .values_list("updatedAt", flat=True),
+            await RawTopic.all()
+            .order_by("-lastUpdatedAt")
+            .first()
+            .values_list("lastUpdatedAt", flat=True),
+            await RawTopic.filter(lastEmbeddedAt__isnull=False)
+            .order_by("-lastEmbeddedAt")
+            .first()
+            .values_list("lastEmbeddedAt", flat=True),
+        ]
+        latest = [w for w in latest if w is not None]
+        return max(latest) if latest else None
+
+    @staticmethod
+    async def changed_urls(since: dt.datetime) -> List[str]:
+        """Urls of the summaries whose topic or thread changed since `since`."""
+        topics = await Topic.filter(updatedAt__gte=since).values_list("url", flat=True)
+        raw_topics = await RawTopic.filter(
+            Q(lastUpdatedAt__gte=since) | Q(lastEmbeddedAt__gte=since)
+        ).values_list("url", flat=True)
+        return list(set(topics) | set(raw_topics))
+
+    @staticmethod
+    async def retrieve(
+        only_not_embedded: bool = False, urls: List[str] | None = None
+    ) -> List[dict]:
+        topics = Topic.all() if urls is None else Topic.filter(url__in=urls)
+        out_db = await topics.values("url", "tldr", "about", "overview", "reaction")
 
         ret = []
         for o in out_db:
@@ -370,16 +557,17 @@ class SummaryProcessingStrategy:
             item = {"content": str_summary, "url": o["url"], "classification": ""}
             ret.append(item)
 
-        threads = await ForumPostsProcessingStrategy.return_threads(
-            only_not_embedded=only_not_embedded
-        )
-
+        entries_by_url = {}
         for entry in ret:
-            url = entry["url"]
-            thread = next((t for t in threads if t[1]["url"] == url), None)
-            if thread:
+            entries_by_url.setdefault(entry["url"], []).append(entry)
+
+        # threads are streamed, and the rendered thread is not kept with the
+        # summary, see `ForumPostsProcessingStrategy.get_whole_thread`
+        async for thread in ForumPostsProcessingStrategy.iter_threads(
+            only_not_embedded=only_not_embedded, urls=urls, with_summary=True
+        ):
+            for entry in entries_by_url.pop(thread[1]["url"], []):
                 entry["metadata"] = thread[1]
-                entry["metadata"]["whole_thread"] = thread[0]
                 entry["metadata"]["classification"] = entry["classification"]
                 entry["metadata"]["type_db_info"] = "forum_thread_summary"
 
@@ -392,9 +580,10 @@ class SummaryProcessingStrategy:
     async def langchain_process(
         divide: str | None = "category_name",
         only_not_embedded: bool = False,
+        urls: List[str] | None = None,
     ) -> Dict[str, List[Document]]:
         data = await SummaryProcessingStrategy.retrieve(
-            only_not_embedded=only_not_embedded
+            only_not_embedded=only_not_embedded, urls=urls
         )
 
         if isinstance(divide, str):
@@ -427,7 +616,12 @@ class SummaryProcessingStrategy:
         summaries = await SummaryProcessingStrategy.langchain_process(**kwargs)
         pattern = r"[^A-Za-z0-9_]+"
         summaries = [
-            (s.metadata["url"], s.metadata["last_posted_at"], s, re.sub(pattern, "", k))
+            (
+                s.metadata["url"],
+                s.metadata["last_posted_at"],
+                ContextRecord.from_document(s),
+                re.sub(pattern, "", k),
+            )
             for k, v in summaries.items()
             for s in v
         ]
@@ -0,0 +1,66 @@
+from typing import Dict, Iterable
+
+from langchain_core.documents import Document
+
+# metadata used by retrieval, filtering and `ContextHandling.format`
+CONTEXT_METADATA = (
+    "url",
+    "type_db_info",
+    "thread_id",
+    "thread_title",
+    "category_name",
+    "created_at",
+    "last_posted_at",
+)
+
+# metadata too large to keep with every context, loaded on demand instead
+LAZY_METADATA = ("whole_thread",)
+
+
+def slim_metadata(metadata: Dict, keys: Iterable[str] = CONTEXT_METADATA) -> Dict:
+    return {key: metadata[key] for key in keys if key in metadata}
+
+
+def drop_lazy_metadata(metadata: Dict) -> Dict:
+    if not any(key in metadata for key in LAZY_METADATA):
+        return metadata
+    return {k: v for k, v in metadata.items() if k not in LAZY_METADATA}
+
+
+class ContextRecord:
+    """
+    Compact stand-in for a langchain `Document` in the contexts dataframe:
+    the page content, and only the metadata in `CONTEXT_METADATA`.
+
+    The rendered forum thread of a summary is not kept; `whole_thread`
+    loads it from the database when needed.
+    """
+
+    __slots__ = ("id", "page_content", "metadata")
+
+    def __init__(self, page_content: str, metadata: Dict, id: str | None = None):
+        self.id = id
+        self.page_content = page_content
+        self.metadata = metadata
+
+    def __repr__(self) -> str:
+        return f"ContextRecord(url={self.metadata.get('url')!r})"
+
+    @classmethod
+    def from_document(cls, document: Document) -> "ContextRecord":
+        return cls(
+            document.page_content, slim_metadata(document.metadata), id=document.id
+        )
+
+    def to_document(self) -> Document:
+        return Document(
+            page_content=self.page_content, metadata=dict(self.metadata), id=self.id
+        )
+
+    async def whole_thread(self) -> str | None:
+        """The rendered forum thread of the context, if it comes from one."""
+        if not self.metadata.get("type_db_info", "").startswith("forum_thread"):
+            return None
+        from op_brains.documents.optimism import ForumPostsProcessingStrategy
+
+        return await ForumPostsProcessingStrategy.get_whole_thread(self.metadata["url"])
@@ -0,0 +1,224 @@
+import math
+from typing import Tuple
+
+import faiss
+import numpy as np
+
+from op_brains.config import (
+    MANAGED_INDEX_TYPE,
+    MANAGED_INDEX_STORAGE,
+    HNSW_M,
+    HNSW_EF_CONSTRUCTION,
+    HNSW_EF_SEARCH,
+    IVF_NLIST,
+    IVF_NPROBE,
+    PQ_M,
+    PQ_NBITS,
+)
+from op_brains.retriever.filters import FilterSelector
+from op_core.logger import get_logger
+
+logger = get_logger(__name__)
+
+INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_pq")
+# how the vectors are stored in the index: as is, as float16, or as PQ codes
+STORAGE_TYPES = ("float32", "float16", "pq")
+
+# faiss warns below ~39 training points per centroid
+MIN_POINTS_PER_CENTROID = 39
+
+
+def _nlist(n: int, nlist: int) -> int:
+    if nlist <= 0:
+        nlist = 4 * int(math.sqrt(n))
+    return max(1, min(nlist, n // MIN_POINTS_PER_CENTROID))
+
+
+def build_ann_index(
+    embeds: np.ndarray,
+    index_type: str = MANAGED_INDEX_TYPE,
+    storage: str = MANAGED_INDEX_STORAGE["default"],
+    hnsw_m: int = HNSW_M,
+    ef_construction: int = HNSW_EF_CONSTRUCTION,
+    nlist: int = IVF_NLIST,
+    pq_m: int = PQ_M,
+    pq_nbits: int = PQ_NBITS,
+) -> faiss.Index:
+    """
+    Builds (and trains, when needed) an inner-product index over `embeds`.
+
+    Args:
+        embeds (np.ndarray): The (n, d) embeddings to index.
+        index_type (str): One of "flat", "hnsw", "ivf_flat" or "ivf_pq".
+        storage (str): One of "float32", "float16" or "pq". Ignored by
+            "ivf_pq", which always stores PQ codes.
+        hnsw_m (int): Neighbors per node of the HNSW graph.
+        ef_construction (int): Candidate list size while building the graph.
+        nlist (int): Number of IVF cells; 0 picks 4 * sqrt(n).
+        pq_m (int): Number of PQ sub-quantizers; must divide d.
+        pq_nbits (int): Bits per PQ sub-quantizer code.
+
+    Returns:
+        The faiss index. IVF falls back to a flat index and PQ to float16
+        when there are too few embeddings to train them.
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unsupported managed index type: {index_type}")
+    if storage not in STORAGE_TYPES:
+        raise ValueError(f"Unsupported managed index storage: {storage}")
+
+    embeds = np.ascontiguousarray(embeds, dtype=np.float32)
+    n, d = embeds.shape
+    metric = faiss.METRIC_INNER_PRODUCT
+
+    if index_type == "ivf_pq":
+        index_type, storage = "ivf_flat", "pq"
+    if index_type == "hnsw" and storage == "pq":
+        logger.warning("HNSW does not support PQ storage, using float16")
+        storage = "float16"
+    if storage == "pq" and (d % pq_m != 0 or n < 2**pq_nbits):
+        logger.warning(
+            f"Cannot train PQ (d={d}, m={pq_m}) on {n} embeddings, using float16"
+        )
+        storage = "float16"
+    if index_type == "ivf_flat" and n < MIN_POINTS_PER_CENTROID:
+        logger.warning(f"Cannot train IVF on {n} embeddings, using a flat index")
+        index_type = "flat"
+
+    fp16 = faiss.ScalarQuantizer.QT_fp16
+    match index_type, storage:
+        case "flat", "float32":
+            index = faiss.IndexFlatIP(d)
+        case "flat", "float16":
+            index = faiss.IndexScalarQuantizer(d, fp16, metric)
+        case "flat", "pq":
+            index = faiss.IndexPQ(d, pq_m, pq_nbits, metric)
+        case "hnsw", "float32":
+            index = faiss.IndexHNSWFlat(d, hnsw_m, metric)
+        case "hnsw", "float16":
+            index = faiss.IndexHNSWSQ(d, fp16, hnsw_m, metric)
+        case "ivf_flat", "float32":
+            quantizer = faiss.IndexFlatIP(d)
+            index = faiss.IndexIVFFlat(quantizer, d, _nlist(n, nlist), metric)
+        case "ivf_flat", "float16":
+            quantizer = faiss.IndexFlatIP(d)
+            index = faiss.IndexIVFScalarQuantizer(
+                quantizer, d, _nlist(n, nlist), fp16, metric
+            )
+        case "ivf_flat", "pq":
+            quantizer = faiss.IndexFlatIP(d)
+            index = faiss.IndexIVFPQ(
+                quantizer, d, _nlist(n, nlist), pq_m, pq_nbits, metric
+            )
+
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efConstruction = ef_construction
+
+    if not index.is_trained:
+        index.train(embeds)
+    index.add(embeds)
+    configure_search(index)
+    return index
+
+
+def configure_search(
+    index: faiss.Index, ef_search: int = HNSW_EF_SEARCH, nprobe: int = IVF_NPROBE
+) -> faiss.Index:
+    """Applies the search-time parameters, which are not persisted with the index."""
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = ef_search
+    elif isinstance(index, faiss.IndexIVF):
+        index.nprobe = min(nprobe, index.nlist)
+    return index
+
+
+def search_parameters(
+    index: faiss.Index, selector: faiss.IDSelector
+) -> faiss.SearchParameters:
+    """
+    Search parameters restricting `index.search` to the ids of `selector`.
+
+    IVF and HNSW indexes reject generic parameters, and the specific ones
+    replace the index's own nprobe / efSearch, so those are carried over.
+    """
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    if isinstance(index, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=index.nprobe)
+    if isinstance(index, faiss.IndexPQ):
+        raise ValueError("IndexPQ does not support id selectors")
+    return faiss.SearchParameters(sel=selector)
+
+
+def filtered_search(
+    index: faiss.Index,
+    queries: np.ndarray,
+    k: int,
+    selector: FilterSelector | None = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    `index.search`, restricted to the ids of `selector` when given.
+
+    The selector is applied inside the faiss search, except with `IndexPQ`
+    (flat index with PQ storage), which rejects selectors: it is searched for
+    more neighbors, doubled until k of them match or the whole index is
+    searched, which are then post-filtered.
+
+    Returns:
+        The (distances, ids) arrays of `index.search`, padded with -1 ids.
+    """
+    if selector is None:
+        return index.search(queries, k)
+    if not isinstance(index, faiss.IndexPQ):
+        return index.search(queries, k, params=search_parameters(index, selector.sel))
+
+    fill = -np.inf if index.metric_type == faiss.METRIC_INNER_PRODUCT else np.inf
+    distances_out = np.full((len(queries), k), fill, dtype=np.float32)
+    indices_out = np.full((len(queries), k), -1, dtype=np.int64)
+    if selector.count == 0:
+        return distances_out, indices_out
+
+    # enough neighbors for k matches if the selected ids were spread evenly
+    n = index.ntotal
+    k_search = min(n, max(k, math.ceil(2 * k * n / selector.count)))
+    while True:
+        distances, indices = index.search(queries, k_search)
+        keep = indices >= 0
+        keep[keep] = selector.mask[indices[keep]]
+        if k_search >= n or (keep.sum(axis=1) >= k).all():
+            break
+        k_search = min(n, 2 * k_search)
+
+    for row in range(len(queries)):
+        kept = np.flatnonzero(keep[row])[:k]
+        distances_out[row, : len(kept)] = distances[row, kept]
+        indices_out[row, : len(kept)] = indices[row, kept]
+    return distances_out, indices_out
+
+
+def index_type_of(index: faiss.Index) -> str:
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf_flat"
+    return "flat"
+
+
+def storage_of(index: faiss.Index) -> str:
+    if isinstance(index, faiss.IndexHNSW):
+        index = faiss.downcast_index(index.storage)
+    if isinstance(index, (faiss.IndexPQ, faiss.IndexIVFPQ)):
+        return "pq"
+    if isinstance(index, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return "float16"
+    return "float32"
+
+
+def serialize_index(index: faiss.Index) -> np.ndarray:
+    return faiss.serialize_index(index)
+
+
+def deserialize_index(data: np.ndarray) -> faiss.Index:
+    return configure_search(faiss.deserialize_index(np.asarray(data, dtype=np.uint8)))
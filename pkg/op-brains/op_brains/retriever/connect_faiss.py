@@ -1,8 +1,6 @@
 from typing import Tuple
 import os
 
-from langchain_community.vectorstores import FAISS
-
 from op_brains.config import DB_STORAGE_PATH, EMBEDDING_MODEL
 import asyncio
 from op_brains.chat.apis import access_APIs
@@ -10,30 +8,76 @@ from op_brains.chat.apis import access_APIs
 from typing import Optional
 import time
 from op_data.sources.incremental_indexer import IncrementalIndexerService
+from op_brains.retriever.sharded import ShardedRetriever
+from op_brains.exceptions import OpChatBrainsException, UnsupportedVectorstoreError
 from op_core.logger import get_logger
 from aiocache import cached
 
 logger = get_logger(__name__)
 
+# the retriever loaded last; loading the indexes again swaps its shards, so it
+# keeps one search thread pool instead of leaving one behind on every load
+_retriever: ShardedRetriever | None = None
+
 
 @cached(ttl=60 * 60 * 24)
-async def load_faiss_indexes(vectorstore: str = "faiss") -> FAISS:
+async def load_faiss_indexes(vectorstore: str = "faiss") -> ShardedRetriever:
+    global _retriever
     if vectorstore == "faiss":
         embeddings = access_APIs.get_embedding(EMBEDDING_MODEL)
-        loaded_dbs = await IncrementalIndexerService.load_faiss_indexes(embeddings)
-
-        merged_db = None
-        for key, faiss_index in loaded_dbs.items():
-            if merged_db is None:
-                merged_db = faiss_index
-            else:
-                try:
-                    merged_db.merge_from(faiss_index)
-                except Exception as e:
-                    logger.error(f"Failed to merge faiss databases")
-                    raise e
-
-        logger.info(f"Successfully merged faiss databases")
-
-        return merged_db
-    raise ValueError(f"Unsupported vectorstore: {vectorstore}")
+        loaded_dbs = await IncrementalIndexerService.load_faiss_indexes(
+            embeddings, mmap=True
+        )
+        if not loaded_dbs:
+            # raised, not cached, so the next call looks for indexes again
+            raise OpChatBrainsException("No faiss indexes have been saved")
+
+        # the stores (documentation and one per summary category) are kept as
+        # separate shards rather than merged into one index
+        if _retriever is None:
+            _retriever = ShardedRetriever(loaded_dbs)
+        else:
+            for name in set(_retriever.shards) - set(loaded_dbs):
+                _retriever.remove_shard(name)
+            for name, store in loaded_dbs.items():
+                _retriever.reload_shard(name, store)
+        logger.info(f"Successfully loaded {len(_retriever)} faiss shards")
+
+        return _retriever
+    raise UnsupportedVectorstoreError(f"Unsupported vectorstore: {vectorstore}")
+
+
+async def reload_faiss_shard(name: str) -> bool:
+    """
+    Reloads one shard of the loaded retriever from the latest saved indexes,
+    leaving the other shards untouched. Called for each store saved by
+    `IncrementalIndexerService.acquire_and_save`.
+
+    Returns:
+        Whether the shard was found and reloaded; a shard missing from the
+        latest indexes is removed.
+    """
+    db = await load_faiss_indexes()
+
+    embeddings = access_APIs.get_embedding(EMBEDDING_MODEL)
+    loaded_dbs = await IncrementalIndexerService.load_faiss_indexes(
+        embeddings, mmap=True, names=[name]
+    )
+    if name not in loaded_dbs:
+        db.remove_shard(name)
+        return False
+
+    db.reload_shard(name, loaded_dbs[name])
+    return True
+
+
+async def close_faiss_indexes():
+    """
+    Shuts the search threads of the loaded retriever down, e.g. when the app
+    stops; the next `load_faiss_indexes` reads the indexes again.
+    """
+    global _retriever
+    await load_faiss_indexes.cache.clear()
+    if _retriever is not None:
+        _retriever.close()
+        _retriever = None
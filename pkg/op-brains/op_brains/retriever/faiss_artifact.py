@@ -0,0 +1,114 @@
+import os
+import json
+import zlib
+import pickle
+from typing import Dict, List
+
+import faiss
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from op_brains.documents.records import drop_lazy_metadata
+
+MANIFEST = "manifest.json"
+FORMAT_VERSION = 1
+
+# faiss >= 1.10 only maps flat indexes (IndexFlatCodes) with IO_FLAG_MMAP_IFC
+MMAP_FLAGS = faiss.IO_FLAG_MMAP | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+
+
+def write_faiss_artifact(stores: Dict[str, FAISS], directory: str) -> dict:
+    """
+    Writes FAISS stores as a binary artifact: per store, a native faiss index
+    file and a compact docstore, plus a manifest listing them.
+
+    The docstore is a zlib-compressed pickle of (id, page_content, metadata)
+    tuples in index order, which is all that is needed to rebuild the store.
+
+    Args:
+        stores (Dict[str, FAISS]): The stores to write, by name.
+        directory (str): Directory to write the files to.
+
+    Returns:
+        The manifest.
+    """
+    os.makedirs(directory, exist_ok=True)
+    manifest = {"version": FORMAT_VERSION, "shards": {}}
+    for name, store in stores.items():
+        index_file, docstore_file = f"{name}.faiss", f"{name}.docstore"
+        faiss.write_index(store.index, os.path.join(directory, index_file))
+
+        ids = [store.index_to_docstore_id[i] for i in range(store.index.ntotal)]
+        documents = [store.docstore.search(id) for id in ids]
+        records = [(id, d.page_content, d.metadata) for id, d in zip(ids, documents)]
+        with open(os.path.join(directory, docstore_file), "wb") as f:
+            f.write(zlib.compress(pickle.dumps(records, protocol=5)))
+
+        manifest["shards"][name] = {
+            "index": index_file,
+            "docstore": docstore_file,
+            "ntotal": store.index.ntotal,
+            "dimension": store.index.d,
+        }
+
+    with open(os.path.join(directory, MANIFEST), "w") as f:
+        json.dump(manifest, f)
+    return manifest
+
+
+def artifact_files(manifest: dict) -> List[str]:
+    return [
+        file
+        for shard in manifest["shards"].values()
+        for file in (shard["index"], shard["docstore"])
+    ]
+
+
+def read_faiss_artifact(
+    directory: str,
+    embeddings: Embeddings,
+    mmap: bool = True,
+    names: List[str] | None = None,
+) -> Dict[str, FAISS]:
+    """
+    Opens the stores of a binary artifact written by `write_faiss_artifact`,
+    or only the stores in `names`.
+
+    With `mmap`, the faiss indexes are memory-mapped read-only, so processes
+    opening the same files share the page cache instead of each holding a
+    private copy; they must not be modified. Without it they are read into
+    memory and can be updated.
+
+    Metadata loaded on demand (the whole thread of older summaries) is
+    dropped from the documents.
+    """
+    with open(os.path.join(directory, MANIFEST)) as f:
+        manifest = json.load(f)
+    if manifest["version"] != FORMAT_VERSION:
+        raise ValueError(f"Unsupported faiss artifact version: {manifest['version']}")
+
+    io_flags = MMAP_FLAGS | faiss.IO_FLAG_READ_ONLY if mmap else 0
+    stores = {}
+    for name, shard in manifest["shards"].items():
+        if names is not None and name not in names:
+            continue
+        index = faiss.read_index(os.path.join(directory, shard["index"]), io_flags)
+
+        with open(os.path.join(directory, shard["docstore"]), "rb") as f:
+            records = pickle.loads(zlib.decompress(f.read()))
+        docstore = InMemoryDocstore(
+            {
+                id: Document(
+                    page_content=page_content,
+                    metadata=drop_lazy_metadata(metadata),
+                    id=id,
+                )
+                for id, page_content, metadata in records
+            }
+        )
+        index_to_docstore_id = {i: record[0] for i, record in enumerate(records)}
+
+        stores[name] = FAISS(embeddings, index, docstore, index_to_docstore_id)
+    return stores
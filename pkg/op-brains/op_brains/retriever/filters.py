@@ -0,0 +1,166 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterable, List, Tuple
+
+import faiss
+import numpy as np
+import pandas as pd
+
+# filter masks kept per shard; queries mostly reuse a handful of filters
+MASK_CACHE_SIZE = 64
+
+
+def _as_tuple(values: str | Iterable[str] | None) -> Tuple[str, ...] | None:
+    if values is None:
+        return None
+    if isinstance(values, str):
+        return (values,)
+    return tuple(sorted(values))
+
+
+def _timestamp(value) -> float:
+    """Seconds since the epoch of a datetime or ISO string, NaN when unknown."""
+    if value is None:
+        return np.nan
+    ts = pd.to_datetime(value, utc=True, errors="coerce")
+    return np.nan if pd.isna(ts) else ts.timestamp()
+
+
+@dataclass(frozen=True)
+class MetadataFilter:
+    """
+    Restricts a vector search to the contexts whose metadata match every
+    given condition.
+
+    Contexts without a `last_posted_at` (e.g. documentation fragments) never
+    match a date range.
+    """
+
+    type_db_info: Tuple[str, ...] | None = None
+    category_name: Tuple[str, ...] | None = None
+    posted_after: float | None = None
+    posted_before: float | None = None
+
+    @classmethod
+    def create(
+        cls,
+        type_db_info: str | Iterable[str] | None = None,
+        category_name: str | Iterable[str] | None = None,
+        posted_after: datetime | str | None = None,
+        posted_before: datetime | str | None = None,
+    ) -> "MetadataFilter | None":
+        """Builds a hashable filter, or None when no condition is given."""
+        metadata_filter = cls(
+            type_db_info=_as_tuple(type_db_info),
+            category_name=_as_tuple(category_name),
+            posted_after=None if posted_after is None else _timestamp(posted_after),
+            posted_before=None if posted_before is None else _timestamp(posted_before),
+        )
+        return None if metadata_filter == cls() else metadata_filter
+
+
+class ShardMetadata:
+    """
+    Columnar copy of the metadata used by `MetadataFilter`, aligned with the
+    positions of a faiss index, from which filters become `IDSelectorBitmap`s
+    applied inside the faiss search.
+    """
+
+    def __init__(self, metadatas: List[dict]):
+        self.ntotal = len(metadatas)
+        self.types, self.type_codes = self._encode(
+            [m.get("type_db_info") for m in metadatas]
+        )
+        self.categories, self.category_codes = self._encode(
+            [m.get("category_name") for m in metadatas]
+        )
+        posted = pd.to_datetime(
+            pd.Series([m.get("last_posted_at") for m in metadatas], dtype=object),
+            utc=True,
+            errors="coerce",
+            format="mixed",
+        )
+        # seconds since the epoch, NaN when unknown
+        self.last_posted_at = (
+            (posted - pd.Timestamp(0, tz="UTC")).dt.total_seconds().to_numpy()
+        )
+
+        self._masks: OrderedDict = OrderedDict()
+
+    @staticmethod
+    def _encode(values: List[str | None]) -> Tuple[Dict[str, int], np.ndarray]:
+        vocabulary: Dict[str, int] = {}
+        codes = np.fromiter(
+            (
+                -1 if v is None else vocabulary.setdefault(v, len(vocabulary))
+                for v in values
+            ),
+            dtype=np.int32,
+            count=len(values),
+        )
+        return vocabulary, codes
+
+    @classmethod
+    def from_store(cls, store) -> "ShardMetadata":
+        """Reads the metadata of a langchain FAISS store in index order."""
+        return cls(
+            [
+                store.docstore.search(store.index_to_docstore_id[i]).metadata
+                for i in range(store.index.ntotal)
+            ]
+        )
+
+    @staticmethod
+    def _isin(vocabulary: Dict[str, int], codes: np.ndarray, values) -> np.ndarray:
+        wanted = [vocabulary[v] for v in values if v in vocabulary]
+        return np.isin(codes, wanted)
+
+    def mask(self, metadata_filter: MetadataFilter) -> np.ndarray:
+        """Boolean mask of the index positions matching the filter."""
+        mask = np.ones(self.ntotal, dtype=bool)
+        if metadata_filter.type_db_info is not None:
+            mask &= self._isin(
+                self.types, self.type_codes, metadata_filter.type_db_info
+            )
+        if metadata_filter.category_name is not None:
+            mask &= self._isin(
+                self.categories, self.category_codes, metadata_filter.category_name
+            )
+        # NaN compares False, so undated contexts drop out of date ranges
+        if metadata_filter.posted_after is not None:
+            mask &= self.last_posted_at >= metadata_filter.posted_after
+        if metadata_filter.posted_before is not None:
+            mask &= self.last_posted_at <= metadata_filter.posted_before
+        return mask
+
+    def selector(self, metadata_filter: MetadataFilter) -> "FilterSelector":
+        """The cached `FilterSelector` of a filter."""
+        selector = self._masks.get(metadata_filter)
+        if selector is None:
+            selector = FilterSelector(self.mask(metadata_filter))
+            self._masks[metadata_filter] = selector
+            if len(self._masks) > MASK_CACHE_SIZE:
+                self._masks.popitem(last=False)
+        return selector
+
+
+class FilterSelector:
+    """A filter mask as a faiss `IDSelectorBitmap`, with its match count."""
+
+    def __init__(self, mask: np.ndarray):
+        self.mask = mask
+        self.count = int(mask.sum())
+        self.ntotal = len(mask)
+        # faiss reads bit i as (bitmap[i >> 3] >> (i & 7)) & 1; the selector
+        # only holds a pointer, so the bitmap must outlive it
+        self.bitmap = np.packbits(mask, bitorder="little")
+        self.sel = faiss.IDSelectorBitmap(self.ntotal, faiss.swig_ptr(self.bitmap))
+
+    @property
+    def selects_all(self) -> bool:
+        return self.count == self.ntotal
+
+    @property
+    def selects_none(self) -> bool:
+        return self.count == 0
@@ -0,0 +1,190 @@
+import io
+import re
+import json
+from typing import Callable, Dict, Hashable, Iterable, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """
+    Okapi BM25 inverted index over the contexts, keyed by url.
+
+    Postings are stored as flat arrays (CSR layout): the postings of the term
+    `terms[i]` are `doc_ids[offsets[i]:offsets[i + 1]]`, with the term
+    frequencies in `term_freqs` at the same positions.
+    """
+
+    def __init__(
+        self,
+        urls: List[str],
+        terms: List[str],
+        offsets: np.ndarray,
+        doc_ids: np.ndarray,
+        term_freqs: np.ndarray,
+        doc_lens: np.ndarray,
+        k1: float = 1.5,
+        b: float = 0.75,
+    ):
+        self.urls = urls
+        self.terms = {term: i for i, term in enumerate(terms)}
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.term_freqs = term_freqs
+        self.doc_lens = doc_lens
+        self.k1 = k1
+        self.b = b
+
+        n_docs = len(urls)
+        doc_freqs = np.diff(offsets)
+        self.idf = np.log(1 + (n_docs - doc_freqs + 0.5) / (doc_freqs + 0.5))
+        avg_len = doc_lens.mean() if n_docs else 1.0
+        # per-document part of the BM25 denominator
+        self.len_norm = k1 * (1 - b + b * doc_lens / max(avg_len, 1e-9))
+
+    def __len__(self) -> int:
+        return len(self.urls)
+
+    @classmethod
+    def build(
+        cls, documents: Iterable[Tuple[str, str]], k1: float = 1.5, b: float = 0.75
+    ) -> "BM25Index":
+        """
+        Builds the index from (url, text) pairs; a repeated url keeps its
+        first text.
+        """
+        urls, postings, doc_lens, seen = [], {}, [], set()
+        for url, text in documents:
+            if url in seen:
+                continue
+            seen.add(url)
+
+            doc_id = len(urls)
+            urls.append(url)
+            tokens = tokenize(text)
+            doc_lens.append(len(tokens))
+            counts: Dict[str, int] = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, count in counts.items():
+                postings.setdefault(token, []).append((doc_id, count))
+
+        terms = sorted(postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(postings[t]) for t in terms])
+        flat = [p for t in terms for p in postings[t]]
+        doc_ids = np.array([d for d, _ in flat], dtype=np.int32)
+        term_freqs = np.array([c for _, c in flat], dtype=np.float32)
+
+        return cls(
+            urls,
+            terms,
+            offsets,
+            doc_ids,
+            term_freqs,
+            np.array(doc_lens, dtype=np.float32),
+            k1=k1,
+            b=b,
+        )
+
+    @classmethod
+    def from_dataframe(cls, contexts_df: pd.DataFrame, **kwargs) -> "BM25Index":
+        """Indexes the title and content of the contexts of `contexts_df`."""
+
+        def text(document) -> str:
+            title = document.metadata.get("thread_title") or ""
+            return f"{title}\n{document.page_content}"
+
+        return cls.build(
+            (
+                (url, text(c))
+                for url, c in zip(contexts_df["url"], contexts_df["content"])
+            ),
+            **kwargs,
+        )
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """
+        Returns the `k` best matching urls for `query`, with their scores.
+        """
+        scores = np.zeros(len(self.urls), dtype=np.float32)
+        for token in set(tokenize(query)):
+            i = self.terms.get(token)
+            if i is None:
+                continue
+            start, end = self.offsets[i], self.offsets[i + 1]
+            ids = self.doc_ids[start:end]
+            tf = self.term_freqs[start:end]
+            scores[ids] += self.idf[i] * tf * (self.k1 + 1) / (tf + self.len_norm[ids])
+
+        matches = np.flatnonzero(scores)
+        if len(matches) > k:
+            matches = matches[np.argpartition(-scores[matches], k)[:k]]
+        matches = matches[np.argsort(-scores[matches], kind="stable")]
+        return [(self.urls[i], float(scores[i])) for i in matches]
+
+    def to_bytes(self) -> Tuple[str, bytes]:
+        """Serializes the index into a JSON document and a compressed npz."""
+        terms = sorted(self.terms, key=self.terms.get)
+        json_data = json.dumps(
+            {"urls": self.urls, "terms": terms, "k1": self.k1, "b": self.b}
+        )
+        buffer = io.BytesIO()
+        np.savez_compressed(
+            buffer,
+            offsets=self.offsets,
+            doc_ids=self.doc_ids,
+            term_freqs=self.term_freqs,
+            doc_lens=self.doc_lens,
+        )
+        return json_data, buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, json_data: str | bytes, npz_data: bytes) -> "BM25Index":
+        meta = json.loads(json_data)
+        arrays = np.load(io.BytesIO(npz_data))
+        return cls(
+            meta["urls"],
+            meta["terms"],
+            arrays["offsets"],
+            arrays["doc_ids"],
+            arrays["term_freqs"],
+            arrays["doc_lens"],
+            k1=meta["k1"],
+            b=meta["b"],
+        )
+
+
+def reciprocal_rank_fusion(
+    rankings: List[List], key: Callable[[object], Hashable], k: int = 60
+) -> List:
+    """
+    Fuses rankings with reciprocal-rank fusion: each item scores the sum of
+    1 / (k + rank) over the rankings it appears in.
+
+    Args:
+        rankings (List[List]): Ranked lists of items, best first.
+        key (Callable): Identifies an item across rankings (e.g. its url).
+        k (int): Damping constant; larger values flatten the rank differences.
+
+    Returns:
+        The items of every ranking, best fused score first. An item found in
+        several rankings is returned once, as first seen.
+    """
+    scores: Dict[Hashable, float] = {}
+    items: Dict[Hashable, object] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            item_key = key(item)
+            items.setdefault(item_key, item)
+            scores[item_key] = scores.get(item_key, 0.0) + 1.0 / (k + rank)
+
+    ordered = sorted(scores, key=scores.get, reverse=True)
+    return [items[item_key] for item_key in ordered]
@@ -0,0 +1,111 @@
+import json
+from typing import Callable, Dict, Iterable, List, Mapping, Tuple
+
+import numpy as np
+
+FORMAT_VERSION = 1
+
+
+class ManagedIndexTable:
+    """
+    The key -> urls mapping of a managed index (questions or keywords), with
+    one row per key aligned with the rows of its embeddings.
+
+    Each distinct url is stored once in `urls`, and the rows reference them by
+    integer id in CSR layout: the urls of row `i` are
+    `urls[indices[indptr[i]:indptr[i + 1]]]`, in ranking order.
+    """
+
+    def __init__(
+        self,
+        keys: List[str],
+        urls: List[str],
+        indptr: np.ndarray,
+        indices: np.ndarray,
+    ):
+        self.keys = keys
+        self.urls = urls
+        self.indptr = indptr
+        self.indices = indices
+        self._rows: Dict[str, int] | None = None
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @classmethod
+    def from_dict(cls, index: Mapping[str, List[str]]) -> "ManagedIndexTable":
+        """Converts the `{key: [url, ...]}` form, keeping the key order."""
+        url_ids: Dict[str, int] = {}
+        indices = np.fromiter(
+            (
+                url_ids.setdefault(url, len(url_ids))
+                for urls in index.values()
+                for url in urls
+            ),
+            dtype=np.int32,
+        )
+        indptr = np.zeros(len(index) + 1, dtype=np.int64)
+        np.cumsum([len(urls) for urls in index.values()], out=indptr[1:])
+        return cls(list(index), list(url_ids), indptr, indices)
+
+    def to_dict(self) -> Dict[str, List[str]]:
+        return {key: self.urls_of([row]) for row, key in enumerate(self.keys)}
+
+    def to_bytes(self) -> Tuple[str, Dict[str, np.ndarray]]:
+        """
+        Serializes the table into a JSON document with the keys and the url
+        table, and the CSR arrays to store in the npz of the embeddings.
+        """
+        json_data = json.dumps(
+            {"version": FORMAT_VERSION, "keys": self.keys, "urls": self.urls}
+        )
+        return json_data, {"url_indptr": self.indptr, "url_indices": self.indices}
+
+    @staticmethod
+    def is_table(meta: dict) -> bool:
+        # a legacy {key: [url, ...]} document never has an int "version"
+        return isinstance(meta.get("version"), int) and "keys" in meta
+
+    @classmethod
+    def from_bytes(
+        cls, json_data: str | bytes, arrays: Mapping[str, np.ndarray]
+    ) -> "ManagedIndexTable":
+        """
+        Loads a table saved with `to_bytes`, or converts a legacy
+        `{key: [url, ...]}` JSON document.
+        """
+        meta = json.loads(json_data)
+        if not cls.is_table(meta):
+            return cls.from_dict(meta)
+        if meta["version"] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported managed index version: {meta['version']}")
+        return cls(
+            meta["keys"],
+            meta["urls"],
+            np.asarray(arrays["url_indptr"], dtype=np.int64),
+            np.asarray(arrays["url_indices"], dtype=np.int32),
+        )
+
+    def row(self, key: str) -> int | None:
+        if self._rows is None:
+            self._rows = {key: row for row, key in enumerate(self.keys)}
+        return self._rows.get(key)
+
+    def urls_of(self, rows: Iterable[int]) -> List[str]:
+        """The urls of `rows`, row after row, as stored."""
+        indptr, indices, urls = self.indptr, self.indices, self.urls
+        return [
+            urls[i]
+            for row in rows
+            for i in indices[indptr[row] : indptr[row + 1]].tolist()
+        ]
+
+    def rows_with_urls(self, predicate: Callable[[str], bool]) -> np.ndarray:
+        """Boolean mask of the rows with at least one url matching `predicate`."""
+        url_mask = np.fromiter(
+            (predicate(url) for url in self.urls), dtype=bool, count=len(self.urls)
+        )
+        # matches up to each position, so a row's count is a difference
+        matches = np.zeros(len(self.indices) + 1, dtype=np.int64)
+        np.cumsum(url_mask[self.indices], out=matches[1:])
+        return matches[self.indptr[1:]] > matches[self.indptr[:-1]]
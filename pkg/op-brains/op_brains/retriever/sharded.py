@@ -0,0 +1,251 @@
+import heapq
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Tuple
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_core.documents import Document
+
+from op_brains.config import (
+    SHARD_SEARCH_THREADS,
+    SHARD_ROUTING_TOP_N,
+    SHARD_PRIORS,
+    SHARD_ALWAYS_SEARCH,
+)
+from op_brains.retriever.ann import filtered_search
+from op_brains.retriever.filters import FilterSelector, MetadataFilter, ShardMetadata
+from op_core.logger import get_logger
+
+logger = get_logger(__name__)
+
+# vectors read at once when computing a shard centroid
+CENTROID_CHUNK = 4096
+
+
+def shard_centroid(store: FAISS) -> np.ndarray | None:
+    index = store.index
+    if index.ntotal == 0:
+        return None
+    try:
+        total = np.zeros(index.d, dtype=np.float64)
+        for start in range(0, index.ntotal, CENTROID_CHUNK):
+            n = min(CENTROID_CHUNK, index.ntotal - start)
+            total += index.reconstruct_n(start, n).sum(axis=0)
+    except RuntimeError:
+        # indexes that cannot reconstruct their vectors are never routed away
+        return None
+    norm = np.linalg.norm(total)
+    return (total / norm).astype(np.float32) if norm > 0 else None
+
+
+class Shard(NamedTuple):
+    store: FAISS
+    centroid: np.ndarray | None
+    metadata: ShardMetadata
+
+
+class ShardedRetriever:
+    """
+    Vector search over separate FAISS stores (e.g. the documentation and one
+    summary store per forum category) instead of one merged index.
+
+    Shards are searched in parallel in a thread pool (faiss releases the GIL)
+    and their results merged into the global top-k. With `routing_top_n`, a
+    query only searches the shards whose centroid, plus their prior, is
+    closest to it, and the `always_search` shards. Shards can be replaced one
+    at a time with `reload_shard`.
+
+    Searches can be restricted with a `MetadataFilter`, applied inside the
+    faiss search as an id selector, so each shard still returns its k best
+    matching contexts; shards without any match are not searched.
+    """
+
+    def __init__(
+        self,
+        stores: Dict[str, FAISS],
+        max_workers: int = SHARD_SEARCH_THREADS,
+        routing_top_n: int = SHARD_ROUTING_TOP_N,
+        priors: Dict[str, float] = SHARD_PRIORS,
+        always_search: List[str] = SHARD_ALWAYS_SEARCH,
+    ):
+        self.routing_top_n = routing_top_n
+        self.priors = priors
+        self.always_search = set(always_search)
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="faiss-shard"
+        )
+        self.shards: Dict[str, Shard] = {}
+        for name, store in stores.items():
+            self.reload_shard(name, store)
+
+    def __len__(self) -> int:
+        return len(self.shards)
+
+    @property
+    def stores(self) -> Dict[str, FAISS]:
+        return {name: shard.store for name, shard in self.shards.items()}
+
+    @property
+    def embedding_function(self):
+        return next(iter(self.shards.values())).store.embedding_function
+
+    def reload_shard(self, name: str, store: FAISS):
+        """Adds or replaces a shard; searches already running keep the old one."""
+        shard = Shard(
+            store=store,
+            centroid=shard_centroid(store) if self.routing_top_n > 0 else None,
+            metadata=ShardMetadata.from_store(store),
+        )
+        # replaced, not mutated, so concurrent searches see a consistent set
+        self.shards = {**self.shards, name: shard}
+        logger.info(f"Loaded faiss shard {name} ({store.index.ntotal} vectors)")
+
+    def remove_shard(self, name: str):
+        self.shards = {k: v for k, v in self.shards.items() if k != name}
+
+    def close(self):
+        """Shuts the search threads down; no search can run afterwards."""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def route(
+        self,
+        embedding: List[float],
+        shards: Dict[str, Shard] | None = None,
+    ) -> List[str]:
+        shards = self.shards if shards is None else shards
+        if self.routing_top_n <= 0 or len(shards) <= self.routing_top_n:
+            return list(shards)
+
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+
+        routable, routed = [], []
+        for name, shard in shards.items():
+            if name in self.always_search or shard.centroid is None:
+                routed.append(name)
+            else:
+                score = float(shard.centroid @ query) + self.priors.get(name, 0.0)
+                routable.append((score, name))
+
+        best = heapq.nlargest(self.routing_top_n, routable)
+        return routed + [name for _, name in best]
+
+    def _plan(
+        self,
+        embedding: List[float],
+        names: List[str] | None,
+        metadata_filter: MetadataFilter | None,
+    ) -> List[Tuple[FAISS, FilterSelector | None]]:
+        """The shards to search, each with the selector of the filter, if any."""
+        shards = self.shards
+        if names is not None:
+            shards = {name: shards[name] for name in names if name in shards}
+
+        selectors = {}
+        if metadata_filter is not None:
+            for name, shard in shards.items():
+                selector = shard.metadata.selector(metadata_filter)
+                if not selector.selects_none:
+                    selectors[name] = None if selector.selects_all else selector
+            shards = {name: shards[name] for name in selectors}
+
+        if names is None:
+            names = self.route(embedding, shards)
+        return [(shards[name].store, selectors.get(name)) for name in names]
+
+    def _search_shard(
+        self,
+        store: FAISS,
+        embedding: List[float],
+        k: int,
+        selector: FilterSelector | None = None,
+    ) -> List[Tuple[Document, float]]:
+        if selector is None:
+            return store.similarity_search_with_score_by_vector(embedding, k=k)
+
+        vector = np.array([embedding], dtype=np.float32)
+        if store._normalize_L2:
+            faiss.normalize_L2(vector)
+        scores, indices = filtered_search(
+            store.index, vector, min(k, selector.count), selector
+        )
+        return [
+            (store.docstore.search(store.index_to_docstore_id[i]), float(score))
+            for i, score in zip(indices[0], scores[0])
+            if i >= 0
+        ]
+
+    def _merge(
+        self, results: List[List[Tuple[Document, float]]], k: int
+    ) -> List[Document]:
+        candidates = [r for shard_results in results for r in shard_results]
+        if not candidates:
+            return []
+        strategy = next(iter(self.shards.values())).store.distance_strategy
+        if strategy == DistanceStrategy.MAX_INNER_PRODUCT:
+            best = heapq.nlargest(k, candidates, key=lambda r: r[1])
+        else:
+            best = heapq.nsmallest(k, candidates, key=lambda r: r[1])
+        return [document for document, _ in best]
+
+    def similarity_search_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        shards: List[str] | None = None,
+        metadata_filter: MetadataFilter | None = None,
+    ) -> List[Document]:
+        """
+        The k contexts closest to `embedding` across the shards.
+
+        Args:
+            embedding (List[float]): The query embedding.
+            k (int): Number of contexts to return.
+            shards (List[str], optional): Search only these shards instead
+                of the routed ones.
+            metadata_filter (MetadataFilter, optional): Only return contexts
+                matching it.
+
+        Returns:
+            The contexts, closest first.
+        """
+        futures = [
+            self.executor.submit(self._search_shard, store, embedding, k, selector)
+            for store, selector in self._plan(embedding, shards, metadata_filter)
+        ]
+        return self._merge([f.result() for f in futures], k)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs) -> List[Document]:
+        embedding = self.embedding_function.embed_query(query)
+        return self.similarity_search_by_vector(embedding, k=k, **kwargs)
+
+    async def asimilarity_search_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        shards: List[str] | None = None,
+        metadata_filter: MetadataFilter | None = None,
+    ) -> List[Document]:
+        """Like `similarity_search_by_vector`, without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(
+            *[
+                loop.run_in_executor(
+                    self.executor, self._search_shard, store, embedding, k, selector
+                )
+                for store, selector in self._plan(embedding, shards, metadata_filter)
+            ]
+        )
+        return self._merge(results, k)
+
+    async def asimilarity_search(
+        self, query: str, k: int = 4, **kwargs
+    ) -> List[Document]:
+        embedding = await self.embedding_function.aembed_query(query)
+        return await self.asimilarity_search_by_vector(embedding, k=k, **kwargs)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
@@ -23,6 +23,9 @@ from tenacity import (
 )
 from voyageai.error import RateLimitError
 from voyageai.client import Client as VoyageClient
+from op_core.logger import get_logger
+
+logger = get_logger(__name__)
 
 reranker_voyager = VoyageAIRerank(model="rerank-1")
 lite_reranker_voyager = VoyageAIRerank(model="rerank-lite-1")
@@ -198,9 +201,13 @@ async def reorder_index(index_dict, updated_urls=[]):
             if any(
                 url in updated_urls for url in urls
             ):  # Check if the URLs are updated
-                contexts = all_contexts_df[
-                    all_contexts_df["url"].isin(urls)
-                ].content.tolist()
+                # the reranker only unwraps langchain documents
+                contexts = [
+                    context.to_document()
+                    for context in all_contexts_df[
+                        all_contexts_df["url"].isin(urls)
+                    ].content
+                ]
                 k = len(contexts)
                 if k > 1:
                     try:
@@ -209,8 +216,8 @@ async def reorder_index(index_dict, updated_urls=[]):
                             query=key, documents=contexts, check_count=check_count
                         )
                         urls = [context.metadata["url"] for context in contexts]
-                    except Exception as e:
-                        print(f"Keu: {key} Error: {str(e)}")
+                    except Exception:
+                        logger.exception(f"Reranking failed for key: {key}")
 
             return key, urls
 
@@ -10,12 +10,13 @@ from op_brains.summarizer.utils import Prompt, SummaryStructured
 
 
 async def get_thread_from_url(url: str) -> Document:
-    threads = await ForumPostsProcessingStrategy.get_threads_documents()
-
-    thread = next((t for t in threads if t.metadata["url"] == url), None)
-    if not thread:
+    threads = await ForumPostsProcessingStrategy.return_threads(urls=[url])
+    if not threads:
         raise OpChatBrainsException(f"Thread not found for URL: {url}")
-    return thread
+    str_thread, metadata = threads[0]
+    return Document(
+        page_content=str_thread, metadata=metadata, id=metadata["thread_id"]
+    )
 
 
 async def load_snapshot_proposals() -> Dict[str, Any]:
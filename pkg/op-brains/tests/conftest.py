@@ -0,0 +1,27 @@
+import os
+import re
+
+import pytest
+from tortoise import Tortoise
+from tortoise.utils import get_schema_sql
+
+# the API clients and the R2 config are created at import time
+for name in ("OPENAI_API_KEY", "ANTHROPIC_API_KEY", "VOYAGE_API_KEY"):
+    os.environ.setdefault(name, "test")
+os.environ.setdefault("R2_ENDPOINT_URL", "http://localhost:9000")
+
+# the tables the tests use; the full schema does not build on sqlite
+TABLES = re.compile(r'CREATE TABLE( IF NOT EXISTS)? "(RawTopic|Topic|TopicCategory)"')
+
+
+@pytest.fixture
+async def db():
+    await Tortoise.init(
+        db_url="sqlite://:memory:", modules={"models": ["op_data.db.models"]}
+    )
+    conn = Tortoise.get_connection("default")
+    for statement in get_schema_sql(conn, safe=False).split(";"):
+        if TABLES.search(statement):
+            await conn.execute_script(statement)
+    yield
+    await Tortoise.close_connections()
@@ -0,0 +1,64 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from op_brains.retriever.ann import (
+    INDEX_TYPES,
+    STORAGE_TYPES,
+    build_ann_index,
+    filtered_search,
+    index_type_of,
+    storage_of,
+)
+from op_brains.retriever.filters import FilterSelector
+
+N, D, K = 1024, 16, 10
+
+
+@pytest.fixture(scope="module")
+def embeds() -> np.ndarray:
+    rng = np.random.default_rng(0)
+    embeds = rng.standard_normal((N, D)).astype(np.float32)
+    return embeds / np.linalg.norm(embeds, axis=1, keepdims=True)
+
+
+@pytest.mark.parametrize(
+    "index_type, storage", list(itertools.product(INDEX_TYPES, STORAGE_TYPES))
+)
+def test_filtered_search(embeds, index_type, storage):
+    index = build_ann_index(embeds, index_type, storage, nlist=8, pq_m=4, pq_nbits=6)
+    mask = np.arange(N) % 3 == 0
+    queries = embeds[:4]
+
+    distances, indices = filtered_search(index, queries, K, FilterSelector(mask))
+
+    assert indices.shape == (len(queries), K)
+    assert mask[indices].all()
+    exact = np.argsort(-(embeds[mask] @ queries.T), axis=0)[:K].T
+    exact = np.flatnonzero(mask)[exact]
+    if (index_type_of(index), storage_of(index)) == ("flat", "float32"):
+        assert (indices == exact).all()
+    # the nearest selected neighbor of a selected query is itself
+    assert (indices[mask[:4], 0] == np.flatnonzero(mask[:4])).all()
+
+
+@pytest.mark.parametrize("storage", STORAGE_TYPES)
+def test_filtered_search_without_matches(embeds, storage):
+    index = build_ann_index(embeds, "flat", storage, pq_m=4, pq_nbits=6)
+    selector = FilterSelector(np.zeros(N, dtype=bool))
+
+    _, indices = filtered_search(index, embeds[:2], K, selector)
+
+    assert (indices == -1).all()
+
+
+def test_filtered_search_pads_when_few_ids_match(embeds):
+    index = build_ann_index(embeds, "flat", "pq", pq_m=4, pq_nbits=6)
+    mask = np.zeros(N, dtype=bool)
+    mask[[5, 500, 1000]] = True
+
+    _, indices = filtered_search(index, embeds[:1], K, FilterSelector(mask))
+
+    assert sorted(indices[0, :3]) == [5, 500, 1000]
+    assert (indices[0, 3:] == -1).all()
@@ -0,0 +1,200 @@
+import asyncio
+
+import pytest
+
+from op_brains.chat.cache import (
+    EmbeddingCache,
+    SemanticAnswerCache,
+    SingleFlight,
+    hash_key_terms,
+)
+
+ANSWER = {"answer": "It started.", "url_supporting": []}
+
+
+def test_answer_cache_hits_similar_questions_of_the_same_memory():
+    cache = SemanticAnswerCache(threshold=0.95)
+    cache.put([1.0, 0.0], memory_hash=1, answer=ANSWER)
+
+    assert cache.get([0.99, 0.05], memory_hash=1) == ANSWER
+    assert cache.get([0.0, 1.0], memory_hash=1) is None
+    assert cache.get([1.0, 0.0], memory_hash=2) is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_answer_cache_misses_questions_with_other_key_terms():
+    cache = SemanticAnswerCache(threshold=0.95)
+    cache.put([1.0, 0.0], 0, ANSWER, "When did Season 5 start?")
+
+    assert cache.get([1.0, 0.0], 0, "When did Season 6 start?") is None
+    assert cache.get([1.0, 0.0], 0, "When did Proposal 5 start?") is None
+    assert cache.get([1.0, 0.0], 0, "When  did Season 5 start") == ANSWER
+
+
+def test_key_terms_are_the_numbers_and_names_of_the_question():
+    assert hash_key_terms("Who voted on proposal 12?") != hash_key_terms(
+        "Who voted on proposal 13?"
+    )
+    assert hash_key_terms("What is the Token House?") == hash_key_terms(
+        "Explain the Token House"
+    )
+
+
+def test_answer_cache_expires_entries(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("op_brains.chat.cache.time.time", lambda: now[0])
+    cache = SemanticAnswerCache(ttl=60)
+    cache.put([1.0, 0.0], 0, ANSWER)
+
+    now[0] += 61
+    assert cache.get([1.0, 0.0], 0) is None
+    assert len(cache) == 0
+
+
+def test_answer_cache_evicts_least_recently_used():
+    cache = SemanticAnswerCache(threshold=0.99, max_entries=2)
+    cache.put([1.0, 0.0, 0.0], 0, {"answer": "a"})
+    cache.put([0.0, 1.0, 0.0], 0, {"answer": "b"})
+    assert cache.get([1.0, 0.0, 0.0], 0) == {"answer": "a"}
+
+    cache.put([0.0, 0.0, 1.0], 0, {"answer": "c"})
+
+    assert len(cache) == 2
+    assert cache.get([0.0, 1.0, 0.0], 0) is None
+    assert cache.get([1.0, 0.0, 0.0], 0) == {"answer": "a"}
+
+
+def test_answer_cache_is_cleared_on_a_new_version():
+    cache = SemanticAnswerCache()
+    cache.ensure_version((1, 2))
+    cache.put([1.0], 0, ANSWER)
+    cache.ensure_version((1, 2))
+    assert len(cache) == 1
+
+    cache.ensure_version((1, 3))
+    assert len(cache) == 0 and cache.size_bytes == 0
+
+
+async def test_embedding_cache_only_embeds_missing_texts():
+    requests = []
+
+    async def embed(texts):
+        requests.append(texts)
+        return [[float(len(t))] for t in texts]
+
+    cache = EmbeddingCache()
+    assert await cache.aembed("m", ["a", "bb"], embed) == [[1.0], [2.0]]
+    assert await cache.aembed("m", ["bb  ", "ccc", "ccc"], embed) == [
+        [2.0],
+        [3.0],
+        [3.0],
+    ]
+    await cache.aembed("other", ["a"], embed)
+
+    assert requests == [["a", "bb"], ["ccc"], ["a"]]
+
+
+async def test_embedding_cache_shares_pending_requests():
+    requests = []
+    release = asyncio.Event()
+
+    async def embed(texts):
+        requests.append(texts)
+        await release.wait()
+        return [[1.0] for _ in texts]
+
+    cache = EmbeddingCache()
+    first = asyncio.create_task(cache.aembed("m", ["a"], embed))
+    second = asyncio.create_task(cache.aembed("m", ["a", "b"], embed))
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await first == [[1.0]]
+    assert await second == [[1.0], [1.0]]
+    assert requests == [["a"], ["b"]]
+
+
+async def test_embedding_cache_survives_a_cancelled_caller():
+    requests = []
+    release = asyncio.Event()
+
+    async def embed(texts):
+        requests.append(texts)
+        await release.wait()
+        return [[1.0] for _ in texts]
+
+    cache = EmbeddingCache()
+    first = asyncio.create_task(cache.aembed("m", ["a"], embed))
+    second = asyncio.create_task(cache.aembed("m", ["a"], embed))
+    await asyncio.sleep(0)
+    first.cancel()
+    release.set()
+
+    assert await second == [[1.0]]
+    with pytest.raises(asyncio.CancelledError):
+        await first
+    assert requests == [["a"]]
+    assert await cache.aembed("m", ["a"], embed) == [[1.0]]
+
+
+async def test_embedding_cache_does_not_keep_failures():
+    async def fail(texts):
+        raise ValueError("rate limited")
+
+    async def embed(texts):
+        return [[1.0] for _ in texts]
+
+    cache = EmbeddingCache()
+    with pytest.raises(ValueError):
+        await cache.aembed("m", ["a"], fail)
+    assert await cache.aembed("m", ["a"], embed) == [[1.0]]
+
+
+def test_embedding_cache_evicts_over_max_bytes():
+    cache = EmbeddingCache(max_bytes=8)
+    cache._put(("m", "a"), [1.0])
+    cache._put(("m", "b"), [2.0])
+    cache._put(("m", "c"), [3.0])
+
+    assert list(cache._entries) == [("m", "b"), ("m", "c")]
+    assert cache.size_bytes == 8
+
+
+async def test_single_flight_coalesces_concurrent_calls():
+    calls = 0
+    release = asyncio.Event()
+
+    async def fn():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return calls
+
+    flight = SingleFlight()
+    tasks = [asyncio.create_task(flight.do("q", fn)) for _ in range(3)]
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await asyncio.gather(*tasks) == [1, 1, 1]
+    assert (flight.leaders, flight.coalesced) == (1, 2)
+    assert len(flight) == 0
+    assert await flight.do("q", fn) == 2
+
+
+async def test_single_flight_survives_a_cancelled_caller():
+    release = asyncio.Event()
+
+    async def fn():
+        await release.wait()
+        return "done"
+
+    flight = SingleFlight()
+    leader = asyncio.create_task(flight.do("q", fn))
+    follower = asyncio.create_task(flight.do("q", fn))
+    await asyncio.sleep(0)
+    leader.cancel()
+    release.set()
+
+    assert await follower == "done"
+    with pytest.raises(asyncio.CancelledError):
+        await leader
@@ -0,0 +1,68 @@
+import pytest
+from langchain_community.embeddings import FakeEmbeddings
+from langchain_community.vectorstores import FAISS
+
+from op_brains.exceptions import OpChatBrainsException
+from op_brains.retriever import connect_faiss
+from op_data.sources.incremental_indexer import IncrementalIndexerService
+
+
+def store(*urls: str) -> FAISS:
+    return FAISS.from_embeddings(
+        [(url, [float(i), 1.0]) for i, url in enumerate(urls)],
+        FakeEmbeddings(size=2),
+        metadatas=[{"url": url} for url in urls],
+        ids=list(urls),
+    )
+
+
+@pytest.fixture
+async def saved_stores(monkeypatch):
+    saved = {}
+
+    async def load_faiss_indexes(embeddings, mmap=False, names=None):
+        return {k: v for k, v in saved.items() if names is None or k in names}
+
+    monkeypatch.setattr(
+        IncrementalIndexerService, "load_faiss_indexes", load_faiss_indexes
+    )
+    monkeypatch.setattr(connect_faiss.access_APIs, "get_embedding", lambda m: None)
+    yield saved
+    await connect_faiss.close_faiss_indexes()
+
+
+async def test_missing_indexes_raise(saved_stores):
+    with pytest.raises(OpChatBrainsException):
+        await connect_faiss.load_faiss_indexes()
+
+    saved_stores["documentation"] = store("https://docs/1")
+    db = await connect_faiss.load_faiss_indexes()
+    assert list(db.stores) == ["documentation"]
+
+
+async def test_reload_faiss_shard(saved_stores):
+    saved_stores.update(documentation=store("d"), governance=store("g"))
+    db = await connect_faiss.load_faiss_indexes()
+
+    saved_stores["governance"] = store("g", "g2")
+    assert await connect_faiss.reload_faiss_shard("governance")
+    assert db.stores["governance"].index.ntotal == 2
+    assert db.stores["documentation"].index.ntotal == 1
+
+    del saved_stores["governance"]
+    assert not await connect_faiss.reload_faiss_shard("governance")
+    assert list(db.stores) == ["documentation"]
+
+
+async def test_loading_again_keeps_the_retriever(saved_stores):
+    saved_stores.update(documentation=store("d"), governance=store("g"))
+    db = await connect_faiss.load_faiss_indexes()
+
+    del saved_stores["governance"]
+    await connect_faiss.load_faiss_indexes.cache.clear()
+    assert await connect_faiss.load_faiss_indexes() is db
+    assert list(db.stores) == ["documentation"]
+
+    await connect_faiss.close_faiss_indexes()
+    assert db.executor._shutdown
+    assert await connect_faiss.load_faiss_indexes() is not db
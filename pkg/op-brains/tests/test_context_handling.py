@@ -0,0 +1,88 @@
+from op_brains.chat.model_utils import ContextHandling
+from op_brains.chat.tokenizer import count_tokens
+from op_brains.documents.records import ContextRecord
+
+
+def summary(url: str, content: str) -> ContextRecord:
+    return ContextRecord(
+        content,
+        {
+            "url": url,
+            "type_db_info": "forum_thread_summary",
+            "thread_title": f"Thread {url}",
+            "created_at": "2024-01-01",
+            "last_posted_at": "2024-02-01",
+        },
+    )
+
+
+def contexts(n: int, words: int = 100) -> dict:
+    return {
+        f"https://gov/t/{i}": summary(f"https://gov/t/{i}", "vote " * words)
+        for i in range(n)
+    }
+
+
+def test_pack_keeps_every_context_within_the_budget():
+    context, urls, tokens = ContextHandling.pack(contexts(3), token_budget=10_000)
+
+    assert urls == list(contexts(3))
+    assert count_tokens(context) <= tokens
+    assert context.count("<summary_from_forum_thread>") == 3
+
+
+def test_pack_truncates_the_first_context_that_does_not_fit():
+    one = count_tokens(ContextHandling.format_context(contexts(1)["https://gov/t/0"]))
+    overhead = one - count_tokens("vote " * 100)
+    budget = 2 * one + overhead + 30
+
+    context, urls, tokens = ContextHandling.pack(
+        contexts(4), token_budget=budget, min_truncated_tokens=10
+    )
+
+    assert urls == list(contexts(4))[:3]
+    assert one * 2 < tokens <= budget
+    assert count_tokens(context) <= tokens
+
+
+def test_pack_drops_a_truncation_below_the_minimum():
+    one = count_tokens(ContextHandling.format_context(contexts(1)["https://gov/t/0"]))
+
+    _, urls, tokens = ContextHandling.pack(
+        contexts(4), token_budget=2 * one + one // 2, min_truncated_tokens=200
+    )
+
+    assert urls == list(contexts(4))[:2]
+    assert tokens == 2 * one
+
+
+def test_pack_skips_contexts_without_a_format():
+    other = ContextRecord("fragment", {"url": "f", "type_db_info": "forum_post"})
+    context, urls, _ = ContextHandling.pack({"f": other, **contexts(1)})
+
+    assert urls == ["https://gov/t/0"]
+    assert "fragment" not in context
+
+
+async def test_filter_excludes_explored_urls_within_the_budget():
+    found = list(contexts(6).values())
+    explored = ["https://gov/t/0", "https://gov/t/2"]
+    budget = 2 * count_tokens(ContextHandling.format_context(found[1])) + 10
+
+    context, urls = await ContextHandling.filter(
+        {"q1": found[:3], "q2": found[3:]}, explored, None, token_budget=budget
+    )
+
+    assert urls == ["https://gov/t/1", "https://gov/t/3"]
+    assert count_tokens(context) <= budget
+    assert "https://gov/t/0" not in context
+
+
+async def test_filter_can_resend_explored_urls():
+    found = list(contexts(2).values())
+
+    _, urls = await ContextHandling.filter(
+        {"q": found}, ["https://gov/t/0"], None, exclude_explored=False
+    )
+
+    assert urls == ["https://gov/t/0", "https://gov/t/1"]
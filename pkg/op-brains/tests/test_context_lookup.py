@@ -0,0 +1,104 @@
+import pandas as pd
+
+from op_brains.documents import ContextLookup, DataExporter
+from op_brains.documents.records import ContextRecord
+
+DAY = 24 * 60 * 60
+
+
+def record(url: str, type_db_info: str) -> ContextRecord:
+    return ContextRecord(url, {"url": url, "type_db_info": type_db_info})
+
+
+def contexts_df() -> pd.DataFrame:
+    rows = [
+        ("a", "forum_thread_summary", "2024-01-01T00:00:00Z"),
+        ("b", "forum_thread_summary", "2024-03-01T00:00:00Z"),
+        ("a", "fragments_docs", "2024-02-01T00:00:00Z"),
+        ("c", "fragments_docs", None),
+    ]
+    return pd.DataFrame(
+        {
+            "url": [url for url, _, _ in rows],
+            "type_db_info": [t for _, t, _ in rows],
+            "content": [record(url, t) for url, t, _ in rows],
+            "last_date": [date for _, _, date in rows],
+        }
+    )
+
+
+def test_get_returns_the_first_row_of_each_url():
+    lookup = ContextLookup(contexts_df())
+
+    found = lookup.get(["c", "missing", "a"])
+    assert [(c.page_content, c.metadata["type_db_info"]) for c in found] == [
+        ("c", "fragments_docs"),
+        ("a", "forum_thread_summary"),
+    ]
+    assert len(lookup) == 3
+
+
+def test_get_filters_by_type():
+    lookup = ContextLookup(contexts_df())
+
+    found = lookup.get(["a", "b", "c"], type_db_info=["fragments_docs"])
+    assert [c.metadata["type_db_info"] for c in found] == ["fragments_docs"] * 2
+    assert lookup.get(["b"], type_db_info=["unknown"]) == []
+
+
+def test_recency_rank_puts_undated_urls_last():
+    lookup = ContextLookup(contexts_df())
+
+    assert lookup.recency_rank == {"b": 0, "a": 1, "c": 2}
+
+
+def test_rank_by_recency_mixes_relevance_and_freshness():
+    lookup = ContextLookup(contexts_df())
+    now = pd.Timestamp("2024-03-01", tz="UTC").timestamp()
+    ranked = [record(url, "forum_thread_summary") for url in ("a", "c", "b")]
+
+    def urls(weight):
+        out = lookup.rank_by_recency(ranked, 3, weight=weight, now=now)
+        return [c.metadata["url"] for c in out]
+
+    assert urls(0.0) == ["a", "c", "b"]
+    assert urls(1.0) == ["b", "a", "c"]
+    assert lookup.rank_by_recency(ranked, 1, weight=1.0, now=now)[0] is ranked[2]
+
+
+def test_lookup_is_built_once_per_dataframe(monkeypatch):
+    monkeypatch.setattr(DataExporter, "_lookups", {})
+    monkeypatch.setattr(DataExporter, "_lookup_cache", None)
+    df = contexts_df()
+
+    lookup = DataExporter.get_context_lookup(df)
+    assert DataExporter.get_context_lookup(df) is lookup
+    assert DataExporter.get_context_lookup(contexts_df()) is not lookup
+
+
+def test_lookups_of_the_cached_dataframes_are_built_per_mode(monkeypatch):
+    for name in [
+        "_lookups",
+        "_class_frames",
+        "_dataframe_cache",
+        "_dataframe_cache_time",
+    ]:
+        monkeypatch.setattr(DataExporter, name, {})
+    monkeypatch.setattr(DataExporter, "_lookup_cache", None)
+    DataExporter._store(False, [contexts_df()])
+    DataExporter._store(True, [contexts_df()])
+    api_df = DataExporter._dataframe_cache[False]
+    indexer_df = DataExporter._dataframe_cache[True]
+
+    # the modes alternating do not rebuild each other's lookup
+    lookup = DataExporter.get_context_lookup(api_df)
+    assert lookup is DataExporter._lookups[False][1]
+    assert DataExporter.get_context_lookup(indexer_df) is DataExporter._lookups[True][1]
+    assert DataExporter.get_context_lookup(api_df) is lookup
+    assert DataExporter._lookup_cache is None
+
+    # a refresh stores a new dataframe along with its lookup
+    DataExporter._store(False, [contexts_df()])
+    refreshed = DataExporter.get_context_lookup(DataExporter._dataframe_cache[False])
+    assert refreshed is not lookup
+    assert refreshed is DataExporter._lookups[False][1]
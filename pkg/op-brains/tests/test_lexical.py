@@ -0,0 +1,68 @@
+from op_brains.chat import utils
+from op_brains.retriever.lexical import BM25Index, reciprocal_rank_fusion
+
+DOCUMENTS = [
+    ("a", "Season 6 voting cycle"),
+    ("b", "Retro funding round for public goods"),
+    ("c", "Season 6 grants and the season budget"),
+    ("a", "duplicate url, ignored"),
+]
+
+
+def test_bm25_ranks_matching_documents():
+    index = BM25Index.build(DOCUMENTS)
+
+    results = index.search("season budget")
+    assert [url for url, _ in results] == ["c", "a"]
+    assert results[0][1] > results[1][1] > 0
+    assert index.search("duplicate") == []
+    assert len(index) == 3
+
+
+def test_bm25_limits_to_k():
+    index = BM25Index.build(DOCUMENTS)
+
+    assert index.search("season funding", k=1) == index.search("season funding")[:1]
+
+
+def test_bm25_bytes_round_trip():
+    index = BM25Index.build(DOCUMENTS, k1=1.2, b=0.5)
+    loaded = BM25Index.from_bytes(*index.to_bytes())
+
+    assert loaded.search("season budget") == index.search("season budget")
+    assert (loaded.k1, loaded.b) == (1.2, 0.5)
+
+
+def test_reciprocal_rank_fusion():
+    dense = [("a", 1), ("b", 1), ("c", 1)]
+    lexical = [("c", 2), ("a", 2), ("d", 2)]
+
+    fused = reciprocal_rank_fusion([dense, lexical], key=lambda item: item[0], k=1)
+
+    # a: 1/2 + 1/3, c: 1/4 + 1/2, b: 1/3, d: 1/4
+    assert fused == [("a", 1), ("c", 1), ("b", 1), ("d", 2)]
+
+
+async def test_missing_lexical_index_is_not_looked_up_on_every_search(monkeypatch):
+    lookups = []
+
+    async def get_latest_lexical_index():
+        lookups.append(1)
+        return None
+
+    monkeypatch.setattr(
+        utils.IncrementalIndexerService,
+        "get_latest_lexical_index",
+        get_latest_lexical_index,
+    )
+    monkeypatch.setattr(utils, "_lexical_index_missing_at", None)
+    await utils._load_lexical_index.cache.clear()
+
+    assert await utils.get_lexical_index() is None
+    assert await utils.get_lexical_index() is None
+    assert len(lookups) == 1
+
+    # looked up again once the retry delay has passed
+    utils._lexical_index_missing_at -= utils.LEXICAL_INDEX_RETRY
+    assert await utils.get_lexical_index() is None
+    assert len(lookups) == 2
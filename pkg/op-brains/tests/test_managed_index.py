@@ -0,0 +1,59 @@
+import io
+import json
+
+import numpy as np
+import pytest
+
+from op_brains.retriever.managed_index import ManagedIndexTable
+
+INDEX = {
+    "What is Season 6?": ["https://gov/t/1", "https://gov/t/2"],
+    "Who votes?": [],
+    "When does voting start?": ["https://gov/t/2", "https://gov/t/3"],
+}
+
+
+def test_csr_layout_stores_each_url_once():
+    table = ManagedIndexTable.from_dict(INDEX)
+
+    assert table.urls == ["https://gov/t/1", "https://gov/t/2", "https://gov/t/3"]
+    assert table.indptr.tolist() == [0, 2, 2, 4]
+    assert table.indices.tolist() == [0, 1, 1, 2]
+    assert (
+        table.urls_of([table.row("When does voting start?")])
+        == INDEX["When does voting start?"]
+    )
+    assert table.row("missing") is None
+
+
+def test_bytes_round_trip_through_npz():
+    json_data, arrays = ManagedIndexTable.from_dict(INDEX).to_bytes()
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, embeddings=np.zeros((3, 2)), **arrays)
+
+    loaded = ManagedIndexTable.from_bytes(
+        json_data, np.load(io.BytesIO(buffer.getvalue()))
+    )
+
+    assert loaded.to_dict() == INDEX
+    assert list(loaded.to_dict()) == list(INDEX)
+
+
+def test_legacy_json_is_converted():
+    loaded = ManagedIndexTable.from_bytes(json.dumps(INDEX), {})
+
+    assert loaded.to_dict() == INDEX
+
+
+def test_unknown_version_is_rejected():
+    json_data = json.dumps({"version": 99, "keys": [], "urls": []})
+
+    with pytest.raises(ValueError):
+        ManagedIndexTable.from_bytes(json_data, {})
+
+
+def test_rows_with_urls():
+    table = ManagedIndexTable.from_dict(INDEX)
+
+    mask = table.rows_with_urls(lambda url: url.endswith("/3"))
+    assert mask.tolist() == [False, False, True]
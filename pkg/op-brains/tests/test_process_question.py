@@ -0,0 +1,129 @@
+import asyncio
+
+import pandas as pd
+
+from op_brains.chat import utils
+from op_brains.chat.metrics import collect_timings, span
+from op_brains.documents import DataExporter
+
+RESPONSE = {"data": {"answer": "It started."}, "error": None}
+
+
+async def test_coalesced_questions_get_the_shared_timings(monkeypatch):
+    release = asyncio.Event()
+    calls = []
+
+    async def get_dataframe(only_not_embedded=False):
+        return pd.DataFrame()
+
+    async def answer_question(question, contexts_df, memory, verbose):
+        calls.append(question)
+        with span("predict"):
+            await release.wait()
+        return RESPONSE
+
+    monkeypatch.setattr(DataExporter, "get_dataframe", get_dataframe)
+    monkeypatch.setattr(utils, "answer_question", answer_question)
+
+    tasks = [
+        asyncio.create_task(utils.process_question("When?", [], include_timings=True))
+        for _ in range(2)
+    ]
+    while len(utils.question_flight) == 0:
+        await asyncio.sleep(0)
+    release.set()
+    responses = await asyncio.gather(*tasks)
+
+    assert calls == ["When?"]
+    for response in responses:
+        assert response["data"] == RESPONSE["data"]
+        assert [t["stage"] for t in response["timings"]] == ["predict", "total"]
+
+
+async def test_batch_questions_join_questions_in_flight(monkeypatch):
+    release = asyncio.Event()
+    predicted = []
+
+    async def get_dataframe(only_not_embedded=False):
+        return pd.DataFrame()
+
+    async def embed(texts):
+        return [[1.0] for _ in texts]
+
+    async def preprocess(question, memory):
+        return False, {"answer": "It started."}
+
+    async def predict(question, contexts_df, memory=None, verbose=False, **kwargs):
+        predicted.append((question, sorted(kwargs)))
+        await release.wait()
+        return {"answer": {"answer": question}}
+
+    monkeypatch.setattr(DataExporter, "get_dataframe", get_dataframe)
+    monkeypatch.setattr(utils, "ANSWER_CACHE_ENABLED", False)
+    monkeypatch.setattr(utils.rag_engine, "embed", embed)
+    monkeypatch.setattr(utils.rag_engine, "preprocess", preprocess)
+    monkeypatch.setattr(utils.rag_engine, "predict", predict)
+
+    single = asyncio.create_task(utils.process_question("When?", []))
+    while len(utils.question_flight) == 0:
+        await asyncio.sleep(0)
+    batch = asyncio.create_task(utils.process_questions(["When?", "Who?", "When?"]))
+    while len(predicted) < 2:
+        await asyncio.sleep(0)
+    release.set()
+
+    assert (await single)["data"] == {"answer": "When?"}
+    assert [r["data"] for r in await batch] == [
+        {"answer": "When?"},
+        {"answer": "Who?"},
+        {"answer": "When?"},
+    ]
+    assert predicted == [
+        ("When?", []),
+        ("Who?", ["embedder", "preprocessed", "retriever"]),
+    ]
+
+
+async def test_streamed_questions_join_questions_in_flight(monkeypatch):
+    release = asyncio.Event()
+    predicted = []
+
+    async def get_dataframe(only_not_embedded=False):
+        return pd.DataFrame()
+
+    async def predict(question, contexts_df, memory=None, verbose=False, emit=None):
+        predicted.append(question)
+        with span("predict"):
+            await emit("preprocessed", {"needs_info": False})
+            await release.wait()
+            await emit("token", {"text": "It started."})
+        return {"answer": {"answer": "It started."}}
+
+    monkeypatch.setattr(DataExporter, "get_dataframe", get_dataframe)
+    monkeypatch.setattr(utils, "ANSWER_CACHE_ENABLED", False)
+    monkeypatch.setattr(utils.rag_engine, "predict", predict)
+
+    async def stream():
+        with collect_timings() as timings:
+            events = [event async for event in utils.stream_question("When?", [])]
+        return events, [t["stage"] for t in timings]
+
+    first = asyncio.create_task(stream())
+    while not predicted:
+        await asyncio.sleep(0)
+    second = asyncio.create_task(stream())
+    while utils.question_flight.coalesced == 0:
+        await asyncio.sleep(0)
+    release.set()
+
+    answer = ("answer", {"data": {"answer": "It started."}, "error": None})
+    assert await first == (
+        [
+            ("preprocessed", {"needs_info": False}),
+            ("token", {"text": "It started."}),
+            answer,
+        ],
+        ["answer_cache_lookup", "predict", "total"],
+    )
+    assert await second == ([answer], ["answer_cache_lookup", "predict", "total"])
+    assert predicted == ["When?"]
@@ -0,0 +1,67 @@
+import datetime as dt
+
+from op_brains.documents.optimism import ForumPostsProcessingStrategy
+from op_data.db.models import RawTopic
+
+NOW = dt.datetime(2024, 3, 1)
+
+
+async def create_raw_topics(n: int):
+    for i in range(1, n + 1):
+        await RawTopic.create(
+            externalId=str(i),
+            url=f"https://gov/t/{i}",
+            type="thread",
+            rawData={
+                "title": f"Thread {i}",
+                "category_id": 1,
+                "post_stream": {"posts": [{"id": 100 + i, "cooked": "hi"}]},
+            },
+            lastUpdatedAt=NOW,
+            lastSummarizedAt=NOW - dt.timedelta(days=i % 2),
+            lastEmbeddedAt=NOW,
+        )
+
+
+async def test_iter_raw_topics_pages_by_id(db):
+    await create_raw_topics(7)
+
+    pages = [
+        threads
+        async for _, threads in ForumPostsProcessingStrategy.iter_raw_topics(
+            page_size=3
+        )
+    ]
+
+    assert [list(threads) for threads in pages] == [[1, 2, 3], [4, 5, 6], [7]]
+
+
+async def test_iter_raw_topics_pages_the_filtered_topics(db):
+    await create_raw_topics(7)
+
+    pages = [
+        (posts, threads)
+        async for posts, threads in ForumPostsProcessingStrategy.iter_raw_topics(
+            only_not_summarized=True, page_size=2
+        )
+    ]
+
+    assert [list(threads) for _, threads in pages] == [[1, 3], [5, 7]]
+    posts = pages[0][0]
+    assert posts[101]["url"] == "https://gov/t/1/101"
+    assert posts[101]["thread_id"] == 1
+
+
+async def test_retrieve_joins_the_pages(db):
+    await create_raw_topics(5)
+
+    posts, threads = await ForumPostsProcessingStrategy.retrieve()
+    paged_posts, paged_threads = {}, {}
+    async for page_posts, page_threads in ForumPostsProcessingStrategy.iter_raw_topics(
+        page_size=2
+    ):
+        paged_posts.update(page_posts)
+        paged_threads.update(page_threads)
+
+    assert (posts, threads) == (paged_posts, paged_threads)
+    assert len(threads) == 5
@@ -0,0 +1,36 @@
+import pandas as pd
+from langchain_core.documents import Document
+
+from op_brains import setup
+from op_brains.documents import DataExporter
+from op_brains.documents.records import ContextRecord
+
+URLS = ["https://gov/t/1", "https://gov/t/2", "https://gov/t/3"]
+
+
+class Reranker:
+    """Reranker double reversing the documents, as the Voyage one requires them."""
+
+    def __init__(self):
+        self.queries = []
+
+    async def acompress_documents(self, query, documents):
+        assert all(isinstance(doc, Document) for doc in documents)
+        self.queries.append(query)
+        return documents[::-1]
+
+
+async def test_reorder_index_reranks_context_records(monkeypatch):
+    async def get_dataframe(only_not_embedded=False):
+        contexts = [ContextRecord(f"Thread {url}", {"url": url}) for url in URLS]
+        return pd.DataFrame({"url": URLS, "content": contexts})
+
+    reranker = Reranker()
+    monkeypatch.setattr(DataExporter, "get_dataframe", get_dataframe)
+    monkeypatch.setattr(setup, "reranker_voyager", reranker)
+
+    index = {"What is Season 6?": URLS, "Who votes?": URLS[:2]}
+    out = await setup.reorder_index(index, updated_urls=["https://gov/t/1"])
+
+    assert reranker.queries == list(index)
+    assert out == {"What is Season 6?": URLS[::-1], "Who votes?": URLS[1::-1]}
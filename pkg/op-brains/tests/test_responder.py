@@ -0,0 +1,165 @@
+import asyncio
+import logging
+
+import pandas as pd
+import pytest
+from langchain_core.documents import Document
+
+from op_brains.chat.model_utils import Prompt
+from op_brains.chat.system_structure import RAGSystem
+
+
+class StructuredLLM:
+    """Chat model double answering structured output requests with `answer`."""
+
+    def __init__(self, answer):
+        self.answer = answer
+        self.prompts = []
+
+    def with_structured_output(self, schema, **kwargs):
+        self.schema = schema
+        return self
+
+    async def ainvoke(self, prompt):
+        self.prompts.append(prompt)
+        if isinstance(self.answer, BaseException):
+            raise self.answer
+        return self.schema(**self.answer)
+
+
+RESPONSE = {
+    "knowledge_summary": [
+        {"claim": "Season 6 started", "url_supporting": "https://gov/t/1"}
+    ],
+    "answer": {"answer": "It started.", "url_supporting": []},
+}
+
+
+async def test_aresponder_returns_the_structured_output():
+    llm = StructuredLLM(RESPONSE)
+    out = await Prompt.aresponder(
+        llm,
+        QUERY="When did Season 6 start?",
+        CONTEXT="",
+        USER_KNOWLEDGE="",
+        SUMMARY_OF_EXPLORED_CONTEXTS="",
+    )
+
+    assert out["answer"]["answer"] == "It started."
+    assert "When did Season 6 start?" in llm.prompts[0]
+
+
+async def test_aresponder_logs_failures(caplog):
+    llm = StructuredLLM(ValueError("invalid tool call"))
+    with caplog.at_level(logging.ERROR):
+        out = await Prompt.aresponder(
+            llm,
+            QUERY="",
+            CONTEXT="",
+            USER_KNOWLEDGE="",
+            SUMMARY_OF_EXPLORED_CONTEXTS="",
+        )
+
+    assert out is None
+    assert "invalid tool call" in caplog.text
+
+
+async def test_aresponder_propagates_cancellation():
+    llm = StructuredLLM(asyncio.CancelledError())
+    with pytest.raises(asyncio.CancelledError):
+        await Prompt.aresponder(
+            llm,
+            QUERY="",
+            CONTEXT="",
+            USER_KNOWLEDGE="",
+            SUMMARY_OF_EXPLORED_CONTEXTS="",
+        )
+
+
+def rag_system(**kwargs) -> RAGSystem:
+    async def preprocessor(llm, **prompt):
+        return {
+            "needs_info": True,
+            "answer": None,
+            "expansion": {
+                "user_knowledge": "",
+                "type_search": "factual",
+                "keywords": [],
+                "questions": ["When did Season 6 start?"],
+            },
+        }
+
+    async def retriever(question, reasoning_level, contexts_df, query_embed=None):
+        url = "https://gov/t/1"
+        return [Document(page_content="Season 6", metadata={"url": url})]
+
+    async def context_filter(context_dict, explored, contexts_df, query, *args, **kw):
+        urls = [c.metadata["url"] for cc in context_dict.values() for c in cc]
+        return "context", list(dict.fromkeys(urls))
+
+    async def responder(llm, **prompt):
+        return {**RESPONSE, "answer": dict(RESPONSE["answer"], url_supporting=[])}
+
+    pars = dict(
+        llm=[object(), object()],
+        retriever=retriever,
+        context_filter=context_filter,
+        system_prompt_preprocessor=preprocessor,
+        system_prompt_responder=responder,
+    )
+    return RAGSystem(**{**pars, **kwargs})
+
+
+async def test_predict_awaits_the_llm_stages():
+    result = await rag_system().predict("When did Season 6 start?", pd.DataFrame())
+
+    assert result["needs_info"]
+    assert result["answer"]["answer"] == "It started."
+    assert result["answer"]["url_supporting"] == ["https://gov/t/1"]
+    assert result["reasoning"][1]["context"] == "context"
+
+
+class StreamingLLM:
+    """Chat model double whose tool call stream fails with `error`."""
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    async def astream(self, prompt):
+        raise self.error
+        yield
+
+
+async def test_astream_responder_yields_none_on_failure(caplog):
+    llm = StreamingLLM(ValueError("stream closed"))
+    with caplog.at_level(logging.ERROR):
+        outputs = [
+            out
+            async for out in Prompt.astream_responder(
+                llm,
+                QUERY="",
+                CONTEXT="",
+                USER_KNOWLEDGE="",
+                SUMMARY_OF_EXPLORED_CONTEXTS="",
+            )
+        ]
+
+    assert outputs == [None]
+    assert "stream closed" in caplog.text
+
+
+async def test_astream_responder_propagates_cancellation():
+    # raised when an SSE client of /predict/stream disconnects
+    llm = StreamingLLM(asyncio.CancelledError())
+    with pytest.raises(asyncio.CancelledError):
+        async for _ in Prompt.astream_responder(
+            llm,
+            QUERY="",
+            CONTEXT="",
+            USER_KNOWLEDGE="",
+            SUMMARY_OF_EXPLORED_CONTEXTS="",
+        ):
+            pass
@@ -0,0 +1,59 @@
+import pandas as pd
+import pytest
+
+from op_brains.chat.system_structure import RAGSystem
+from op_brains.chat.utils import RAGEngine
+
+QUESTIONS = [
+    {"query": "What is Season 6?"},
+    {"keyword": "Season #6"},
+    {"question": "When did Season 6 start?"},
+]
+
+
+def rag_system(embedded: list, retrieved: list) -> RAGSystem:
+    async def embedder(texts):
+        embedded.append(texts)
+        return [[float(len(t))] for t in texts]
+
+    async def retriever(question, reasoning_level, contexts_df, query_embed=None):
+        retrieved.append((question, query_embed))
+        return []
+
+    return RAGSystem(
+        llm=[object(), object()],
+        embedder=embedder,
+        retriever=retriever,
+        searched_text=RAGEngine.searched_text,
+    )
+
+
+@pytest.mark.parametrize(
+    "reasoning_level, searched",
+    [
+        (0, ["Season #6", "When did Season 6 start?"]),
+        (1, ["When did Season 6 start?"]),
+        (2, ["What is Season 6?", "When did Season 6 start?"]),
+    ],
+)
+async def test_only_searched_texts_are_embedded(reasoning_level, searched):
+    embedded, retrieved = [], []
+    contexts = await rag_system(embedded, retrieved).retrieve_contexts(
+        QUESTIONS, reasoning_level, pd.DataFrame()
+    )
+
+    assert embedded == [searched]
+    assert list(contexts) == [list(q.values())[0] for q in QUESTIONS]
+    for question, query_embed in retrieved:
+        text = RAGEngine.searched_text(question, reasoning_level)
+        assert query_embed == (None if text is None else [float(len(text))])
+
+
+async def test_nothing_is_embedded_without_searched_texts():
+    embedded, retrieved = [], []
+    await rag_system(embedded, retrieved).retrieve_contexts(
+        [{"query": "What is Season 6?"}], 0, pd.DataFrame()
+    )
+
+    assert embedded == []
+    assert len(retrieved) == 1
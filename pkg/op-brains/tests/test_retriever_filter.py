@@ -0,0 +1,45 @@
+import pandas as pd
+
+from op_brains.chat import utils
+from op_brains.chat.model_utils import ContextHandling
+
+
+async def test_retrievers_only_search_responder_contexts(monkeypatch):
+    calls = []
+
+    def retriever(name, found):
+        async def retrieve(query, *args, **kwargs):
+            calls.append(
+                (name, kwargs.get("type_db_info"), kwargs.get("metadata_filter"))
+            )
+            return found
+
+        return retrieve
+
+    async def get_indexes():
+        return (
+            retriever("questions", []),
+            retriever("keywords", []),
+            retriever("default", []),
+        )
+
+    async def lexical_search(text, contexts_df):
+        return []
+
+    monkeypatch.setattr(utils, "get_indexes", get_indexes)
+    monkeypatch.setattr(utils, "lexical_search", lexical_search)
+
+    engine = utils.RAGEngine()
+    df = pd.DataFrame()
+    await engine.retriever({"keyword": "Season 6"}, 0, df, query_embed=[1.0])
+    await engine.retriever({"question": "When?"}, 0, df, query_embed=[1.0])
+    await engine.retriever({"query": "Season 6"}, 2, df, query_embed=[1.0])
+
+    types = ContextHandling.context_types
+    assert calls == [
+        ("keywords", types, None),
+        ("questions", types, None),
+        ("default", None, utils.CONTEXT_FILTER),
+        ("default", None, utils.CONTEXT_FILTER),
+    ]
+    assert utils.CONTEXT_FILTER.type_db_info == types
@@ -1,4 +1,5 @@
 import tempfile
+import shutil
 import os
 import zlib
 import json
@@ -10,9 +11,28 @@ from op_data.db.models import FaissIndex, ManagedIndex, RawTopic
 import asyncio
 from op_brains.documents import DataExporter
 from op_brains.setup import reorder_index, generate_indexes_from_fragment
+from op_brains.retriever.lexical import BM25Index
+from op_brains.retriever.managed_index import ManagedIndexTable
+from op_brains.retriever.faiss_artifact import (
+    MANIFEST,
+    artifact_files,
+    read_faiss_artifact,
+    write_faiss_artifact,
+)
+from op_brains.retriever.ann import (
+    build_ann_index,
+    serialize_index,
+    index_type_of,
+    storage_of,
+)
 from op_brains.chat.apis import access_APIs
 import numpy as np
-from op_brains.config import CHAT_MODEL, EMBEDDING_MODEL
+from op_brains.config import (
+    CHAT_MODEL,
+    EMBEDDING_MODEL,
+    MANAGED_INDEX_STORAGE,
+    FAISS_ARTIFACT_DIR,
+)
 import datetime as dt
 import pickle
 from op_core.config import config
@@ -41,26 +61,61 @@ class IncrementalIndexerService:
     def retrieve_object_from_s3(cls, key):
         return cls.s3.get_object(Bucket=config.R2_BUCKET_NAME, Key=key)["Body"].read()
 
-    def upload_to_s3(self, key, data):
-        return self.s3.put_object(Bucket=config.R2_BUCKET_NAME, Key=key, Body=data)
+    @classmethod
+    def upload_to_s3(cls, key, data):
+        return cls.s3.put_object(Bucket=config.R2_BUCKET_NAME, Key=key, Body=data)
 
     async def get_updated_documents(self):
         return await DataExporter.get_langchain_documents(only_not_embedded=True)
 
+    @staticmethod
+    def encode_managed_index(
+        index_embed, storage=MANAGED_INDEX_STORAGE["default"], url_arrays=None
+    ):
+        """
+        Serializes the embeddings of a managed index with its trained search
+        index, so the chat does not need to train it again when loading.
+
+        The raw embeddings are kept (as float32 or float16) to rebuild the
+        index with other settings, except with "pq" storage where only the
+        PQ codes and codebook are stored. `url_arrays`, the CSR arrays of the
+        `ManagedIndexTable` of the index, are stored alongside.
+        """
+        faiss_index = build_ann_index(index_embed, storage=storage)
+        arrays = {
+            "faiss_index": serialize_index(faiss_index),
+            "faiss_index_type": index_type_of(faiss_index),
+            "storage": storage_of(faiss_index),
+        }
+        if storage != "pq":
+            arrays["index_embed"] = np.asarray(
+                index_embed, dtype=np.float16 if storage == "float16" else np.float32
+            )
+        if url_arrays is not None:
+            arrays.update(url_arrays)
+
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, **arrays)
+        return buffer.getvalue()
+
     async def save_managed_index(self, index, index_type, updated_documents_urls):
         index_questions = list(index.keys())
         index_embed = np.array(self.embeddings.embed_documents(index_questions))
-        buffer = io.BytesIO()
-        np.savez_compressed(buffer, index_embed=index_embed)
-        embed_bytes = buffer.getvalue()
 
         reordered_index = await reorder_index(index, updated_documents_urls)
+        # keys stay in the order of the embedding rows
+        json_data, url_arrays = ManagedIndexTable.from_dict(reordered_index).to_bytes()
+        embed_bytes = self.encode_managed_index(
+            index_embed,
+            MANAGED_INDEX_STORAGE.get(index_type, MANAGED_INDEX_STORAGE["default"]),
+            url_arrays=url_arrays,
+        )
 
         jsonObjectKey = f"managed_index_reranked_{int(time.time())}.json"
         compressedObjectKey = f"compressed_managed_index{int(time.time())}.zlib"
 
         # Save the compressed data to the R2 bucket
-        self.upload_to_s3(key=jsonObjectKey, data=json.dumps(reordered_index))
+        self.upload_to_s3(key=jsonObjectKey, data=json_data)
         self.upload_to_s3(key=compressedObjectKey, data=embed_bytes)
 
         # Save the object key to the database
@@ -70,6 +125,38 @@ class IncrementalIndexerService:
             indexType=index_type,
         )
 
+    async def save_lexical_index(self):
+        # built over every context served to the chat, not only the updated ones
+        await DataExporter.refresh_data()
+        contexts_df = await DataExporter.get_dataframe(only_not_embedded=False)
+        lexical_index = BM25Index.from_dataframe(contexts_df)
+        json_data, npz_data = lexical_index.to_bytes()
+
+        jsonObjectKey = f"bm25_index_{int(time.time())}.json"
+        compressedObjectKey = f"compressed_bm25_index_{int(time.time())}.npz"
+
+        self.upload_to_s3(key=jsonObjectKey, data=json_data)
+        self.upload_to_s3(key=compressedObjectKey, data=npz_data)
+
+        await ManagedIndex.create(
+            jsonObjectKey=jsonObjectKey,
+            compressedObjectKey=compressedObjectKey,
+            indexType="bm25",
+        )
+
+    @classmethod
+    async def get_latest_lexical_index(cls):
+        lexical_index = (
+            await ManagedIndex.filter(indexType="bm25").order_by("-createdAt").first()
+        )
+        if lexical_index is None:
+            return None
+
+        return BM25Index.from_bytes(
+            cls.retrieve_object_from_s3(lexical_index.jsonObjectKey),
+            cls.retrieve_object_from_s3(lexical_index.compressedObjectKey),
+        )
+
     @classmethod
     async def get_latest_compressed_faiss_indexes(cls):
         try:
@@ -85,12 +172,86 @@ class IncrementalIndexerService:
             return None
 
     @classmethod
-    async def load_faiss_indexes(cls, embeddings):
-        compressed_data = await cls.get_latest_compressed_faiss_indexes()
+    def download_faiss_artifact(cls, manifest_key):
+        """
+        Downloads a binary faiss artifact to FAISS_ARTIFACT_DIR, unless a
+        previous download (e.g. by another worker) is already there.
+        """
+        prefix = manifest_key.rsplit("/", 1)[0]
+        directory = os.path.join(FAISS_ARTIFACT_DIR, prefix)
+        if os.path.exists(os.path.join(directory, MANIFEST)):
+            return directory
 
-        if compressed_data is None:
+        os.makedirs(FAISS_ARTIFACT_DIR, exist_ok=True)
+        download_dir = tempfile.mkdtemp(dir=FAISS_ARTIFACT_DIR)
+        try:
+            manifest = cls.retrieve_object_from_s3(manifest_key)
+            for file in artifact_files(json.loads(manifest)):
+                with open(os.path.join(download_dir, file), "wb") as f:
+                    f.write(cls.retrieve_object_from_s3(f"{prefix}/{file}"))
+            with open(os.path.join(download_dir, MANIFEST), "wb") as f:
+                f.write(manifest)
+
+            try:
+                os.rename(download_dir, directory)
+            except OSError:
+                # another worker finished the same download first
+                if not os.path.exists(os.path.join(directory, MANIFEST)):
+                    raise
+        finally:
+            shutil.rmtree(download_dir, ignore_errors=True)
+
+        return directory
+
+    @staticmethod
+    def remove_superseded_faiss_artifacts(directory):
+        """
+        Deletes the downloaded artifacts saved before the one in `directory`.
+        Indexes memory-mapped from them stay readable until they are unmapped.
+        """
+        saved_at = int(os.path.basename(directory).rsplit("_", 1)[1])
+        for name in os.listdir(FAISS_ARTIFACT_DIR):
+            prefix, _, timestamp = name.rpartition("_")
+            if prefix == "faiss_indexes" and timestamp.isdigit():
+                if int(timestamp) < saved_at:
+                    shutil.rmtree(
+                        os.path.join(FAISS_ARTIFACT_DIR, name), ignore_errors=True
+                    )
+
+    @classmethod
+    async def load_faiss_indexes(cls, embeddings, mmap=False, names=None):
+        """
+        Loads the latest faiss stores by name.
+
+        Args:
+            embeddings: The embeddings used by the stores.
+            mmap (bool): Memory-map the indexes read-only, so processes on the
+                same host share them. Only for stores that are not updated, and
+                only with the binary artifact format.
+            names (list, optional): Only load the stores with these db names.
+
+        Returns:
+            Dict of db name to FAISS store; empty if no indexes were saved.
+        """
+        last_saved_indexes = await FaissIndex.all().order_by("-createdAt").first()
+        if last_saved_indexes is None:
             return {}
 
+        if last_saved_indexes.objectKey.endswith(MANIFEST):
+            directory = cls.download_faiss_artifact(last_saved_indexes.objectKey)
+            indexes = read_faiss_artifact(directory, embeddings, mmap=mmap, names=names)
+            cls.remove_superseded_faiss_artifacts(directory)
+            return indexes
+
+        compressed_data = cls.retrieve_object_from_s3(last_saved_indexes.objectKey)
+        indexes = cls.deserialize_legacy_faiss_indexes(compressed_data, embeddings)
+        if names is not None:
+            indexes = {k: v for k, v in indexes.items() if k in names}
+        return indexes
+
+    @staticmethod
+    def deserialize_legacy_faiss_indexes(compressed_data, embeddings):
+        """Reads indexes saved in the former zlib'd JSON of latin-1 strings format."""
         decompressed_data = zlib.decompress(compressed_data)
         folder_content = json.loads(decompressed_data.decode("utf-8"))
 
@@ -107,20 +268,19 @@ class IncrementalIndexerService:
         return indexes
 
     async def save_faiss_indexes(self):
-        folder_content = {}
-        for db_name, db in self.vector_stores.items():
-            serialized_data = db.serialize_to_bytes()
-            folder_content[db_name] = serialized_data.decode("latin-1")
+        prefix = f"faiss_indexes_{int(time.time())}"
 
-        json_data = json.dumps(folder_content)
-        compressed_data = zlib.compress(json_data.encode("utf-8"))
+        with tempfile.TemporaryDirectory() as directory:
+            manifest = write_faiss_artifact(self.vector_stores, directory)
 
-        key = f"compressed_faiss_indexes_{int(time.time())}.zlib"
+            # Save the index and docstore files to the R2 bucket, then the
+            # manifest, so a listed manifest always has its files
+            for file in artifact_files(manifest) + [MANIFEST]:
+                with open(os.path.join(directory, file), "rb") as f:
+                    self.upload_to_s3(f"{prefix}/{file}", f.read())
 
-        # Save the compressed data to the R2 bucket
-        self.upload_to_s3(key, compressed_data)
         # Save the object key to the database
-        await FaissIndex.create(objectKey=key)
+        await FaissIndex.create(objectKey=f"{prefix}/{MANIFEST}")
 
     @classmethod
     async def get_latest_managed_index(cls, index_type):
@@ -133,13 +293,14 @@ class IncrementalIndexerService:
             if questions_index is None:
                 return {}
 
-            # Load the index from the R2 bucket
-            object_key = questions_index.jsonObjectKey
-            data = cls.retrieve_object_from_s3(
-                object_key,
-            )
+            # Load the index from the R2 bucket: the keys and url table are in
+            # the JSON, the url ids of each key in the npz of the embeddings
+            json_data = cls.retrieve_object_from_s3(questions_index.jsonObjectKey)
+            npz_data = cls.retrieve_object_from_s3(questions_index.compressedObjectKey)
+            arrays = np.load(io.BytesIO(npz_data))
 
-            return json.loads(data)
+            # indexes saved as a {key: [url, ...]} JSON are converted as well
+            return ManagedIndexTable.from_bytes(json_data, arrays).to_dict()
 
         except DoesNotExist:
             return {}
@@ -216,14 +377,15 @@ class IncrementalIndexerService:
         - Loads existing question and keyword indexes files from the postgres database.
         - Loads all existing vector stores from the postgres database.
         - Updates the vector stores with new documents.
-        - If updates were made, saves all indexes, including vector stores, question index, and keyword index.
+        - If updates were made, saves all indexes, including vector stores, the BM25 lexical index, question index, and keyword index.
         - Marks the raw topics as embedded (updated) so we will update only when new topics exists.
 
         Args:
             model (str): The name of the language model to use. Defaults to "gpt-4o-mini".
 
         Returns:
-            None
+            The names of the vector stores that were updated and saved, so the
+            loaded retrievers can reload them; empty if nothing was saved.
 
         Note:
             This method sets the `should_save_update` flag to True if any updates are made to the indexes.
@@ -236,20 +398,23 @@ class IncrementalIndexerService:
             self.embeddings
         )
 
+        updated_stores = []
         for db_name, contexts in data.items():
             if "archived" in db_name:
                 continue
 
             index_updated = self.update_index(db_name, contexts)
             if index_updated:
+                updated_stores.append(db_name)
                 await self.parse_index(contexts, self.llm)
 
         if not self.should_save_update:
-            return
+            return []
 
         updated_documents_urls = self.get_updated_documents_urls(data)
         # Save updated indexes and set the raw topics as embedded
         await self.save_faiss_indexes()
+        await self.save_lexical_index()
         await self.save_managed_index(
             self.questions_index, "questions", updated_documents_urls
         )
@@ -257,3 +422,4 @@ class IncrementalIndexerService:
             self.keywords_index, "keywords", updated_documents_urls
         )
         await self.save_raw_topics_as_embedded(updated_documents_urls)
+        return updated_stores
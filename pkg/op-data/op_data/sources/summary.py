@@ -13,12 +13,11 @@ from op_data.db.models import RawTopic, RawTopicSummary
 class RawTopicSummaryService:
     @staticmethod
     async def get_topics_urls_to_summarize(out_of_date: bool = True) -> List[str]:
-        if out_of_date:
-            topics = await ForumPostsProcessingStrategy.get_threads_documents_not_summarized()
-        else:
-            topics = await ForumPostsProcessingStrategy.get_threads_documents()
-
-        return [topic.metadata["url"] for topic in topics if topic.metadata["url"]]
+        # only the urls are needed, the raw topics are neither loaded nor rendered
+        urls = await ForumPostsProcessingStrategy.filter_raw_topics(
+            only_not_summarized=out_of_date
+        ).values_list("url", flat=True)
+        return [url for url in urls if url]
 
     @staticmethod
     async def summarize_single_topic(
@@ -0,0 +1,31 @@
+import os
+
+from op_data.db.models import FaissIndex
+from op_data.sources import incremental_indexer
+from op_data.sources.incremental_indexer import IncrementalIndexerService
+
+
+async def test_superseded_artifacts_are_removed_after_loading(
+    db, tmp_path, monkeypatch
+):
+    # an older artifact, the latest one, one saved since and a download in progress
+    for name in ["faiss_indexes_100", "faiss_indexes_200", "faiss_indexes_300"]:
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "manifest.json").write_text("{}")
+    (tmp_path / "tmpdownload").mkdir()
+    await FaissIndex.create(objectKey="faiss_indexes_200/manifest.json")
+
+    def read_faiss_artifact(directory, embeddings, mmap=False, names=None):
+        return {"forum_thread_summary": os.path.basename(directory)}
+
+    monkeypatch.setattr(incremental_indexer, "FAISS_ARTIFACT_DIR", str(tmp_path))
+    monkeypatch.setattr(incremental_indexer, "read_faiss_artifact", read_faiss_artifact)
+
+    indexes = await IncrementalIndexerService.load_faiss_indexes(embeddings=None)
+
+    assert indexes == {"forum_thread_summary": "faiss_indexes_200"}
+    assert sorted(os.listdir(tmp_path)) == [
+        "faiss_indexes_200",
+        "faiss_indexes_300",
+        "tmpdownload",
+    ]
@@ -0,0 +1,78 @@
+import itertools
+import json
+
+import pytest
+
+from op_data.db.models import ManagedIndex
+from op_data.sources import incremental_indexer
+from op_data.sources.incremental_indexer import IncrementalIndexerService
+
+INDEX = {
+    "What is Season 6?": ["https://gov/t/1", "https://gov/t/2"],
+    "Who votes?": ["https://gov/t/3"],
+    "When does voting start?": ["https://gov/t/2"],
+}
+
+
+class Embeddings:
+    def embed_documents(self, texts):
+        return [[float(len(t)), 1.0] for t in texts]
+
+
+@pytest.fixture
+def service(db, monkeypatch):
+    bucket = {}
+    keys = itertools.count(1)
+
+    async def reorder_index(index, updated_urls=[]):
+        return index
+
+    monkeypatch.setattr(
+        IncrementalIndexerService,
+        "upload_to_s3",
+        classmethod(lambda cls, key, data: bucket.__setitem__(key, data)),
+    )
+    monkeypatch.setattr(
+        IncrementalIndexerService,
+        "retrieve_object_from_s3",
+        classmethod(lambda cls, key: bucket[key]),
+    )
+    monkeypatch.setattr(incremental_indexer, "reorder_index", reorder_index)
+    # object keys are named after the current second
+    monkeypatch.setattr(incremental_indexer.time, "time", lambda: next(keys))
+
+    service = IncrementalIndexerService()
+    service.embeddings = Embeddings()
+    return service
+
+
+async def test_managed_index_round_trip(service):
+    await service.save_managed_index(INDEX, "questions", [])
+    loaded = await IncrementalIndexerService.get_latest_managed_index("questions")
+    assert loaded == INDEX
+    assert list(loaded) == list(INDEX)
+
+    # updated the way acquire_and_save does, then saved again
+    loaded.setdefault("Who votes?", []).append("https://gov/t/4")
+    loaded["What is Season 7?"] = ["https://gov/t/5"]
+    await service.save_managed_index(loaded, "questions", [])
+
+    reloaded = await IncrementalIndexerService.get_latest_managed_index("questions")
+    assert reloaded == loaded
+    assert await IncrementalIndexerService.get_latest_managed_index("keywords") == {}
+
+
+async def test_legacy_managed_index_is_converted(service):
+    IncrementalIndexerService.upload_to_s3("legacy.json", json.dumps(INDEX))
+    IncrementalIndexerService.upload_to_s3(
+        "legacy.zlib", IncrementalIndexerService.encode_managed_index([[1.0, 0.0]])
+    )
+    await ManagedIndex.create(
+        jsonObjectKey="legacy.json",
+        compressedObjectKey="legacy.zlib",
+        indexType="questions",
+    )
+
+    assert await IncrementalIndexerService.get_latest_managed_index("questions") == (
+        INDEX
+    )
@@ -0,0 +1,30 @@
+import datetime as dt
+
+from op_data.db.models import RawTopic
+from op_data.sources.summary import RawTopicSummaryService
+
+UPDATED = dt.datetime(2024, 6, 1)
+
+
+async def create_topic(id: int, summarized: dt.datetime):
+    await RawTopic.create(
+        externalId=str(id),
+        url=f"https://gov/t/{id}",
+        type="thread",
+        rawData={},
+        lastUpdatedAt=UPDATED,
+        lastSummarizedAt=summarized,
+        lastEmbeddedAt=UPDATED,
+    )
+
+
+async def test_topics_urls_to_summarize(db):
+    await create_topic(1, UPDATED - dt.timedelta(days=1))
+    await create_topic(2, UPDATED + dt.timedelta(days=1))
+    await create_topic(3, UPDATED - dt.timedelta(days=2))
+
+    out_of_date = await RawTopicSummaryService.get_topics_urls_to_summarize()
+    urls = await RawTopicSummaryService.get_topics_urls_to_summarize(out_of_date=False)
+
+    assert sorted(out_of_date) == ["https://gov/t/1", "https://gov/t/3"]
+    assert sorted(urls) == ["https://gov/t/1", "https://gov/t/2", "https://gov/t/3"]